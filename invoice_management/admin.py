@@ -2,10 +2,27 @@ from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
 from .models import Company, UserProfile, Invoice
+from .sqlite import retry_on_lock
+
+
+class LockRetryAdminMixin:
+    """一覧の一括編集（list_editable）・追加・変更・削除をロックの競合時に再実行する"""
+
+    @retry_on_lock
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, extra_context)
+
+    @retry_on_lock
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        return super().changeform_view(request, object_id, form_url, extra_context)
+
+    @retry_on_lock
+    def delete_view(self, request, object_id, extra_context=None):
+        return super().delete_view(request, object_id, extra_context)
 
 
 @admin.register(Company)
-class CompanyAdmin(admin.ModelAdmin):
+class CompanyAdmin(LockRetryAdminMixin, admin.ModelAdmin):
     list_display = ['code', 'name', 'invoice_number', 'contact_person', 'phone', 'created_at']
     list_filter = ['created_at']
     search_fields = ['name', 'code', 'invoice_number', 'contact_person']
@@ -29,7 +46,7 @@ admin.site.register(User, CustomUserAdmin)
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(LockRetryAdminMixin, admin.ModelAdmin):
     list_display = [
         'auto_number', 'invoice_number', 'company', 'total_amount', 'invoice_date', 
         'due_date', 'payment_status', 'registered_by', 'created_at'
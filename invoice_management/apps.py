@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class InvoiceManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoice_management'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from . import signals  # noqa: F401
+        from .middleware import install_query_timer
+        from .sqlite import apply_pragmas
+        connection_created.connect(apply_pragmas, dispatch_uid='invoice_management_sqlite_pragmas')
+        connection_created.connect(install_query_timer, dispatch_uid='invoice_management_query_timer')
@@ -0,0 +1,136 @@
+"""ダッシュボード・レポート画面の非同期版（ASGIサーバーで動かす）
+
+同期版（views.py）と同じテンプレート・キャッシュを使い、互いに依存しない集計
+（全体の統計、会社別・月別の集計、表示する請求書）を gather_queries で同時に実行する。
+条件付きGETと reports データベースへの振り分けも同期版と同じデコレーターで行う。
+テンプレートの描画はコンテキストプロセッサーがユーザー・セッションを読み込むため、同期処理として実行する。
+
+月別レポート（monthly_report）は1回のGROUP BYで集計するため、非同期版はない。
+"""
+from datetime import datetime
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from .cache import acached_report
+from .concurrency import gather_queries
+from .conditional import conditional_page
+from .models import Company, InvoiceMonthlyRollup
+from .reports import (
+    achart_data, acompany_yearly_stats, amonthly_detail_stats, ayearly_analytics,
+    invoice_summary, normalize_tax_mode,
+)
+from .routers import use_reports_database
+from .views import (
+    analytics_context, chart_data_params, chart_data_slices, company_detail_context,
+    company_detail_invoices, company_detail_slices, dashboard_context, monthly_detail_context,
+    monthly_detail_invoices, monthly_detail_slices, recent_invoice_list, report_month, report_year,
+    yearly_report_slices,
+)
+
+
+arender = sync_to_async(render)
+
+
+async def alist(queryset):
+    """非同期ORMでクエリセットを読み込む"""
+    return [obj async for obj in queryset]
+
+
+async def dashboard(request):
+    """ダッシュボード"""
+    user = await request.auser()
+    if user.is_authenticated:
+        # 全体・未払いの集計と最近の請求書を同時に取得する
+        summary, pending_summary, recent_invoices = await gather_queries(
+            lambda: invoice_summary(InvoiceMonthlyRollup.objects.all()),
+            lambda: invoice_summary(InvoiceMonthlyRollup.objects.filter(payment_status='pending')),
+            alist(recent_invoice_list()),
+        )
+        context = dashboard_context(summary, pending_summary, recent_invoices)
+    else:
+        context = {}
+
+    return await arender(request, 'invoice_management/dashboard.html', context)
+
+
+@login_required
+@use_reports_database
+@conditional_page(yearly_report_slices)
+async def analytics_report(request):
+    """分析レポート"""
+    selected_year = report_year(request)
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))
+
+    analytics = await acached_report(
+        'analytics_report', {'year': selected_year, 'tax_mode': tax_mode},
+        lambda: ayearly_analytics(selected_year, tax_mode),
+    )
+    context = analytics_context(selected_year, tax_mode, analytics)
+
+    return await arender(request, 'invoice_management/analytics_report.html', context)
+
+
+@login_required
+@use_reports_database
+@conditional_page(monthly_detail_slices)
+async def monthly_detail_report(request):
+    """月別詳細レポート"""
+    current_date = datetime.now()
+    selected_year = report_year(request)
+    selected_month = report_month(request, current_date.month)
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))
+
+    # 表示する請求書と統計情報を同時に取得する
+    invoices, stats = await gather_queries(
+        lambda: list(monthly_detail_invoices(selected_year, selected_month)),
+        acached_report(
+            'monthly_detail_report',
+            {'year': selected_year, 'month': selected_month},
+            lambda: amonthly_detail_stats(selected_year, selected_month),
+        ),
+    )
+    context = monthly_detail_context(selected_year, selected_month, tax_mode, invoices, stats)
+
+    return await arender(request, 'invoice_management/monthly_detail_report.html', context)
+
+
+@login_required
+@use_reports_database
+@conditional_page(company_detail_slices)
+async def company_detail_report(request):
+    """会社別詳細レポート"""
+    company_id = request.GET.get('company')
+    selected_year = report_year(request)
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))
+
+    if company_id:
+        company = await aget_object_or_404(Company, pk=company_id)
+        # 表示する請求書と月別データ・統計情報を同時に取得する
+        invoices, stats = await gather_queries(
+            lambda: list(company_detail_invoices(selected_year, company)),
+            acached_report(
+                'company_detail_report', {'year': selected_year, 'company': company.pk},
+                lambda: acompany_yearly_stats(selected_year, company.pk),
+            ),
+        )
+    else:
+        company, invoices, stats = None, [], None
+    context = company_detail_context(selected_year, tax_mode, company, invoices, stats)
+
+    return await arender(request, 'invoice_management/company_detail_report.html', context)
+
+
+@login_required
+@use_reports_database
+@conditional_page(chart_data_slices)
+async def report_chart_data(request):
+    """レポートのグラフ用データ（JSON）"""
+    selected_year, selected_month, company_id = chart_data_params(request)
+
+    data = await acached_report(
+        'chart_data',
+        {'year': selected_year, 'month': selected_month, 'company': company_id},
+        lambda: achart_data(selected_year, selected_month, company_id),
+    )
+    return JsonResponse(data)
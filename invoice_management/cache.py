@@ -0,0 +1,48 @@
+"""レポート集計結果のキャッシュ
+
+キャッシュキーにはレポート名・パラメータに加えてデータバージョン（DataVersion）を含める。
+請求書・取引先会社が更新されるとバージョンが進むため、古い集計結果が使われることはない。
+集計結果はユーザーに依存しないので、全ユーザーで共有する。
+"""
+import hashlib
+from urllib.parse import urlencode
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from .models import DataVersion
+
+
+REPORT_CACHE_TIMEOUT = getattr(settings, 'REPORT_CACHE_TIMEOUT', 60 * 60)
+# ユーザー一覧の件数。User の update() ではデータバージョンが進まないため短くする
+USER_COUNT_CACHE_TIMEOUT = getattr(settings, 'USER_COUNT_CACHE_TIMEOUT', 5 * 60)
+
+
+def report_cache_key(name, params, version):
+    query = urlencode(sorted((key, str(value)) for key, value in params.items()))
+    digest = hashlib.md5(query.encode(), usedforsecurity=False).hexdigest()
+    return f'report:{name}:{version}:{digest}'
+
+
+def cached_report(name, params, compute, data_version=DataVersion.REPORTS, timeout=None):
+    """params で決まる集計結果をキャッシュから返す（なければ compute() で作成）
+
+    data_version には結果が依存するデータのバージョン名を指定する。
+    timeout はキャッシュの有効期間（秒、省略時は REPORT_CACHE_TIMEOUT）。
+    """
+    key = report_cache_key(name, params, DataVersion.current(data_version))
+    result = cache.get(key)
+    if result is None:
+        result = compute()
+        cache.set(key, result, REPORT_CACHE_TIMEOUT if timeout is None else timeout)
+    return result
+
+
+async def acached_report(name, params, compute, data_version=DataVersion.REPORTS):
+    """cached_report の非同期版（compute() はコルーチンを返す。キャッシュは同期版と共有する）"""
+    version = await sync_to_async(DataVersion.current)(data_version)
+    key = report_cache_key(name, params, version)
+    result = await cache.aget(key)
+    if result is None:
+        result = await compute()
+        await cache.aset(key, result, REPORT_CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,128 @@
+"""取引先会社の検索（オートコンプリート）と一覧のプロセス内キャッシュ
+
+フォームや絞り込みに全社を埋め込まず、入力に応じて少しずつ取得する。
+IDから会社コード・会社名を引く処理は company_directory を使い、通常はSQLを発行しない。
+"""
+import threading
+import time
+from typing import NamedTuple
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+from .models import Company, DataVersion, data_version_bumped
+
+
+AUTOCOMPLETE_LIMIT = 20
+AUTOCOMPLETE_MAX_LIMIT = 50
+
+# 前方一致の上限（どの文字よりも後ろに並ぶ）
+_PREFIX_END = '\U0010ffff'
+
+
+def prefix_q(field, prefix):
+    """前方一致の条件
+
+    SQLiteの LIKE は大文字・小文字を区別しないためインデックスを使えない。
+    範囲条件（>= prefix AND < prefix + U+10FFFF）にしてインデックスを使う。
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix + _PREFIX_END})
+
+
+def search_companies(query, limit=AUTOCOMPLETE_LIMIT):
+    """会社コード・会社名・インボイス番号（T番号）で取引先会社を検索する
+
+    前方一致で探し、limit 件に満たないときは会社名の部分一致で補う
+    （会社名は「株式会社」などで始まることが多いため）。
+    空の場合はコードの新しい順に返す。(結果のリスト, 続きがあるか) を返す。
+    """
+    query = query.strip()
+    companies = Company.objects.values('id', 'code', 'name', 'invoice_number').order_by('-code')
+    if not query:
+        rows = list(companies[:limit + 1])
+        return rows[:limit], len(rows) > limit
+
+    # 会社コード・T番号は小文字で入力されても探せるようにする
+    condition = Q()
+    for prefix in {query, query.upper()}:
+        condition |= prefix_q('code', prefix) | prefix_q('name', prefix) | prefix_q('invoice_number', prefix)
+    rows = list(companies.filter(condition)[:limit + 1])
+
+    if len(rows) <= limit and len(query) >= 2:
+        found = [row['id'] for row in rows]
+        rows += companies.filter(name__icontains=query).exclude(id__in=found)[:limit + 1 - len(rows)]
+    return rows[:limit], len(rows) > limit
+
+
+class CompanyEntry(NamedTuple):
+    """取引先会社の一覧の1件"""
+    id: int
+    code: str
+    name: str
+    invoice_number: str
+
+    @property
+    def pk(self):
+        return self.id
+
+    def as_company(self):
+        """この値を読み込んだ Company を返す（それ以外のフィールドはアクセス時に読み込む）"""
+        return Company.from_db(Company.objects.db, CompanyEntry._fields, list(self))
+
+    def __str__(self):
+        return f"{self.code} - {self.name}"
+
+
+class CompanyDirectory:
+    """取引先会社の一覧（id, code, name, invoice_number）のプロセス内キャッシュ
+
+    DataVersion（companies）を recheck_seconds ごとに確認し、変わっていたときだけ読み直す。
+    同じプロセスで会社を更新したときは data_version_bumped シグナルですぐに確認し直す。
+    他のプロセスでの更新は最大 recheck_seconds 遅れて反映されるが、
+    get() で見つからないIDはその場で確認し直すため、追加直後の会社も選択できる。
+    """
+
+    def __init__(self, recheck_seconds):
+        self.recheck_seconds = recheck_seconds
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = None
+        self._by_id = {}
+
+    def invalidate(self, **kwargs):
+        """次の参照時にバージョンを確認させる（シグナルの受信にも使う）"""
+        self._checked_at = None
+
+    def _entries(self):
+        checked_at = self._checked_at
+        if checked_at is not None and time.monotonic() - checked_at < self.recheck_seconds:
+            return self._by_id
+        with self._lock:
+            if self._checked_at is None or time.monotonic() - self._checked_at >= self.recheck_seconds:
+                # 先にバージョンを読むことで、読み込み中の更新は次回の確認で拾う
+                # （レポート用データベースのコピーで古い一覧に戻らないよう、常に default から読む）
+                version = DataVersion.current(DataVersion.COMPANIES, using=DEFAULT_DB_ALIAS)
+                if version != self._version:
+                    rows = Company.objects.using(DEFAULT_DB_ALIAS).values_list(*CompanyEntry._fields)
+                    self._by_id = {row[0]: CompanyEntry(*row) for row in rows}
+                    self._version = version
+                self._checked_at = time.monotonic()
+        return self._by_id
+
+    def get(self, pk):
+        """IDで会社を引く（見つからなければ None）"""
+        try:
+            pk = int(pk)
+        except (TypeError, ValueError):
+            return None
+        entry = self._entries().get(pk)
+        if entry is None:
+            self.invalidate()
+            entry = self._entries().get(pk)
+        return entry
+
+    def all(self):
+        return list(self._entries().values())
+
+
+company_directory = CompanyDirectory(getattr(settings, 'COMPANY_DIRECTORY_RECHECK_SECONDS', 5))
+data_version_bumped.connect(company_directory.invalidate, dispatch_uid='company_directory_invalidate')
@@ -0,0 +1,49 @@
+"""非同期ビューから互いに依存しない集計クエリを同時に実行する
+
+Django の非同期ORM（aaggregate・async for など）は、1リクエストの中では同じスレッドで
+1件ずつ実行される（sync_to_async(thread_sensitive=True)）。gather_queries は集計関数を
+スレッドプールの別々のスレッド（スレッドごとに別の接続）で同時に実行する。
+SQLiteはWALモードなら複数の接続から同時に読み込め、sqlite3 モジュールはクエリの実行中にGILを解放する。
+
+スレッドプールの接続はリクエストの終了時に閉じられないため、実行の前後に
+close_old_connections() で CONN_MAX_AGE の経過とエラーを確認する。
+"""
+import asyncio
+import inspect
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from .routers import reading_reports, replica_lag
+
+
+def _in_worker(func):
+    def run():
+        close_old_connections()
+        if reading_reports.get():
+            # 置き換えられたスナップショットを開いたままの接続を閉じる
+            replica_lag()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def _skipped():
+    return None
+
+
+def _awaitable(query):
+    if query is None:
+        return _skipped()
+    if inspect.isawaitable(query):
+        return query
+    return sync_to_async(_in_worker(query), thread_sensitive=False)()
+
+
+async def gather_queries(*queries):
+    """集計を同時に実行し、結果を引数の順のリストで返す
+
+    queries には引数なしの関数（別スレッドで実行する）か、非同期ORMのコルーチンを渡す。
+    None を渡した位置の結果は None になる（条件によって不要な集計に使う）。
+    """
+    return await asyncio.gather(*(_awaitable(query) for query in queries))
@@ -0,0 +1,126 @@
+"""条件付きGET（ETag / Last-Modified）
+
+一覧・レポート画面は、表示する範囲の請求書・取引先会社の最終更新日時（max(updated_at)）と件数、
+またはデータバージョン、GETパラメータ、閲覧ユーザーから検証子を作る。ブラウザが送ってきた
+検証子と一致すれば集計もテンプレートの描画もせずに 304 Not Modified を返す。
+
+- 最終更新日時と件数はインデックスで範囲を絞れる表示範囲にだけ使う。
+  範囲を絞れない一覧・検索結果は、集計が表の大きさに比例するため、代わりにデータバージョン
+  （DataVersion.REPORTS など）を使う。ページ位置（カーソル）と検索条件はGETパラメータで区別する。
+- レポートは請求書ではなく月次集計から作るため、集計の修復でも進む DataVersion.REPORTS を使う。
+
+- 削除は件数の変化で、一括更新（QuerySet.update）は updated_at の更新で検出する
+  （VersionedQuerySet.update が updated_at も更新する）。
+- 削除では最終更新日時が変わらないため、If-Modified-Since だけのリクエストには 304 を返さない。
+  Last-Modified ヘッダーは参考として付けるだけで、判定には ETag を使う。
+- 画面はユーザーごとに異なる（ヘッダーのユーザー名・ログアウト用のCSRFトークン）ため、
+  検証子にはユーザーとCSRFトークンの元になる値を含め、Cache-Control は private にする。
+- 非同期ビューでは、表示範囲ごとの集計を gather_queries で同時に実行する。
+
+設定（settings.py、省略可）:
+    CONDITIONAL_GET_VERSION  検証子に含める文字列。テンプレートを変更してデプロイしたら変える
+"""
+import hashlib
+from functools import partial, wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.middleware.csrf import get_token
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from .concurrency import gather_queries
+from .models import DataVersion
+
+
+def slice_state(queryset):
+    """表示範囲の (最終更新日時, 件数) を1クエリで求める
+
+    データバージョンの名前（DataVersion.REPORTS など）を渡すと (None, バージョン) を返す。
+    """
+    if isinstance(queryset, str):
+        return None, DataVersion.current(queryset)
+    state = queryset.order_by().aggregate(updated=Max('updated_at'), count=Count('pk'))
+    return state['updated'], state['count']
+
+
+def page_validators(request, querysets):
+    """表示範囲のクエリセットから (ETag, 最終更新日時) を作る"""
+    return validators_from_states(request, [slice_state(queryset) for queryset in querysets])
+
+
+def validators_from_states(request, states):
+    """slice_state() の結果のリストから (ETag, 最終更新日時) を作る"""
+    updated = [last for last, _count in states if last is not None]
+    last_modified = max(updated) if updated else None
+
+    # 初回アクセスでもCSRFトークンの元になる値を確定させてから検証子に含める
+    get_token(request)
+    user = request.user
+    parts = [
+        getattr(settings, 'CONDITIONAL_GET_VERSION', ''),
+        request.path,
+        sorted(request.GET.lists()),
+        (user.pk, user.get_username(), user.is_staff, user.is_superuser),
+        request.META.get('CSRF_COOKIE', ''),
+        [(last.isoformat() if last else '', count) for last, count in states],
+    ]
+    digest = hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"', last_modified
+
+
+def has_messages(request):
+    return len(get_messages(request)) > 0
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # 毎回サーバーに確認させ、共有キャッシュには保存させない
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional_page(get_querysets):
+    """表示範囲が変わっていなければ 304 Not Modified を返すビューデコレーター
+
+    get_querysets(request, *args, **kwargs) は、画面に表示する範囲のクエリセット
+    （またはデータバージョンの名前）のリストを返す。
+    非同期ビューにも付けられる。
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # セッション・ユーザーの読み込みはデータベースを使うため同期処理として実行する
+                if request.method not in ('GET', 'HEAD') or await sync_to_async(has_messages)(request):
+                    return await view(request, *args, **kwargs)
+
+                querysets = get_querysets(request, *args, **kwargs)
+                states = await gather_queries(*(partial(slice_state, queryset) for queryset in querysets))
+                etag, last_modified = await sync_to_async(validators_from_states)(request, states)
+                response = get_conditional_response(request, etag=etag)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                    if response.status_code != 200:
+                        return response
+                return add_validators(response, etag, last_modified)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # 表示待ちのメッセージがある場合は必ず描画する
+            if request.method not in ('GET', 'HEAD') or has_messages(request):
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = page_validators(request, get_querysets(request, *args, **kwargs))
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            return add_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,70 @@
+"""円金額のフィールド
+
+日本円には補助単位がないため、金額は整数（円）で保存する。
+DecimalField と比べて、SQLiteでは整数のまま保存・集計され、
+読み込み時の Decimal への変換もなくなる。
+"""
+import unicodedata
+from decimal import Decimal, InvalidOperation
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+
+
+def normalize_yen_text(value):
+    """入力された金額の文字列から全角の数字・記号を半角にし、円記号と3桁区切りのカンマを除く"""
+    value = unicodedata.normalize('NFKC', value)
+    return value.replace(',', '').replace('¥', '').strip()
+
+
+def parse_yen(value):
+    """文字列・Decimal の金額を円（整数）に変換する（円記号・3桁区切りのカンマ・全角数字と「.00」は許容）
+
+    円未満の端数があるもの、数値でないものは ValueError。
+    """
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = normalize_yen_text(value)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f'金額ではありません: {value!r}')
+    if not amount.is_finite() or amount != amount.to_integral_value():
+        raise ValueError(f'円未満の端数は扱えません: {value!r}')
+    return int(amount)
+
+
+class YenFormField(forms.IntegerField):
+    """円金額の入力欄（「¥1,000」のような円記号・3桁区切り、全角数字も受け付ける）"""
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            value = normalize_yen_text(value)
+        return super().to_python(value)
+
+
+class YenField(models.BigIntegerField):
+    """円金額（整数）のモデルフィールド
+
+    これまでの Decimal の値を代入しても保存でき、端数がある場合はエラーにする。
+    """
+    description = '円金額'
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        try:
+            return parse_yen(value)
+        except ValueError:
+            raise ValidationError(
+                self.error_messages['invalid'], code='invalid', params={'value': value}
+            )
+
+    def get_prep_value(self, value):
+        if isinstance(value, (str, Decimal, float)):
+            value = parse_yen(value)
+        return super().get_prep_value(value)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': YenFormField, **kwargs})
@@ -1,7 +1,23 @@
 from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
-from .models import Company, UserProfile, Invoice
+from .companies import company_directory
+from .jobs import REPORT_JOB_MAX_YEARS
+from .models import Company, UserProfile, Invoice, ReportJob
+
+
+class CompanyChoiceField(forms.ModelChoiceField):
+    """取引先会社の選択欄（入力値の確認に company_directory を使い、SQLを発行しない）"""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, Company):
+            return value
+        entry = company_directory.get(value)
+        if entry is None:
+            raise forms.ValidationError(self.error_messages['invalid_choice'], code='invalid_choice')
+        return entry.as_company()
 
 
 class CompanyForm(forms.ModelForm):
@@ -154,15 +170,14 @@ class InvoiceForm(forms.ModelForm):
             'invoice_number', 'company', 'amount', 'tax_amount', 
             'invoice_date', 'due_date', 'payment_status', 'description'
         ]
+        field_classes = {'company': CompanyChoiceField}
         widgets = {
             'invoice_number': forms.TextInput(attrs={
                 'class': 'form-control', 
                 'placeholder': '請求書番号を入力（任意）'
             }),
-            'company': forms.Select(attrs={
-                'class': 'form-control',
-                'id': 'company-select'
-            }),
+            # 取引先会社はオートコンプリートで選ぶ（全社を選択肢として描画しない）
+            'company': forms.HiddenInput(),
             'amount': forms.NumberInput(attrs={
                 'class': 'form-control', 
                 'placeholder': '請求金額を入力',
@@ -191,13 +206,43 @@ class InvoiceForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        # 会社をコード順（新しい順）で表示し、選択肢をより見やすくする
-        self.fields['company'].queryset = Company.objects.all().order_by('-code')
         self.fields['company'].empty_label = "取引先会社を選択してください"
 
+    def selected_company(self):
+        """選択中の取引先会社（オートコンプリートの初期表示用）"""
+        value = self['company'].value()
+        if isinstance(value, Company):
+            return value
+        if not value:
+            return None
+        return company_directory.get(value)
+
     def clean_company(self):
         """companyフィールドのカスタムバリデーション"""
         company = self.cleaned_data.get('company')
         if not company:
             raise forms.ValidationError('取引先会社を選択してください。')
         return company
+
+
+class ReportJobForm(forms.Form):
+    """レポートジョブ登録フォーム（レポート画面から送信する）"""
+    kind = forms.ChoiceField(choices=ReportJob.KIND_CHOICES, widget=forms.HiddenInput)
+    from_year = forms.IntegerField(min_value=1900, max_value=9999, label='開始年',
+                                   widget=forms.NumberInput(attrs={'class': 'form-control'}))
+    to_year = forms.IntegerField(min_value=1900, max_value=9999, label='終了年',
+                                 widget=forms.NumberInput(attrs={'class': 'form-control'}))
+
+    def clean(self):
+        cleaned_data = super().clean()
+        from_year = cleaned_data.get('from_year')
+        to_year = cleaned_data.get('to_year')
+        if from_year and to_year:
+            if from_year > to_year:
+                raise forms.ValidationError('開始年は終了年以前にしてください。')
+            if to_year - from_year + 1 > REPORT_JOB_MAX_YEARS:
+                raise forms.ValidationError(f'集計できるのは{REPORT_JOB_MAX_YEARS}年分までです。')
+        return cleaned_data
+
+    def job_params(self):
+        return {'from_year': self.cleaned_data['from_year'], 'to_year': self.cleaned_data['to_year']}
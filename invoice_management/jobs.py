@@ -0,0 +1,109 @@
+"""バックグラウンドのレポート集計ジョブ
+
+複数年・全社にわたる集計は、レポート画面から ReportJob として登録し、
+run_report_worker コマンドのワーカープロセスで実行する（Redisなどの外部サービスは使わない）。
+
+- ジョブの待ち行列は ReportJob テーブル。ワーカーは状態を条件にした UPDATE でジョブを取り出す。
+- 集計は1年ずつ行い、年ごとに進捗を書き込む。画面は進捗用のURL（report_job_progress）を定期的に取得する。
+- 結果はgzip圧縮したJSONで保存し、ダウンロードと画面での再表示に使う。
+- 集計は reports データベースから読み込む（遅延が許容範囲を超えていれば default）。
+
+設定（settings.py、いずれも省略可）:
+    REPORT_JOB_MAX_YEARS       1ジョブで集計できる年数（既定 20）
+    REPORT_JOB_RETENTION_DAYS  終了したジョブを残す日数（既定 7）
+"""
+import logging
+from django.conf import settings
+from .models import DataVersion
+from .reports import TAX_MODES, company_month_matrix, company_totals, invoice_summary, period_rollups
+from .routers import reading_reports, reports_database_usable
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_JOB_MAX_YEARS = getattr(settings, 'REPORT_JOB_MAX_YEARS', 20)
+REPORT_JOB_RETENTION_DAYS = getattr(settings, 'REPORT_JOB_RETENTION_DAYS', 7)
+
+
+def job_years(params):
+    return range(params['from_year'], params['to_year'] + 1)
+
+
+def company_month_matrix_job(params, progress):
+    """会社×月の請求金額（複数年）
+
+    {'years': [年], 'companies': {会社ID: {'name', 'including': {'YYYY-MM': 金額}, 'excluding': {...}}}}
+    """
+    years = job_years(params)
+    companies = {}
+    for index, year in enumerate(years, 1):
+        for company_id, entry in company_month_matrix(year).items():
+            row = companies.setdefault(str(company_id), {
+                'name': entry['company']['name'],
+                'including': {},
+                'excluding': {},
+            })
+            for tax_mode in TAX_MODES:
+                for month, amount in entry[tax_mode].items():
+                    row[tax_mode][f'{year}-{month:02d}'] = amount
+        progress(index, len(years), f'{year}年を集計しました')
+    return {'years': list(years), 'companies': companies}
+
+
+def yearly_summary_job(params, progress, top_n=10):
+    """年別の請求件数・金額・支払状況別件数と上位の取引先
+
+    {'years': [{'year', 'count', 'including', 'excluding', 'status_stats', 'top_companies'}]}
+    """
+    years = job_years(params)
+    rows = []
+    for index, year in enumerate(years, 1):
+        rollups = period_rollups(year)
+        rows.append({
+            'year': year,
+            **invoice_summary(rollups),
+            'top_companies': company_totals(rollups, 'including', top_n),
+        })
+        progress(index, len(years), f'{year}年を集計しました')
+    return {'years': rows}
+
+
+# ReportJob.kind ごとの集計関数 (params, progress) -> JSONにできる結果
+REPORT_JOBS = {
+    'company_month_matrix': company_month_matrix_job,
+    'yearly_summary': yearly_summary_job,
+}
+
+
+def run_job(job):
+    """ジョブを実行して結果を保存する。集計中の例外はジョブの失敗として記録し、False を返す"""
+    def progress(done, total, message=''):
+        job.report_progress(done * 100 // total, message)
+
+    token = reading_reports.set(reports_database_usable())
+    try:
+        job.data_version = DataVersion.current()
+        result = REPORT_JOBS[job.kind](job.params, progress)
+        # 結果の保存（圧縮・書き込み）で失敗した場合も、実行中のまま残さず失敗として記録する
+        job.finish(result)
+    except Exception as e:
+        logger.exception('report job %s failed', job.pk)
+        job.fail(f'{type(e).__name__}: {e}')
+        return False
+    finally:
+        reading_reports.reset(token)
+    return True
+
+
+def company_year_table(data, tax_mode):
+    """company_month_matrix の結果を会社×年の合計表にする（合計金額順）"""
+    years = data['years']
+    rows = []
+    for company in data['companies'].values():
+        totals = dict.fromkeys(years, 0)
+        for period, amount in company[tax_mode].items():
+            totals[int(period[:4])] += amount
+        rows.append({'name': company['name'], 'years': totals, 'total': sum(totals.values())})
+    rows.sort(key=lambda row: (-row['total'], row['name']))
+    year_totals = {year: sum(row['years'][year] for row in rows) for year in years}
+    return rows, year_totals
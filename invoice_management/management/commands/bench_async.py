@@ -0,0 +1,205 @@
+import asyncio
+import time
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from invoice_management.models import Invoice
+
+
+class Command(BaseCommand):
+    help = (
+        'ダッシュボード・レポート画面の同期版と非同期版（async_views）に多数のクライアントから同時にリクエストし、'
+        'ASGIでの処理件数・応答時間を比較します。'
+        '--url を省略するとこのプロセス内でASGIアプリケーションを直接呼び出します'
+    )
+
+    def add_arguments(self, parser):
+        today = date.today()
+        parser.add_argument('--year', type=int, default=today.year, help='対象年')
+        parser.add_argument('--month', type=int, default=today.month, help='対象月')
+        parser.add_argument('--clients', type=int, default=50, help='同時に接続するクライアント数')
+        parser.add_argument('--requests', type=int, default=10, help='1クライアントあたりのリクエスト数')
+        parser.add_argument('--username', help='画面を表示するユーザー（省略時は最初のスーパーユーザー）')
+        parser.add_argument('--only', help='対象画面をカンマ区切りで指定（例: dashboard,analytics_report）')
+        parser.add_argument(
+            '--url',
+            help='起動済みのASGIサーバーのURL（例: http://127.0.0.1:8000 。uvicorn myproject.asgi:application などで起動する）',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='レポート集計のキャッシュを使わずに計測します（このプロセス内で実行する場合のみ）',
+        )
+
+    def handle(self, *args, **options):
+        if options['clients'] < 1 or options['requests'] < 1:
+            raise CommandError('--clients と --requests は1以上を指定してください。')
+        if options['cold'] and options['url']:
+            raise CommandError('--cold は --url と同時に指定できません。')
+
+        users = User.objects.all()
+        user = users.filter(username=options['username']).first() if options['username'] else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('画面を表示するユーザーが見つかりません。--username を指定してください。')
+        # セッションを作成し、全クライアントで同じセッションクッキーを使う
+        client = Client()
+        client.force_login(user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+        if options['url']:
+            base = urlsplit(options['url'])
+            if base.scheme != 'http' or not base.hostname:
+                raise CommandError('--url には http:// で始まるURLを指定してください。')
+            self.server = (base.hostname, base.port or 80)
+            self.get = self.http_get
+        else:
+            # 同時に多数のリクエストを処理すると全件が遅いリクエストとしてログに出るため、閾値を無効にする
+            with override_settings(PERFORMANCE_SLOW_REQUEST_MS=float('inf')):
+                self.application = get_asgi_application()
+            self.get = self.asgi_get
+
+        only = set(options['only'].split(',')) if options['only'] else None
+        cases = [
+            case for case in self.build_cases(options['year'], options['month'])
+            if only is None or case[0] in only
+        ]
+
+        try:
+            if options['cold']:
+                with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+                    self.run_cases(cases, options)
+            else:
+                self.run_cases(cases, options)
+        finally:
+            client.logout()
+
+    def build_cases(self, year, month):
+        """計測する画面とパラメータの組み合わせ（同期版のURL名。非同期版は _async を付けた名前）"""
+        top_company = (
+            Invoice.objects.values('company_id').annotate(count=Count('id'))
+            .order_by('-count').values_list('company_id', flat=True).first()
+        )
+        cases = [
+            ('dashboard', {}),
+            ('analytics_report', {'year': year}),
+            ('monthly_detail_report', {'year': year, 'month': month}),
+            ('report_chart_data', {'year': year}),
+        ]
+        if top_company:
+            cases.append(('company_detail_report', {'year': year, 'company': top_company}))
+        return cases
+
+    def run_cases(self, cases, options):
+        sync_totals = async_totals = 0
+        for url_name, params in cases:
+            results = {}
+            for variant, name in (('sync', url_name), ('async', url_name + '_async')):
+                path = reverse(name)
+                query = urlencode(params)
+                results[variant] = asyncio.run(self.measure(path, query, options['clients'], options['requests']))
+                self.report(f'{variant:<5} {url_name}?{query}', results[variant])
+            ratio = results['async']['throughput'] / results['sync']['throughput']
+            self.stdout.write(f'{"":<5} {url_name} async/sync = x{ratio:.2f}')
+            sync_totals += results['sync']['throughput']
+            async_totals += results['async']['throughput']
+        if sync_totals:
+            self.stdout.write(self.style.SUCCESS(f'処理件数の合計 async/sync = x{async_totals / sync_totals:.2f}'))
+
+    async def measure(self, path, query, clients, requests):
+        # 空実行（テンプレートの読み込み・接続の作成）
+        status = await self.get(path, query)
+        if status != 200:
+            raise CommandError(f'{path} がステータス {status} を返しました。')
+
+        latencies = []
+
+        async def client():
+            for _ in range(requests):
+                start = time.perf_counter()
+                status = await self.get(path, query)
+                if status != 200:
+                    raise CommandError(f'{path} がステータス {status} を返しました。')
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+        return {
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': self.percentile(latencies, 50),
+            'p99_ms': self.percentile(latencies, 99),
+        }
+
+    async def asgi_get(self, path, query):
+        """ASGIアプリケーションを直接呼び出してGETリクエストを処理させ、ステータスを返す"""
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost'), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        request_sent = False
+        response = {}
+
+        async def receive():
+            nonlocal request_sent
+            if not request_sent:
+                request_sent = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # 切断を待つ処理には、応答が終わるまで何も返さない
+            await asyncio.Future()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+
+        await self.application(scope, receive, send)
+        return response.get('status')
+
+    async def http_get(self, path, query):
+        """起動済みのASGIサーバーにGETリクエストを送り、ステータスを返す（1リクエストごとに接続する）"""
+        host, port = self.server
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write((
+                f'GET {path}?{query} HTTP/1.1\r\n'
+                f'Host: {host}:{port}\r\n'
+                f'Cookie: {self.cookie}\r\n'
+                'Connection: close\r\n\r\n'
+            ).encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+        try:
+            return int(status_line.split()[1])
+        except (IndexError, ValueError):
+            raise CommandError(f'{path} の応答を読み込めません: {status_line!r}')
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<70} {result["throughput"]:8.1f}件/秒 '
+            f'p50={result["p50_ms"]:8.1f}ms p99={result["p99_ms"]:8.1f}ms'
+        )
+
+    def percentile(self, values, percent):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
@@ -0,0 +1,178 @@
+import json
+import statistics
+import time
+import tracemalloc
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from invoice_management.models import Invoice
+from invoice_management.routers import capture_queries
+
+
+class Command(BaseCommand):
+    help = '主要画面の応答時間・SQL件数・SQL時間・ピークメモリを計測し、JSONで出力します'
+
+    def add_arguments(self, parser):
+        today = date.today()
+        parser.add_argument('--year', type=int, default=today.year, help='対象年')
+        parser.add_argument('--month', type=int, default=today.month, help='対象月')
+        parser.add_argument('--repeat', type=int, default=10, help='1ケースあたりの計測回数')
+        parser.add_argument('--warmup', type=int, default=1, help='計測前の空実行回数')
+        parser.add_argument('--username', help='画面を表示するユーザー（省略時は最初のスーパーユーザー）')
+        parser.add_argument('--only', help='対象画面をカンマ区切りで指定（例: invoice_list,monthly_report）')
+        parser.add_argument('--output', help='結果JSONの出力先（省略時は標準出力に表示のみ）')
+        parser.add_argument('--baseline', help='比較対象の結果JSON')
+        parser.add_argument(
+            '--max-regression',
+            type=float,
+            default=1.25,
+            help='ベースラインに対して許容するp50の倍率（超えたらエラー終了）',
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat は1以上を指定してください。')
+
+        users = User.objects.all()
+        user = users.filter(username=options['username']).first() if options['username'] else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('画面を表示するユーザーが見つかりません。--username を指定してください。')
+        self.client = Client()
+        self.client.force_login(user)
+
+        only = set(options['only'].split(',')) if options['only'] else None
+        cases = [
+            case for case in self.build_cases(options['year'], options['month'])
+            if only is None or case[0] in only
+        ]
+
+        results = {}
+        for url_name, params in cases:
+            name = self.case_name(url_name, params)
+            result = self.measure(url_name, params, options['repeat'], options['warmup'])
+            results[name] = result
+            self.stdout.write(
+                f'{name:<70} p50={result["p50_ms"]:8.1f}ms p90={result["p90_ms"]:8.1f}ms '
+                f'queries={result["queries"]:3d} sql={result["sql_ms"]:7.1f}ms '
+                f'peak={result["peak_kb"]:9.0f}KB'
+            )
+
+        report = {
+            'meta': {
+                'year': options['year'],
+                'month': options['month'],
+                'repeat': options['repeat'],
+                'invoices': Invoice.objects.count(),
+                'database': connection.vendor,
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f'結果を {options["output"]} に出力しました。')
+
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['max_regression'])
+
+    def build_cases(self, year, month):
+        """計測する画面とパラメータの組み合わせ"""
+        top_company = (
+            Invoice.objects.values('company_id').annotate(count=Count('id'))
+            .order_by('-count').values_list('company_id', flat=True).first()
+        )
+        cases = [
+            ('dashboard', {}),
+            ('invoice_list', {}),
+            ('invoice_list', {'status': 'pending'}),
+            ('invoice_list', {'date_from': f'{year}-01-01', 'date_to': f'{year}-12-31'}),
+            ('invoice_list', {'search': '株式会社'}),
+        ]
+        for tax_mode in ('including', 'excluding'):
+            cases += [
+                ('monthly_report', {'year': year, 'tax_mode': tax_mode}),
+                ('analytics_report', {'year': year, 'tax_mode': tax_mode}),
+                ('monthly_detail_report', {'year': year, 'month': month, 'tax_mode': tax_mode}),
+            ]
+            if top_company:
+                cases.append(('company_detail_report', {'year': year, 'company': top_company, 'tax_mode': tax_mode}))
+        return cases
+
+    def case_name(self, url_name, params):
+        if not params:
+            return url_name
+        return url_name + '?' + '&'.join(f'{key}={value}' for key, value in params.items())
+
+    def measure(self, url_name, params, repeat, warmup):
+        url = reverse(url_name)
+        for _ in range(warmup):
+            self.client.get(url, params)
+
+        timings = []
+        sql_times = []
+        query_counts = []
+        for _ in range(repeat):
+            # レポート画面のクエリは reports エイリアスで実行されるため、すべてのエイリアスを記録する
+            with capture_queries() as captured:
+                start = time.perf_counter()
+                response = self.client.get(url, params)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url_name} がステータス {response.status_code} を返しました。')
+            query_counts.append(len(captured))
+            sql_times.append(sum(query['time'] for query in captured) * 1000)
+
+        # メモリ計測は計測時間に影響するため別に1回だけ行う
+        tracemalloc.start()
+        try:
+            self.client.get(url, params)
+            _current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'p50_ms': self.percentile(timings, 50),
+            'p90_ms': self.percentile(timings, 90),
+            'p99_ms': self.percentile(timings, 99),
+            'max_ms': max(timings),
+            'mean_ms': statistics.fmean(timings),
+            'queries': max(query_counts),
+            'sql_ms': statistics.median(sql_times),
+            'peak_kb': peak / 1024,
+            'response_bytes': len(response.content),
+        }
+
+    def percentile(self, values, percent):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
+
+    def compare(self, results, baseline_path, max_regression):
+        """ベースラインと比較し、p50の悪化やSQL件数の増加があればエラー終了する"""
+        try:
+            with open(baseline_path, encoding='utf-8') as f:
+                baseline = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f'ベースラインを読み込めません: {e}')
+
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            ratio = result['p50_ms'] / base['p50_ms'] if base['p50_ms'] else 1
+            self.stdout.write(f'{name:<70} p50 x{ratio:.2f}  queries {base["queries"]} -> {result["queries"]}')
+            if ratio > max_regression:
+                regressions.append(f'{name}: p50 {base["p50_ms"]:.1f}ms -> {result["p50_ms"]:.1f}ms (x{ratio:.2f})')
+            if result['queries'] > base['queries']:
+                regressions.append(f'{name}: SQL件数 {base["queries"]} -> {result["queries"]}')
+
+        if regressions:
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            raise CommandError(f'{len(regressions)}件の性能劣化があります。')
+        self.stdout.write(self.style.SUCCESS('性能劣化はありません。'))
@@ -1,6 +1,5 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from decimal import Decimal
 from datetime import date, timedelta
 from invoice_management.models import Company, UserProfile, Invoice
 
@@ -75,8 +74,8 @@ class Command(BaseCommand):
             {
                 'invoice_number': 'BILL-2025-001',
                 'company': companies[0],
-                'amount': Decimal('100000'),
-                'tax_amount': Decimal('10000'),
+                'amount': 100000,
+                'tax_amount': 10000,
                 'invoice_date': date.today() - timedelta(days=10),
                 'due_date': date.today() + timedelta(days=20),
                 'payment_status': 'pending',
@@ -85,8 +84,8 @@ class Command(BaseCommand):
             {
                 'invoice_number': '',  # 空白でテスト
                 'company': companies[1] if len(companies) > 1 else companies[0],
-                'amount': Decimal('250000'),
-                'tax_amount': Decimal('25000'),
+                'amount': 250000,
+                'tax_amount': 25000,
                 'invoice_date': date.today() - timedelta(days=5),
                 'due_date': date.today() + timedelta(days=25),
                 'payment_status': 'paid',
@@ -95,8 +94,8 @@ class Command(BaseCommand):
             {
                 'invoice_number': 'BILL-2025-002',
                 'company': companies[2] if len(companies) > 2 else companies[0],
-                'amount': Decimal('75000'),
-                'tax_amount': Decimal('7500'),
+                'amount': 75000,
+                'tax_amount': 7500,
                 'invoice_date': date.today() - timedelta(days=15),
                 'due_date': date.today() - timedelta(days=5),
                 'payment_status': 'pending',
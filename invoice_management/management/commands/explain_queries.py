@@ -0,0 +1,96 @@
+from datetime import date
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.urls import reverse
+from invoice_management.models import Company
+from invoice_management.routers import capture_queries
+
+
+class Command(BaseCommand):
+    help = '各画面が発行するSQLの EXPLAIN QUERY PLAN を表示し、全件走査を検出します'
+
+    # 全件走査を検出するテーブル（月次集計や会社テーブルは件数が少ないため対象外）
+    CHECKED_TABLES = ('invoice_management_invoice',)
+
+    def add_arguments(self, parser):
+        today = date.today()
+        parser.add_argument('--year', type=int, default=today.year, help='対象年')
+        parser.add_argument('--month', type=int, default=today.month, help='対象月')
+        parser.add_argument('--company', type=int, help='会社別詳細レポートの会社ID（省略時は最初の会社）')
+        parser.add_argument('--username', help='画面を表示するユーザー（省略時は最初のスーパーユーザー）')
+        parser.add_argument(
+            '--fail-on-scan',
+            action='store_true',
+            help='請求書テーブルの全件走査があればエラー終了します',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('このコマンドはSQLiteでのみ使用できます。')
+
+        user = self.get_user(options['username'])
+        client = Client()
+        client.force_login(user)
+
+        company_id = options['company'] or Company.objects.order_by('id').values_list('id', flat=True).first()
+        year, month = options['year'], options['month']
+        targets = [
+            ('dashboard', {}),
+            ('invoice_list', {}),
+            ('invoice_list', {'status': 'pending', 'date_from': f'{year}-01-01', 'date_to': f'{year}-12-31'}),
+            ('company_list', {}),
+            ('monthly_report', {'year': year}),
+            ('analytics_report', {'year': year}),
+            ('monthly_detail_report', {'year': year, 'month': month}),
+            ('company_detail_report', {'year': year, 'company': company_id or ''}),
+        ]
+
+        scans = []
+        for url_name, params in targets:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'== {url_name} {params}'))
+            # レポート画面のクエリは reports エイリアスで実行されるため、すべてのエイリアスを記録する
+            with capture_queries() as captured:
+                response = client.get(reverse(url_name), params)
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f'  ステータス {response.status_code}'))
+
+            for query in captured:
+                sql = query['sql']
+                if query['many'] or not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                self.stdout.write(f'  [{query["alias"]}] {sql}' + (f'  {list(query["params"])}' if query['params'] else ''))
+                for detail in self.explain(query):
+                    if self.is_table_scan(detail):
+                        scans.append((url_name, detail))
+                        self.stdout.write(self.style.WARNING(f'    {detail}  <-- 全件走査'))
+                    else:
+                        self.stdout.write(f'    {detail}')
+
+        if scans:
+            message = f'全件走査が{len(scans)}箇所あります。'
+            if options['fail_on_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('全件走査はありません。'))
+
+    def get_user(self, username):
+        users = User.objects.all()
+        user = users.filter(username=username).first() if username else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('画面を表示するユーザーが見つかりません。--username を指定してください。')
+        return user
+
+    def explain(self, query):
+        """クエリを実行したエイリアスの接続で EXPLAIN QUERY PLAN を実行する"""
+        with connections[query['alias']].cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {query["sql"]}', query['params'])
+            return [row[3] for row in cursor.fetchall()]
+
+    def is_table_scan(self, detail):
+        """インデックスを使わない SCAN（請求書テーブルのみ）を判定"""
+        if not detail.startswith('SCAN ') or 'USING' in detail:
+            return False
+        return detail.split()[1] in self.CHECKED_TABLES
@@ -0,0 +1,150 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from invoice_management.models import Company, DataVersion, UserProfile, Invoice, InvoiceMonthlyRollup, InvoiceSequence
+
+
+class Command(BaseCommand):
+    help = '負荷試験用の大量データ（取引先・ユーザー・請求書）を再現可能な乱数で作成します'
+
+    COMPANY_PREFIXES = ['株式会社', '有限会社', '合同会社', '']
+    COMPANY_WORDS = [
+        '山田', '佐藤', '鈴木', '高橋', '田中', '東京', '大阪', '日本', '中央', '北陸',
+        '商事', '工業', '製作所', '物産', '電機', '精機', '建設', '運輸', 'システム', 'サービス',
+    ]
+    DESCRIPTIONS = ['商品販売代金', 'システム開発費用', 'コンサルティング料', '保守費用', '部品代', '運送費', '']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1000, help='作成する取引先会社数')
+        parser.add_argument('--users', type=int, default=50, help='作成するユーザー数')
+        parser.add_argument('--invoices-per-year', type=int, default=100000, help='1年あたりの請求書数')
+        parser.add_argument('--years', type=int, default=3, help='作成する年数（今年から遡る）')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='会社ごとの取引量の偏り（Zipf分布の指数、0で均等）')
+        parser.add_argument('--seed', type=int, default=42, help='乱数のシード')
+        parser.add_argument('--batch-size', type=int, default=10000, help='一括登録の件数')
+
+    def handle(self, *args, **options):
+        if options['companies'] < 1:
+            raise CommandError('--companies は1以上を指定してください。')
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        users = self.create_users(options['users'])
+        if not users:
+            users = list(User.objects.filter(is_superuser=True)[:1])
+        if not users:
+            raise CommandError('登録者にするユーザーがありません。--users を指定してください。')
+        company_ids = self.create_companies(options['companies'])
+
+        # Zipf分布：順位kの会社の取引量を 1/k^s に比例させる（順位はシャッフル）
+        self.rng.shuffle(company_ids)
+        cum_weights = list(accumulate(
+            1 / (rank ** options['zipf']) for rank in range(1, len(company_ids) + 1)
+        ))
+
+        today = date.today()
+        for year in range(today.year - options['years'] + 1, today.year + 1):
+            self.create_invoices(year, options['invoices_per_year'], company_ids, cum_weights, users, today)
+
+        self.stdout.write('月次集計テーブルを再構築しています...')
+        InvoiceMonthlyRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS('負荷試験用データの作成が完了しました！'))
+
+    def create_users(self, count):
+        if count < 1:
+            return []
+        # パスワードのハッシュ化は遅いため全員同じハッシュを使う
+        password = make_password('loadtest123')
+        start = User.objects.count() + 1
+        users = [
+            User(username=f'loaduser{start + i:06d}', password=password,
+                 last_name=self.rng.choice(self.COMPANY_WORDS[:10]), first_name='太郎')
+            for i in range(count)
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=self.batch_size)
+            users = list(User.objects.filter(username__in=[user.username for user in users]))
+            next_code = self.next_number(UserProfile.objects.order_by('-id').values_list('user_code', flat=True).first())
+            UserProfile.objects.bulk_create([
+                UserProfile(user=user, user_code=f'U{next_code + i:04d}', department='経理部')
+                for i, user in enumerate(users)
+            ], batch_size=self.batch_size)
+            # bulk_create はシグナルを通らないため、ユーザー一覧の件数のキャッシュをここで無効にする
+            DataVersion.bump(DataVersion.USERS)
+        self.stdout.write(f'ユーザーを{len(users)}件作成しました')
+        return users
+
+    def create_companies(self, count):
+        last_id = Company.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        companies = []
+        for i in range(count):
+            number = last_id + 1 + i
+            name = (
+                self.rng.choice(self.COMPANY_PREFIXES)
+                + ''.join(self.rng.sample(self.COMPANY_WORDS, 2))
+                + f'{number}'
+            )
+            companies.append(Company(
+                code=f'C{number:04d}',
+                name=name,
+                invoice_number=f'T{self.rng.randrange(10 ** 12, 10 ** 13)}' if self.rng.random() < 0.8 else '',
+            ))
+        with transaction.atomic():
+            Company.objects.bulk_create(companies, batch_size=self.batch_size)
+        self.stdout.write(f'取引先会社を{count}件作成しました')
+        return list(Company.objects.filter(code__in=[c.code for c in companies]).values_list('id', flat=True))
+
+    def create_invoices(self, year, count, company_ids, cum_weights, users, today):
+        start = date(year, 1, 1)
+        last_day = min(date(year, 12, 31), today)
+        span = (last_day - start).days + 1
+        sequence_year = today.year
+        created = 0
+
+        while created < count:
+            size = min(self.batch_size, count - created)
+            chosen = self.rng.choices(company_ids, cum_weights=cum_weights, k=size)
+            invoices = []
+            for company_id in chosen:
+                invoice_date = start + timedelta(days=self.rng.randrange(span))
+                due_date = invoice_date + timedelta(days=self.rng.choice((14, 30, 30, 45, 60)))
+                amount = int(self.rng.lognormvariate(11.5, 1.0))
+                tax_amount = round(Decimal(amount) / 10)
+                invoices.append(Invoice(
+                    company_id=company_id,
+                    invoice_number=f'B{year}-{self.rng.randrange(10 ** 6):06d}' if self.rng.random() < 0.7 else '',
+                    amount=amount,
+                    tax_amount=tax_amount,
+                    invoice_date=invoice_date,
+                    due_date=due_date,
+                    payment_status=self.payment_status(due_date, today),
+                    description=self.rng.choice(self.DESCRIPTIONS),
+                    registered_by=self.rng.choice(users),
+                ))
+
+            with transaction.atomic():
+                numbers = InvoiceSequence.reserve(sequence_year, size)
+                for invoice, number in zip(invoices, numbers):
+                    invoice.auto_number = InvoiceSequence.format_number(sequence_year, number)
+                Invoice.objects.bulk_create(invoices, batch_size=self.batch_size)
+            created += size
+            self.stdout.write(f'{year}年: 請求書 {created}/{count}件')
+
+    def payment_status(self, due_date, today):
+        """支払期限を過ぎたものはほぼ支払済み、一部が延滞・未払い"""
+        r = self.rng.random()
+        if due_date < today:
+            return 'paid' if r < 0.9 else ('overdue' if r < 0.98 else 'pending')
+        return 'pending' if r < 0.85 else 'paid'
+
+    def next_number(self, last_code):
+        try:
+            return int(last_code[1:]) + 1
+        except (TypeError, ValueError):
+            return 1
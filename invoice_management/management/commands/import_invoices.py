@@ -0,0 +1,161 @@
+import csv
+from datetime import date
+from itertools import islice
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+from invoice_management.companies import company_directory
+from invoice_management.fields import parse_yen
+from invoice_management.models import Invoice, InvoiceMonthlyRollup, InvoiceSequence
+
+
+class Command(BaseCommand):
+    help = '受領請求書をCSVから一括登録します（不正な行はリジェクトファイルに出力）'
+
+    # CSVの見出し（英語のフィールド名、またはCSV出力と同じ日本語の見出し）
+    # 会社は会社コードかインボイス番号（T番号）で指定する。CSV出力の「取引先会社」（会社名）は
+    # 同名の会社がありうるため使わない
+    HEADER_ALIASES = {
+        'company': 'company',
+        '会社コード': 'company',
+        'invoice_number': 'invoice_number',
+        '請求書番号': 'invoice_number',
+        'amount': 'amount',
+        '請求金額': 'amount',
+        'tax_amount': 'tax_amount',
+        '消費税額': 'tax_amount',
+        'invoice_date': 'invoice_date',
+        '請求日': 'invoice_date',
+        'due_date': 'due_date',
+        '支払期限': 'due_date',
+        'payment_status': 'payment_status',
+        '支払状況': 'payment_status',
+        'description': 'description',
+        '摘要': 'description',
+    }
+    REQUIRED_COLUMNS = ('company', 'amount', 'invoice_date', 'due_date')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file', help='取り込むCSVファイル')
+        parser.add_argument('--user', required=True, help='登録者のユーザー名')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='1トランザクションで登録する行数')
+        parser.add_argument('--reject-file', help='不正な行の出力先（省略時は <csv_file>.rejects.csv）')
+        parser.add_argument('--encoding', default='utf-8-sig', help='CSVの文字コード')
+
+    def handle(self, *args, **options):
+        try:
+            registered_by = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f'ユーザー「{options["user"]}」が見つかりません。')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size は1以上を指定してください。')
+
+        # 会社コード・インボイス番号（T番号）から会社IDを引く対応表
+        self.company_ids = {}
+        for company in company_directory.all():
+            if company.invoice_number:
+                self.company_ids.setdefault(company.invoice_number, company.id)
+            self.company_ids[company.code] = company.id
+        self.status_values = {}
+        for value, label in Invoice.PAYMENT_STATUS_CHOICES:
+            self.status_values[value] = value
+            self.status_values[label] = value
+
+        reject_path = options['reject_file'] or f'{options["csv_file"]}.rejects.csv'
+        imported = rejected = 0
+
+        try:
+            source = open(options['csv_file'], newline='', encoding=options['encoding'])
+        except OSError as e:
+            raise CommandError(f'CSVファイルを開けません: {e}')
+
+        with source, open(reject_path, 'w', newline='', encoding='utf-8-sig') as reject_file:
+            reader = csv.DictReader(source)
+            columns = {
+                header: self.HEADER_ALIASES[header.strip()]
+                for header in reader.fieldnames or []
+                if header.strip() in self.HEADER_ALIASES
+            }
+            missing = set(self.REQUIRED_COLUMNS) - set(columns.values())
+            if missing:
+                raise CommandError(f'必須の列がありません: {", ".join(sorted(missing))}')
+
+            reject_writer = csv.writer(reject_file)
+            reject_writer.writerow(['line', *reader.fieldnames, 'error'])
+
+            line_number = 1
+            while True:
+                chunk = list(islice(reader, options['chunk_size']))
+                if not chunk:
+                    break
+
+                invoices = []
+                for row in chunk:
+                    line_number += 1
+                    values = {field: (row.get(header) or '').strip() for header, field in columns.items()}
+                    invoice, error = self.build_invoice(values, registered_by)
+                    if error:
+                        rejected += 1
+                        reject_writer.writerow([line_number, *(row.get(h) for h in reader.fieldnames), error])
+                    else:
+                        invoices.append(invoice)
+
+                if invoices:
+                    self.save_chunk(invoices)
+                    imported += len(invoices)
+                self.stdout.write(f'{line_number - 1}行を処理しました（登録 {imported}件 / 不正 {rejected}件）')
+
+        self.stdout.write(self.style.SUCCESS(f'{imported}件の請求書を登録しました。'))
+        if rejected:
+            self.stdout.write(self.style.WARNING(f'{rejected}件の不正な行を {reject_path} に出力しました。'))
+
+    def build_invoice(self, values, registered_by):
+        """1行分の値を検証してInvoiceを作成する（保存はしない）。(invoice, エラー内容) を返す"""
+        company_id = self.company_ids.get(values['company'])
+        if company_id is None:
+            return None, f'取引先会社「{values["company"]}」が見つかりません'
+
+        try:
+            amount = parse_yen(values['amount'])
+            tax_amount = parse_yen(values.get('tax_amount') or '0')
+        except ValueError:
+            return None, '金額が円単位の数値ではありません'
+        if amount < 0 or tax_amount < 0:
+            return None, '金額は0以上で入力してください'
+
+        try:
+            invoice_date = parse_date(values['invoice_date'].replace('/', '-'))
+            due_date = parse_date(values['due_date'].replace('/', '-'))
+        except ValueError:
+            invoice_date = due_date = None
+        if invoice_date is None or due_date is None:
+            return None, '日付の形式が正しくありません（YYYY-MM-DD）'
+
+        payment_status = self.status_values.get(values.get('payment_status') or 'pending')
+        if payment_status is None:
+            return None, f'支払状況「{values["payment_status"]}」が正しくありません'
+
+        invoice = Invoice(
+            invoice_number=values.get('invoice_number', ''),
+            company_id=company_id,
+            amount=amount,
+            tax_amount=tax_amount,
+            invoice_date=invoice_date,
+            due_date=due_date,
+            payment_status=payment_status,
+            description=values.get('description', ''),
+            registered_by=registered_by,
+        )
+        return invoice, None
+
+    def save_chunk(self, invoices):
+        """自動連番をまとめて確保し、1トランザクションで一括登録する"""
+        year = date.today().year
+        with transaction.atomic():
+            numbers = InvoiceSequence.reserve(year, len(invoices))
+            for invoice, number in zip(invoices, numbers):
+                invoice.auto_number = InvoiceSequence.format_number(year, number)
+            Invoice.objects.bulk_create(invoices, batch_size=1000)
+            # bulk_createはシグナルを通らないため、月次集計へはまとめて反映する
+            InvoiceMonthlyRollup.apply_invoices(invoices)
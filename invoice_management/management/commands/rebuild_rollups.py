@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from invoice_management.models import InvoiceMonthlyRollup
+
+
+class Command(BaseCommand):
+    help = '請求書の月次集計テーブルを再構築・検証します'
+
+    def add_arguments(self, parser):
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
+            '--verify',
+            action='store_true',
+            help='再構築せず、集計テーブルと請求書テーブルの差異のみを確認します',
+        )
+        mode.add_argument(
+            '--repair',
+            action='store_true',
+            help='再構築せず、差異のある集計行だけを修正します（SQLを直接実行するなど、保存・QuerySet を通らずに変更した後に使います）',
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+            return
+        if options['repair']:
+            updated, created, deleted = InvoiceMonthlyRollup.repair()
+            self.stdout.write(self.style.SUCCESS(
+                f'月次集計テーブルを修正しました（更新 {updated}行 / 追加 {created}行 / 削除 {deleted}行）'
+            ))
+            return
+
+        self.stdout.write('月次集計テーブルを再構築しています...')
+        created = InvoiceMonthlyRollup.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'月次集計テーブルを再構築しました（{created}行）'))
+
+    def verify(self):
+        changed, missing, stale = InvoiceMonthlyRollup.drifted()
+        for rollup in changed:
+            self.stdout.write(f'不一致 {rollup.rollup_key()}: 期待値={rollup.rollup_values()}')
+        for rollup in missing:
+            self.stdout.write(f'不足 {rollup.rollup_key()}: 期待値={rollup.rollup_values()}')
+        for rollup in stale:
+            self.stdout.write(f'不要 {rollup.rollup_key()}: 実際={rollup.rollup_values()}')
+
+        mismatches = len(changed) + len(missing) + len(stale)
+        if mismatches:
+            raise CommandError(
+                f'月次集計テーブルに{mismatches}件の不一致があります。'
+                'rebuild_rollups --repair を実行して修正してください。'
+            )
+        self.stdout.write(self.style.SUCCESS(f'月次集計テーブルは正常です（{InvoiceMonthlyRollup.objects.count()}行）'))
@@ -0,0 +1,74 @@
+import os
+import signal
+import socket
+import time
+from django.core.management.base import BaseCommand
+from invoice_management.jobs import REPORT_JOB_RETENTION_DAYS, run_job
+from invoice_management.models import ReportJob
+from invoice_management.sqlite import retry_on_lock
+
+
+class Command(BaseCommand):
+    help = (
+        'レポート集計ジョブ（ReportJob）を登録順に取り出して実行するワーカーです。'
+        '複数のプロセスを同時に起動できます。SIGTERM・Ctrl+C で停止すると実行中のジョブは待機中に戻ります'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='待機中のジョブがなくなったら終了します')
+        parser.add_argument('--poll', type=float, default=2, help='待機中のジョブがないときの確認間隔（秒）')
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='この秒数以上進捗のない実行中のジョブを、止まったワーカーのものとして待機中に戻します',
+        )
+
+    def handle(self, *args, **options):
+        worker = f'{socket.gethostname()}:{os.getpid()}'
+        # SIGTERM でも KeyboardInterrupt と同じく実行中のジョブを戻してから終了する
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        self.stdout.write(f'ワーカー {worker} を開始しました。')
+
+        self.housekeeping(options['stale_after'])
+        last_housekeeping = time.monotonic()
+        try:
+            while True:
+                job = retry_on_lock(ReportJob.claim_next)(worker)
+                if job is None:
+                    if options['once']:
+                        break
+                    if time.monotonic() - last_housekeeping >= options['stale_after']:
+                        self.housekeeping(options['stale_after'])
+                        last_housekeeping = time.monotonic()
+                    time.sleep(options['poll'])
+                    continue
+                self.run(job)
+        except KeyboardInterrupt:
+            self.stdout.write(f'ワーカー {worker} を停止しました。')
+
+    def run(self, job):
+        self.stdout.write(f'ジョブ {job.pk}（{job.get_kind_display()} {job.params}）を実行しています...')
+        start = time.monotonic()
+        try:
+            succeeded = run_job(job)
+        except KeyboardInterrupt:
+            job.requeue()
+            self.stdout.write(f'ジョブ {job.pk} を待機中に戻しました。')
+            raise
+        elapsed = time.monotonic() - start
+        if succeeded:
+            self.stdout.write(self.style.SUCCESS(
+                f'ジョブ {job.pk} が完了しました（{elapsed:.1f}秒、結果 {job.result_size:,}バイト → 圧縮後 {len(job.result):,}バイト）'
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f'ジョブ {job.pk} が失敗しました: {job.message}'))
+
+    def housekeeping(self, stale_after):
+        """止まったワーカーのジョブを待機中に戻し、古いジョブを削除する"""
+        requeued = ReportJob.requeue_stale(stale_after)
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'応答のない実行中のジョブ {requeued}件を待機中に戻しました。'))
+        purged = ReportJob.purge(REPORT_JOB_RETENTION_DAYS)
+        if purged:
+            self.stdout.write(f'{REPORT_JOB_RETENTION_DAYS}日より前に終了したジョブ {purged}件を削除しました。')
@@ -0,0 +1,49 @@
+import os
+import sqlite3
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from invoice_management.routers import REPORTS_DB_ALIAS, database_path
+
+
+class Command(BaseCommand):
+    help = (
+        'レポート用データベース（reports）のコピーを default から作成します。'
+        'reports にコピーのファイルを設定した場合に、cron などで定期的に実行してください'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, help='指定した秒数ごとに繰り返し作成する（省略時は1回だけ）')
+
+    def handle(self, *args, **options):
+        if REPORTS_DB_ALIAS not in connections.settings:
+            raise CommandError(f'settings.DATABASES に {REPORTS_DB_ALIAS} がありません。')
+        source = connections[DEFAULT_DB_ALIAS]
+        target = database_path(connections.settings[REPORTS_DB_ALIAS])
+        if source.vendor != 'sqlite':
+            raise CommandError('SQLiteのデータベースでのみ実行できます。')
+        if os.path.abspath(target) == os.path.abspath(database_path(source.settings_dict)):
+            raise CommandError(f'{REPORTS_DB_ALIAS} は default と同じファイルを読み込んでいるため、コピーは不要です。')
+
+        while True:
+            start = time.perf_counter()
+            self.snapshot(source, target)
+            self.stdout.write(self.style.SUCCESS(
+                f'{target} を作成しました（{time.perf_counter() - start:.1f}秒）'
+            ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
+
+    def snapshot(self, source, target):
+        """オンラインバックアップで一時ファイルに複製し、置き換える（読み込み中の接続は古いファイルを読み続ける）"""
+        temporary = f'{target}.tmp'
+        source.ensure_connection()
+        copy = sqlite3.connect(temporary)
+        try:
+            source.connection.backup(copy)
+            # コピーは読み込み専用で使うため、-wal / -shm ファイルが不要なモードにする
+            copy.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            copy.close()
+        os.replace(temporary, target)
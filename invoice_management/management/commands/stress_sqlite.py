@@ -0,0 +1,156 @@
+import random
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+from invoice_management.models import Company, Invoice
+from invoice_management.reports import invoice_summary, period_rollups
+from invoice_management.sqlite import DEFAULT_PRAGMAS, WAL_PRAGMAS, retry_on_lock
+
+
+class Command(BaseCommand):
+    help = (
+        'SQLiteに読み込み（レポート集計・一覧）と書き込み（請求書登録）を同時に行う負荷試験を実行し、'
+        '既定の設定（baseline）と本番向けの設定（tuned: WAL・PRAGMA・BEGIN IMMEDIATE・再実行）を比較します。'
+        '請求書を登録・削除するため、本番のデータベースのコピーに対して実行してください'
+    )
+
+    PROFILES = ('baseline', 'tuned')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10, help='1設定あたりの実行時間（秒）')
+        parser.add_argument('--readers', type=int, default=4, help='読み込みスレッド数')
+        parser.add_argument('--writers', type=int, default=2, help='書き込みスレッド数')
+        parser.add_argument('--profile', choices=self.PROFILES + ('both',), default='both', help='試験する設定')
+        parser.add_argument('--username', help='請求書の登録者（省略時は最初のスーパーユーザー）')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            raise CommandError('ファイルに保存するSQLiteのデータベースでのみ実行できます。')
+        users = User.objects.all()
+        self.user = users.filter(username=options['username']).first() if options['username'] else users.filter(is_superuser=True).first()
+        if self.user is None:
+            raise CommandError('請求書の登録者が見つかりません。--username を指定してください。')
+        self.company_ids = list(Company.objects.values_list('id', flat=True)[:100])
+        if not self.company_ids:
+            raise CommandError('取引先会社がありません。')
+
+        profiles = self.PROFILES if options['profile'] == 'both' else (options['profile'],)
+        db_settings = connections.settings[connection.alias]
+        original_options = db_settings['OPTIONS']
+        results = {}
+        try:
+            for profile in profiles:
+                results[profile] = self.run_profile(profile, db_settings, options)
+                self.report(profile, results[profile], options['seconds'])
+        finally:
+            # 設定を元に戻す（WALはデータベースファイルに記録されるため、通常の設定で接続し直す）
+            connections.close_all()
+            db_settings['OPTIONS'] = original_options
+            connection.ensure_connection()
+            connections.close_all()
+
+        if len(results) == 2:
+            self.compare(results['baseline'], results['tuned'])
+
+    def run_profile(self, profile, db_settings, options):
+        tuned = profile == 'tuned'
+        connections.close_all()
+        db_settings['OPTIONS'] = {
+            **db_settings['OPTIONS'],
+            'transaction_mode': 'IMMEDIATE' if tuned else None,
+        }
+        pragmas = {**DEFAULT_PRAGMAS, **WAL_PRAGMAS} if tuned else {'journal_mode': 'DELETE'}
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            connection.ensure_connection()
+            connections.close_all()
+
+            self.stop_at = time.monotonic() + options['seconds']
+            self.lock = threading.Lock()
+            self.stats = {'read': [], 'write': [], 'errors': Counter()}
+            self.created = []
+            write = retry_on_lock(self.write) if tuned else self.write
+            threads = [threading.Thread(target=self.worker, args=('read', self.read)) for _ in range(options['readers'])]
+            threads += [threading.Thread(target=self.worker, args=('write', write)) for _ in range(options['writers'])]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            # 登録した請求書を削除する（シグナルで月次集計も元に戻る）
+            Invoice.objects.filter(pk__in=self.created).delete()
+            connections.close_all()
+        return self.stats
+
+    def worker(self, kind, operation):
+        latencies = []
+        errors = Counter()
+        rng = random.Random()
+        try:
+            while time.monotonic() < self.stop_at:
+                start = time.perf_counter()
+                try:
+                    operation(rng)
+                except OperationalError as e:
+                    errors[f'{kind}: {e}'] += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            # スレッドごとの接続を閉じる
+            connections.close_all()
+        with self.lock:
+            self.stats[kind] += latencies
+            self.stats['errors'] += errors
+
+    def read(self, rng):
+        """レポートの集計と請求書一覧の1ページ分"""
+        invoice_summary(period_rollups(date.today().year))
+        list(Invoice.objects.select_related('company').order_by('-created_at', '-id')[:20])
+
+    def write(self, rng):
+        """請求書を1件登録する（採番・月次集計・データバージョンの更新を含む）"""
+        today = date.today()
+        amount = rng.randrange(1000, 1000000)
+        invoice = Invoice(
+            company_id=rng.choice(self.company_ids),
+            amount=amount,
+            tax_amount=amount // 10,
+            invoice_date=today,
+            due_date=today + timedelta(days=30),
+            description='負荷試験',
+            registered_by=self.user,
+        )
+        invoice.save()
+        with self.lock:
+            self.created.append(invoice.pk)
+
+    def report(self, profile, stats, seconds):
+        for kind, label in (('read', '読み込み'), ('write', '書き込み')):
+            latencies = stats[kind]
+            if latencies:
+                self.stdout.write(
+                    f'{profile:<9} {label} {len(latencies) / seconds:8.1f}件/秒 '
+                    f'p50={self.percentile(latencies, 50):7.1f}ms p99={self.percentile(latencies, 99):8.1f}ms'
+                )
+            else:
+                self.stdout.write(f'{profile:<9} {label} 成功なし')
+        errors = sum(stats['errors'].values())
+        style = self.style.ERROR if errors else self.style.SUCCESS
+        self.stdout.write(style(f'{profile:<9} エラー {errors}件'))
+        for message, count in stats['errors'].most_common(3):
+            self.stdout.write(f'    {count}件 {message}')
+
+    def compare(self, baseline, tuned):
+        for kind, label in (('read', '読み込み'), ('write', '書き込み')):
+            if baseline[kind]:
+                ratio = len(tuned[kind]) / len(baseline[kind])
+                self.stdout.write(f'{label}件数 tuned/baseline = x{ratio:.2f}')
+
+    def percentile(self, values, percent):
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, round(percent / 100 * (len(ordered) - 1)))
+        return ordered[index]
@@ -0,0 +1,32 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from invoice_management.models import Invoice
+from invoice_management.sqlite import retry_on_lock
+
+
+class Command(BaseCommand):
+    help = (
+        '支払期限を過ぎた未払いの請求書を延滞にします（月次集計とレポートのデータバージョンも更新します）。'
+        'cron などで毎日実行するか、--every で繰り返し実行してください'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='基準日（YYYY-MM-DD、省略時は今日）。支払期限がこの日より前の請求書を延滞にします')
+        parser.add_argument('--every', type=float, help='指定した秒数ごとに繰り返し実行する（省略時は1回だけ）')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date は YYYY-MM-DD の形式で指定してください。')
+
+        while True:
+            start = time.perf_counter()
+            swept = retry_on_lock(Invoice.sweep_overdue)(today)
+            self.stdout.write(self.style.SUCCESS(
+                f'{swept}件の請求書を延滞にしました（{(time.perf_counter() - start) * 1000:.0f}ms）'
+            ))
+            if not options['every']:
+                return
+            time.sleep(options['every'])
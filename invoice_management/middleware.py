@@ -0,0 +1,147 @@
+"""リクエスト単位の性能計測ミドルウェア
+
+SQLの件数・時間（connection.execute_wrapper）とテンプレートの描画時間を計測し、
+Server-Timing ヘッダーとして返す。閾値を超えた遅いリクエストは、ビュー名と
+繰り返し実行されたSQLの形をJSON形式でログに出力する。
+計測は1クエリごとに時刻の取得と辞書の加算をするだけなので、本番環境でも有効にしておける。
+
+SQLの計測は接続の作成時に付けるラッパー（time_query）で行い、計測中のリクエストは
+コンテキスト変数で判別する。非同期ビュー（ASGI）では sync_to_async の別スレッドでクエリが
+実行されるが、コンテキスト変数は引き継がれるため同じリクエストに加算される。
+同時に実行したクエリのSQL時間は重なった分も加算する。
+
+設定（settings.py、いずれも省略可）:
+    PERFORMANCE_SLOW_REQUEST_MS  遅いリクエストとしてログに出す閾値（ミリ秒、既定 500）
+    PERFORMANCE_SERVER_TIMING    Server-Timing ヘッダーを付けるか（既定 True）
+"""
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+logger = logging.getLogger('invoice_management.performance')
+
+# 現在のリクエストの計測状態（テンプレートバックエンドからも参照する）
+current_stats = contextvars.ContextVar('request_performance_stats', default=None)
+
+# IN (%s, %s, ...) のようにパラメータ数だけが違うSQLを同じ形として扱う
+_PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+
+class RequestStats:
+    """1リクエスト分の計測値"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.shapes = Counter()
+        # 非同期ビューでは複数のスレッドから同時に加算する
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.sql_seconds += elapsed
+                self.queries += 1
+                self.shapes[sql] += 1
+
+    def repeated_shapes(self, limit=3):
+        """繰り返し実行されたSQLの形（N+1 の検出用）"""
+        shapes = Counter()
+        for sql, count in self.shapes.items():
+            shapes[_PLACEHOLDER_LIST.sub('(%s...)', sql)] += count
+        return [
+            {'count': count, 'sql': sql[:300]}
+            for sql, count in shapes.most_common(limit)
+            if count > 1
+        ]
+
+
+def time_query(execute, sql, params, many, context):
+    """計測中のリクエストがあれば、そのリクエストの計測値にSQLを加算する"""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created シグナルの受信：接続に time_query を付ける（再接続では付け直さない）"""
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+class PerformanceMiddleware:
+    """SQL件数・SQL時間・描画時間を計測してServer-Timingヘッダーと遅延ログを出力する"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request_ms = getattr(settings, 'PERFORMANCE_SLOW_REQUEST_MS', 500)
+        self.server_timing = getattr(settings, 'PERFORMANCE_SERVER_TIMING', True)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        return self.finish(request, response, stats, start)
+
+    def finish(self, request, response, stats, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        sql_ms = stats.sql_seconds * 1000
+        render_ms = stats.render_seconds * 1000
+
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={sql_ms:.1f};desc="{stats.queries} queries"',
+                f'render;dur={render_ms:.1f}',
+                f'total;dur={total_ms:.1f}',
+            ])
+
+        if total_ms >= self.slow_request_ms:
+            match = getattr(request, 'resolver_match', None)
+            logger.warning('slow request %s', json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'db_ms': round(sql_ms, 1),
+                'queries': stats.queries,
+                'render_ms': round(render_ms, 1),
+                'repeated_sql': stats.repeated_shapes(),
+            }, ensure_ascii=False))
+
+        return response
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0002_company_remarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='年')),
+                ('last_number', models.PositiveBigIntegerField(default=0, verbose_name='最終番号')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': '請求書採番',
+                'verbose_name_plural': '請求書採番',
+            },
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear
+
+
+def populate_rollups(apps, schema_editor):
+    Invoice = apps.get_model('invoice_management', 'Invoice')
+    InvoiceMonthlyRollup = apps.get_model('invoice_management', 'InvoiceMonthlyRollup')
+    rows = (
+        Invoice.objects
+        .values('company_id', 'payment_status',
+                year=ExtractYear('invoice_date'), month=ExtractMonth('invoice_date'))
+        .annotate(
+            invoice_count=Count('id'),
+            amount_sum=Sum('amount'),
+            total_amount_sum=Sum('total_amount'),
+        )
+        .order_by()
+    )
+    InvoiceMonthlyRollup.objects.bulk_create(
+        [InvoiceMonthlyRollup(**row) for row in rows.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0003_invoicesequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='年')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='月')),
+                ('payment_status', models.CharField(choices=[('pending', '未払い'), ('paid', '支払済み'), ('overdue', '延滞')], max_length=20, verbose_name='支払状況')),
+                ('invoice_count', models.IntegerField(default=0, verbose_name='件数')),
+                ('amount_sum', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='請求金額合計')),
+                ('total_amount_sum', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='合計金額合計')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='invoice_management.company', verbose_name='取引先会社')),
+            ],
+            options={
+                'verbose_name': '請求書月次集計',
+                'verbose_name_plural': '請求書月次集計',
+                'indexes': [models.Index(fields=['year', 'month'], name='invoice_rollup_year_month')],
+                'constraints': [models.UniqueConstraint(fields=('company', 'year', 'month', 'payment_status'), name='unique_invoice_monthly_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
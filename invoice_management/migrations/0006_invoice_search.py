@@ -0,0 +1,14 @@
+from django.db import migrations
+
+from invoice_management.search import install_if_supported, uninstall
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0005_invoice_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_if_supported, uninstall),
+    ]
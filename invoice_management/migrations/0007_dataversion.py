@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0006_invoice_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='名前')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='バージョン')),
+            ],
+            options={
+                'verbose_name': 'データバージョン',
+                'verbose_name_plural': 'データバージョン',
+            },
+        ),
+    ]
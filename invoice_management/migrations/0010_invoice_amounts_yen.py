@@ -0,0 +1,104 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:08
+
+from decimal import ROUND_HALF_UP, Decimal
+
+import invoice_management.fields
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractYear, Round
+from django.utils import timezone
+
+from invoice_management.search import install_if_supported, uninstall
+
+
+def round_fractional_yen(apps, schema_editor):
+    """円未満の端数がある請求書を確認する
+
+    端数があると整数の列に変換できないため、通常は中止する。
+    settings.YEN_MIGRATION_ROUNDING = True を設定した場合のみ、請求金額・消費税額を
+    四捨五入し、合計金額と月次集計を計算し直す。
+    """
+    Invoice = apps.get_model('invoice_management', 'Invoice')
+    fractional = Invoice.objects.filter(
+        ~Q(amount=Round('amount')) | ~Q(tax_amount=Round('tax_amount')) | ~Q(total_amount=Round('total_amount'))
+    )
+    count = fractional.count()
+    if not count:
+        return
+    if not getattr(settings, 'YEN_MIGRATION_ROUNDING', False):
+        raise RuntimeError(
+            f'円未満の端数がある請求書が{count}件あります。端数を修正するか、'
+            f'settings.YEN_MIGRATION_ROUNDING = True を設定して四捨五入してから再実行してください。'
+        )
+
+    one = Decimal('1')
+    now = timezone.now()
+    invoices = []
+    for invoice in fractional.only('id', 'amount', 'tax_amount').iterator(chunk_size=2000):
+        invoice.amount = invoice.amount.quantize(one, rounding=ROUND_HALF_UP)
+        invoice.tax_amount = invoice.tax_amount.quantize(one, rounding=ROUND_HALF_UP)
+        invoice.total_amount = invoice.amount + invoice.tax_amount
+        invoice.updated_at = now
+        invoices.append(invoice)
+    Invoice.objects.bulk_update(invoices, ['amount', 'tax_amount', 'total_amount', 'updated_at'], batch_size=1000)
+
+    # 月次集計を作り直し、レポートのキャッシュを無効にする
+    InvoiceMonthlyRollup = apps.get_model('invoice_management', 'InvoiceMonthlyRollup')
+    rows = (
+        Invoice.objects
+        .values('company_id', 'payment_status',
+                year=ExtractYear('invoice_date'), month=ExtractMonth('invoice_date'))
+        .annotate(
+            invoice_count=Count('id'),
+            amount_sum=Sum('amount'),
+            total_amount_sum=Sum('total_amount'),
+        )
+        .order_by()
+    )
+    InvoiceMonthlyRollup.objects.all().delete()
+    InvoiceMonthlyRollup.objects.bulk_create(
+        [InvoiceMonthlyRollup(**row) for row in rows.iterator()],
+        batch_size=1000,
+    )
+    DataVersion = apps.get_model('invoice_management', 'DataVersion')
+    DataVersion.objects.filter(name='reports').update(version=F('version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0009_company_search_indexes'),
+    ]
+
+    # SQLiteでは請求書テーブルを作り直すため、全文検索のテーブル・トリガーを外してから変換し、後で作り直す
+    operations = [
+        migrations.RunPython(uninstall, install_if_supported),
+        migrations.RunPython(round_fractional_yen, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='invoice',
+            name='amount',
+            field=invoice_management.fields.YenField(verbose_name='請求金額'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='tax_amount',
+            field=invoice_management.fields.YenField(default=0, verbose_name='消費税額'),
+        ),
+        migrations.AlterField(
+            model_name='invoice',
+            name='total_amount',
+            field=invoice_management.fields.YenField(blank=True, verbose_name='合計金額'),
+        ),
+        migrations.AlterField(
+            model_name='invoicemonthlyrollup',
+            name='amount_sum',
+            field=models.BigIntegerField(default=0, verbose_name='請求金額合計'),
+        ),
+        migrations.AlterField(
+            model_name='invoicemonthlyrollup',
+            name='total_amount_sum',
+            field=models.BigIntegerField(default=0, verbose_name='合計金額合計'),
+        ),
+        migrations.RunPython(install_if_supported, uninstall),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:11
+
+import django.db.models.expressions
+import invoice_management.fields
+from django.db import migrations, models
+
+from invoice_management.search import install_if_supported, uninstall
+
+
+def restore_totals(apps, schema_editor):
+    """生成列をやめて通常の列に戻したときに合計金額を計算し直す"""
+    Invoice = apps.get_model('invoice_management', 'Invoice')
+    Invoice.objects.update(total_amount=models.F('amount') + models.F('tax_amount'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0010_invoice_amounts_yen'),
+    ]
+
+    # 通常の列から生成列には変更できないため、削除して追加し直す（既存行の合計金額も計算し直される）。
+    # SQLiteでは請求書テーブルを作り直すため、全文検索のテーブル・トリガーを外してから変更し、後で作り直す
+    operations = [
+        migrations.RunPython(uninstall, install_if_supported),
+        # 元に戻す場合は既定値0で列を追加してから計算し直す
+        migrations.RunPython(migrations.RunPython.noop, restore_totals),
+        migrations.AlterField(
+            model_name='invoice',
+            name='total_amount',
+            field=invoice_management.fields.YenField(blank=True, default=0, verbose_name='合計金額'),
+        ),
+        migrations.RemoveField(
+            model_name='invoice',
+            name='total_amount',
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_amount',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('amount'), '+', models.F('tax_amount')), output_field=invoice_management.fields.YenField(), verbose_name='合計金額'),
+        ),
+        migrations.RunPython(install_if_supported, uninstall),
+    ]
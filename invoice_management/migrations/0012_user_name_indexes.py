@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+# ユーザー一覧の姓・名の前方一致検索用（auth_user は標準のモデルのためSQLで作成する）
+INDEXES = [
+    ('auth_user_last_name_idx', 'last_name'),
+    ('auth_user_first_name_idx', 'first_name'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('invoice_management', '0011_invoice_total_amount_generated'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX IF NOT EXISTS {name} ON auth_user ({column})',
+            f'DROP INDEX IF EXISTS {name}',
+        )
+        for name, column in INDEXES
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_management', '0012_user_name_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('company_month_matrix', '会社×月の請求金額（複数年）'), ('yearly_summary', '年別の請求件数・金額')], max_length=50, verbose_name='種類')),
+                ('params', models.JSONField(default=dict, verbose_name='パラメータ')),
+                ('status', models.CharField(choices=[('queued', '待機中'), ('running', '実行中'), ('done', '完了'), ('failed', '失敗')], default='queued', max_length=20, verbose_name='状態')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='進捗（%）')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='メッセージ')),
+                ('data_version', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='データバージョン')),
+                ('result', models.BinaryField(blank=True, null=True, verbose_name='結果（gzip圧縮JSON）')),
+                ('result_size', models.PositiveIntegerField(default=0, verbose_name='結果のサイズ（圧縮前）')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='ワーカー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='登録日時')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始日時')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='終了日時')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='最終応答日時')),
+                ('requested_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='依頼者')),
+            ],
+            options={
+                'verbose_name': 'レポートジョブ',
+                'verbose_name_plural': 'レポートジョブ',
+                'indexes': [models.Index(fields=['status', 'id'], name='report_job_status')],
+            },
+        ),
+    ]
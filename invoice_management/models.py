@@ -1,7 +1,113 @@
-from django.db import models
+from django.db import connections, models, transaction, IntegrityError
+from django.db.models import F, Count, Q, Sum
+from django.db.models.functions import ExtractYear, ExtractMonth
 from django.contrib.auth.models import User
-from decimal import Decimal
-from datetime import date
+from django.dispatch import Signal
+from django.utils import timezone
+from .fields import YenField
+from .sqlite import retry_on_lock
+from datetime import date, timedelta
+from functools import partial
+import gzip
+import json
+
+
+# DataVersion.bump() の後に送るシグナル（引数 name: バージョン名）
+data_version_bumped = Signal()
+
+
+class DataVersion(models.Model):
+    """データバージョン
+
+    請求書・取引先会社が更新されるたびに進める番号。
+    レポートのキャッシュキーに含めることで、データが変わったら古いキャッシュを使わない。
+    """
+    REPORTS = 'reports'
+    # 取引先会社の一覧・検索結果（オートコンプリートなど）
+    COMPANIES = 'companies'
+    # ユーザー一覧の件数
+    USERS = 'users'
+
+    name = models.CharField(max_length=50, primary_key=True, verbose_name="名前")
+    version = models.PositiveBigIntegerField(default=0, verbose_name="バージョン")
+
+    class Meta:
+        verbose_name = "データバージョン"
+        verbose_name_plural = "データバージョン"
+
+    @classmethod
+    def current(cls, name=REPORTS, using=None):
+        version = cls.objects.using(using).filter(name=name).values_list('version', flat=True).first()
+        return version or 0
+
+    @classmethod
+    def bump(cls, name=REPORTS, using=None):
+        """バージョンを1つ進める
+
+        トランザクション内ではコミット後に、名前ごとに1回だけ進める。連鎖削除や保存のループで
+        何件変更しても、バージョンの行への UPDATE はトランザクションごとに1回になる。
+        """
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            cls._bump(name)
+            return
+        connection.__dict__.setdefault('pending_data_versions', set()).add(name)
+        # セーブポイントのロールバックで取り消されることがあるため、毎回登録する（実行は最初の1回だけ）
+        transaction.on_commit(partial(cls._bump_pending, connection), using=using)
+
+    @classmethod
+    def _bump_pending(cls, connection):
+        names = connection.__dict__.pop('pending_data_versions', set())
+        for name in sorted(names):
+            # コミット済みの変更に対して進めるため、ロックで失敗しても再実行する
+            retry_on_lock(cls._bump)(name)
+
+    @classmethod
+    def _bump(cls, name):
+        if not cls.objects.filter(name=name).update(version=F('version') + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(name=name, version=1)
+            except IntegrityError:
+                cls.objects.filter(name=name).update(version=F('version') + 1)
+        # 同じプロセス内のキャッシュ（取引先会社の一覧など）はすぐに読み直させる
+        data_version_bumped.send(sender=cls, name=name)
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class VersionedQuerySet(models.QuerySet):
+    """一括操作（update / bulk_create / bulk_update）でもデータバージョンを進めるQuerySet
+
+    進めるバージョンはモデルの DATA_VERSIONS で指定する。
+    保存・削除はシグナルでバージョンを進める（signals.py）。
+    update() は auto_now の更新日時を更新しないため、ここで更新する（条件付きGETの検証子に使う）。
+    """
+
+    def update(self, **kwargs):
+        if any(getattr(field, 'auto_now', False) and field.name == 'updated_at' for field in self.model._meta.fields):
+            kwargs.setdefault('updated_at', timezone.now())
+        rows = super().update(**kwargs)
+        if rows:
+            self._bump_data_versions()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            self._bump_data_versions()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if rows:
+            self._bump_data_versions()
+        return rows
+
+    def _bump_data_versions(self):
+        for name in self.model.DATA_VERSIONS:
+            DataVersion.bump(name)
 
 
 class Company(models.Model):
@@ -17,9 +123,18 @@ class Company(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
 
+    objects = VersionedQuerySet.as_manager()
+    # 会社名はレポートにも表示する
+    DATA_VERSIONS = (DataVersion.REPORTS, DataVersion.COMPANIES)
+
     class Meta:
         verbose_name = "取引先会社"
         verbose_name_plural = "取引先会社"
+        indexes = [
+            # オートコンプリートの前方一致検索（会社コードは一意制約のインデックスを使う）
+            models.Index(fields=['name'], name='company_name_idx'),
+            models.Index(fields=['invoice_number'], name='company_invoice_number_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.code:
@@ -69,6 +184,150 @@ class UserProfile(models.Model):
         return f"{self.user_code} - {self.user.get_full_name() or self.user.username}"
 
 
+class InvoiceSequence(models.Model):
+    """請求書自動連番の年別採番テーブル
+
+    年ごとに1行だけ持ち、払い出し済みの最終番号を保持する。
+    UPDATE ... SET last_number = last_number + n で払い出すため、
+    複数ワーカーから同時に採番しても番号が重複しない。
+    """
+    year = models.PositiveIntegerField(primary_key=True, verbose_name="年")
+    last_number = models.PositiveBigIntegerField(default=0, verbose_name="最終番号")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
+
+    class Meta:
+        verbose_name = "請求書採番"
+        verbose_name_plural = "請求書採番"
+
+    @staticmethod
+    def format_number(year, number):
+        """INV2025-0001 形式の連番文字列を作成"""
+        return f"INV{year}-{number:04d}"
+
+    @classmethod
+    def reserve(cls, year, count=1):
+        """指定年の連番をcount件まとめて確保し、番号のrangeを返す
+
+        一括登録ではcountに件数を渡せば1回の更新で番号ブロックを確保できる。
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+
+        with transaction.atomic():
+            updated = cls.objects.filter(year=year).update(
+                last_number=F('last_number') + count
+            )
+            if not updated:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            year=year,
+                            last_number=cls._initial_number(year) + count,
+                        )
+                except IntegrityError:
+                    # 他のワーカーが先に行を作成した場合は通常の払い出しに戻る
+                    cls.objects.filter(year=year).update(
+                        last_number=F('last_number') + count
+                    )
+            last_number = cls.objects.filter(year=year).values_list(
+                'last_number', flat=True
+            ).get()
+
+        return range(last_number - count + 1, last_number + 1)
+
+    @classmethod
+    def _initial_number(cls, year):
+        """採番行がない年について、既存の請求書から最終番号を求める（年に一度だけ実行）"""
+        prefix = f"INV{year}-"
+        last_number = 0
+        auto_numbers = Invoice.objects.filter(
+            auto_number__startswith=prefix
+        ).values_list('auto_number', flat=True)
+        for auto_number in auto_numbers.iterator():
+            try:
+                last_number = max(last_number, int(auto_number[len(prefix):]))
+            except ValueError:
+                continue
+        return last_number
+
+    def __str__(self):
+        return f"{self.year}: {self.last_number}"
+
+
+class InvoiceQuerySet(VersionedQuerySet):
+    """請求書のQuerySet
+
+    update() で月次集計に関わるフィールド（Invoice.ROLLUP_FIELDS）を変更したら、
+    変更前後の集計キーごとの差分を月次集計（InvoiceMonthlyRollup）にまとめて反映する。
+    bulk_update() もバッチごとに CASE 式の update() を実行するため、ここで反映される。
+    """
+
+    def update(self, **kwargs):
+        if not self._changes_rollup(kwargs):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            if any(hasattr(value, 'resolve_expression') for value in kwargs.values()):
+                # 式（F() など）は変更後の値を集計し直す。条件から外れる行もあるため主キーで固定する
+                pks = list(self.values_list('pk', flat=True))
+                before = self._rollup_totals(pks)
+                rows = super().update(**kwargs)
+                deltas = rollup_difference(before, self._rollup_totals(pks))
+            else:
+                # 定数なら変更前の集計だけで変更後のキーと金額が決まる（1クエリ）
+                deltas = self._constant_update_deltas(kwargs)
+                rows = super().update(**kwargs)
+            InvoiceMonthlyRollup.apply_deltas(deltas)
+        return rows
+
+    def _changes_rollup(self, fields):
+        return any(self.model._meta.get_field(name).attname in self.model.ROLLUP_FIELDS for name in fields)
+
+    def _rollup_totals(self, pks):
+        """主キーのリストの請求書を集計キーごとにまとめる（SQLiteの変数の上限ごとに分けて集計する）"""
+        batch_size = connections[self.db].features.max_query_params or len(pks) or 1
+        totals = {}
+        for start in range(0, len(pks), batch_size):
+            batch = self.model._base_manager.using(self.db).filter(pk__in=pks[start:start + batch_size])
+            for key, values in InvoiceMonthlyRollup.totals_by_key(batch).items():
+                add_totals(totals, key, values)
+        return totals
+
+    def _constant_update_deltas(self, kwargs):
+        """定数の update() による集計キーごとの差分を、変更前の集計から求める"""
+        values = {}
+        for name, value in kwargs.items():
+            field = self.model._meta.get_field(name)
+            if isinstance(value, models.Model):
+                value = value.pk
+            values[field.attname] = value if field.is_relation else field.to_python(value)
+        deltas = {}
+        for key, (count, amount, total_amount) in InvoiceMonthlyRollup.totals_by_key(self).items():
+            company_id, year, month, payment_status = key
+            if 'invoice_date' in values:
+                year, month = values['invoice_date'].year, values['invoice_date'].month
+            new_amount = values['amount'] * count if 'amount' in values else amount
+            new_tax_amount = values['tax_amount'] * count if 'tax_amount' in values else total_amount - amount
+            new_key = (
+                values.get('company_id', company_id), year, month, values.get('payment_status', payment_status),
+            )
+            add_totals(deltas, key, (-count, -amount, -total_amount))
+            add_totals(deltas, new_key, (count, new_amount, new_amount + new_tax_amount))
+        return deltas
+
+
+def add_totals(totals, key, values):
+    """{キー: (件数, 請求金額, 合計金額)} のキーに値を加える"""
+    totals[key] = tuple(a + b for a, b in zip(totals.get(key, (0, 0, 0)), values))
+
+
+def rollup_difference(before, after):
+    """変更前後の集計（totals_by_key の結果）から、月次集計に反映する差分を求める"""
+    deltas = dict(after)
+    for key, (count, amount, total_amount) in before.items():
+        add_totals(deltas, key, (-count, -amount, -total_amount))
+    return deltas
+
+
 class Invoice(models.Model):
     """受領請求書モデル"""
     PAYMENT_STATUS_CHOICES = [
@@ -80,9 +339,16 @@ class Invoice(models.Model):
     auto_number = models.CharField(max_length=50, unique=True, verbose_name="自動連番", blank=True)
     invoice_number = models.CharField(max_length=100, blank=True, verbose_name="請求書番号")
     company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name="取引先会社")
-    amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="請求金額")
-    tax_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="消費税額")
-    total_amount = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="合計金額", blank=True)
+    # 金額は円単位の整数で保存する
+    amount = YenField(verbose_name="請求金額")
+    tax_amount = YenField(default=0, verbose_name="消費税額")
+    # 合計金額はデータベースが計算して保存する（update() や bulk_create でもずれない）
+    total_amount = models.GeneratedField(
+        expression=F('amount') + F('tax_amount'),
+        output_field=YenField(),
+        db_persist=True,
+        verbose_name="合計金額",
+    )
     invoice_date = models.DateField(verbose_name="請求日")
     due_date = models.DateField(verbose_name="支払期限")
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending', verbose_name="支払状況")
@@ -91,36 +357,410 @@ class Invoice(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新日時")
 
+    objects = InvoiceQuerySet.as_manager()
+    DATA_VERSIONS = (DataVersion.REPORTS,)
+
     class Meta:
         verbose_name = "請求書"
         verbose_name_plural = "請求書"
+        indexes = [
+            # レポート・一覧の請求日範囲検索
+            models.Index(fields=['invoice_date', 'company'], name='invoice_date_company_idx'),
+            # 会社別詳細レポート（会社＋請求日範囲）
+            models.Index(fields=['company', 'invoice_date'], name='invoice_company_date_idx'),
+            # 支払状況別の件数・延滞判定
+            models.Index(fields=['payment_status', 'due_date'], name='invoice_status_due_idx'),
+            # 一覧・ダッシュボードの新着順
+            models.Index(fields=['created_at'], name='invoice_created_at_idx'),
+            # 条件付きGETの検証子（請求日範囲の最終更新日時・件数を索引だけで求める）
+            models.Index(fields=['invoice_date', 'updated_at'], name='invoice_date_updated_idx'),
+        ]
+
+    # 月次集計（InvoiceMonthlyRollup）の差分計算に使うフィールド
+    ROLLUP_FIELDS = ('company_id', 'invoice_date', 'payment_status', 'amount', 'tax_amount')
+
+    @classmethod
+    def stored_rollup_state(cls, pk, using=None):
+        """データベースに保存されている請求書の rollup_state() を返す（行がなければ None）
+
+        保存・削除のトランザクション内で行をロックして読み込むため、
+        同じ請求書を別のインスタンスから変更していても差分がずれない。
+        """
+        row = (
+            cls.objects.using(using).select_for_update()
+            .filter(pk=pk).values(*cls.ROLLUP_FIELDS).first()
+        )
+        return cls(**row).rollup_state() if row else None
+
+    def rollup_state(self):
+        """月次集計上の (キー, 税抜金額, 税込金額) を返す"""
+        # 文字列で代入された値も正しく集計できるよう、フィールドの型に変換する
+        # 税込金額は total_amount と同じ式で計算する（保存前・保存直後でも読み込みが発生しない）
+        values = {
+            name: self._meta.get_field(name).to_python(getattr(self, name))
+            for name in ('invoice_date', 'amount', 'tax_amount')
+        }
+        key = (
+            self.company_id,
+            values['invoice_date'].year,
+            values['invoice_date'].month,
+            self.payment_status,
+        )
+        return key, values['amount'], values['amount'] + values['tax_amount']
 
     def save(self, *args, **kwargs):
-        # total_amountを計算
-        if self.amount is not None and self.tax_amount is not None:
-            self.total_amount = self.amount + self.tax_amount
-        
-        # auto_numberを自動生成
+        # auto_numberを自動生成（年別の採番テーブルから払い出す）
         if not self.auto_number:
             current_year = date.today().year
-            # 同一年の最新の請求書番号を取得
-            last_invoice = Invoice.objects.filter(
-                auto_number__startswith=f"INV{current_year}"
-            ).order_by('-auto_number').first()
-            
-            if last_invoice and last_invoice.auto_number:
-                try:
-                    # INV2025-0001 から番号部分を抽出
-                    last_number = int(last_invoice.auto_number.split('-')[1])
-                    next_number = last_number + 1
-                except (ValueError, IndexError):
-                    next_number = 1
-            else:
-                next_number = 1
-            
-            self.auto_number = f"INV{current_year}-{next_number:04d}"
+            next_number = InvoiceSequence.reserve(current_year)[0]
+            self.auto_number = InvoiceSequence.format_number(current_year, next_number)
         
-        super().save(*args, **kwargs)
+        # 請求書の保存と月次集計の更新（post_saveシグナル）を同一トランザクションで行う
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+    @classmethod
+    def sweep_overdue(cls, today=None):
+        """支払期限（today より前）を過ぎた未払いの請求書を延滞にし、変更した件数を返す
+
+        変更は1回の UPDATE（支払状況・支払期限のインデックスを使う）で行い、データバージョンと
+        月次集計（(会社, 年, 月) ごとの差分）は InvoiceQuerySet.update が更新する。
+        """
+        today = today or timezone.localdate()
+        return cls.objects.filter(payment_status='pending', due_date__lt=today).update(payment_status='overdue')
 
     def __str__(self):
         return f"{self.auto_number} - {self.company.name}"
+
+
+class InvoiceMonthlyRollup(models.Model):
+    """請求書の月次集計テーブル
+
+    (会社, 年, 月, 支払状況) ごとに件数と金額合計を保持する。
+    請求書の登録・更新・削除時にシグナルからF()で差分更新され、
+    各レポートは請求書テーブルの代わりにこのテーブルを集計する。
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, verbose_name="取引先会社")
+    year = models.PositiveSmallIntegerField(verbose_name="年")
+    month = models.PositiveSmallIntegerField(verbose_name="月")
+    payment_status = models.CharField(max_length=20, choices=Invoice.PAYMENT_STATUS_CHOICES, verbose_name="支払状況")
+    invoice_count = models.IntegerField(default=0, verbose_name="件数")
+    amount_sum = models.BigIntegerField(default=0, verbose_name="請求金額合計")
+    total_amount_sum = models.BigIntegerField(default=0, verbose_name="合計金額合計")
+
+    class Meta:
+        verbose_name = "請求書月次集計"
+        verbose_name_plural = "請求書月次集計"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['company', 'year', 'month', 'payment_status'],
+                name='unique_invoice_monthly_rollup',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['year', 'month'], name='invoice_rollup_year_month'),
+        ]
+
+    @classmethod
+    def apply_delta(cls, key, count, amount, total_amount):
+        """集計行に差分を加算する（行がなければ作成し、件数が0になれば削除する）
+
+        減算で対象行がない場合（会社削除のカスケードで集計行が先に消えた場合など）は何もしない。
+        """
+        company_id, year, month, payment_status = key
+        rows = cls.objects.filter(
+            company_id=company_id, year=year, month=month, payment_status=payment_status
+        )
+        delta = {
+            'invoice_count': F('invoice_count') + count,
+            'amount_sum': F('amount_sum') + amount,
+            'total_amount_sum': F('total_amount_sum') + total_amount,
+        }
+
+        with transaction.atomic():
+            if not rows.update(**delta) and count > 0:
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(
+                            company_id=company_id,
+                            year=year,
+                            month=month,
+                            payment_status=payment_status,
+                            invoice_count=count,
+                            amount_sum=amount,
+                            total_amount_sum=total_amount,
+                        )
+                except IntegrityError:
+                    rows.update(**delta)
+            if count < 0:
+                rows.filter(invoice_count__lte=0).delete()
+
+    @classmethod
+    def totals_by_key(cls, invoices):
+        """請求書のクエリセットを集計キーごとにまとめ、{キー: (件数, 請求金額, 合計金額)} を返す（1クエリ）"""
+        rows = (
+            invoices
+            .values('company_id', 'payment_status',
+                    year=ExtractYear('invoice_date'), month=ExtractMonth('invoice_date'))
+            .annotate(count=Count('id'), amount_sum=Sum('amount'), total_sum=Sum('total_amount'))
+            .order_by()
+        )
+        return {
+            (row['company_id'], row['year'], row['month'], row['payment_status']):
+                (row['count'], row['amount_sum'], row['total_sum'])
+            for row in rows
+        }
+
+    @classmethod
+    def apply_deltas(cls, deltas):
+        """キーごとの差分 {キー: (件数, 請求金額, 合計金額)} をまとめて反映する
+
+        対象の集計行を1回で読み込み、変わる行を削除して新しい値で作り直すため、
+        キーが多くてもクエリは数回で済む（apply_delta はキーごとに1〜3クエリ、
+        bulk_update は行ごとの CASE 式の組み立てに時間がかかる）。
+        """
+        deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        with transaction.atomic():
+            existing = {
+                rollup.rollup_key(): rollup
+                for rollup in cls.objects.select_for_update().filter(
+                    company_id__in={key[0] for key in deltas},
+                    payment_status__in={key[3] for key in deltas},
+                )
+            }
+            changed, created, emptied = [], [], []
+            for key, (count, amount, total_amount) in deltas.items():
+                rollup = existing.get(key)
+                if rollup is None:
+                    if count > 0:
+                        company_id, year, month, payment_status = key
+                        created.append(cls(
+                            company_id=company_id, year=year, month=month, payment_status=payment_status,
+                            invoice_count=count, amount_sum=amount, total_amount_sum=total_amount,
+                        ))
+                    continue
+                rollup.invoice_count += count
+                rollup.amount_sum += amount
+                rollup.total_amount_sum += total_amount
+                (changed if rollup.invoice_count > 0 else emptied).append(rollup)
+            # 更新する行は主キーを残したまま作り直す
+            cls.objects.filter(pk__in=[rollup.pk for rollup in changed + emptied]).delete()
+            cls.objects.bulk_create(changed + created, batch_size=500)
+
+    @classmethod
+    def apply_invoices(cls, invoices):
+        """bulk_createなどシグナルを通らずに登録した請求書を集計に反映する
+
+        キーごとにまとめて差分を加算するため、件数が多くても更新は集計行の数だけで済む。
+        """
+        deltas = {}
+        for invoice in invoices:
+            key, amount, total_amount = invoice.rollup_state()
+            count_sum, amount_sum, total_sum = deltas.get(key, (0, 0, 0))
+            deltas[key] = (count_sum + 1, amount_sum + amount, total_sum + total_amount)
+        with transaction.atomic():
+            for key, (count, amount, total_amount) in deltas.items():
+                cls.apply_delta(key, count, amount, total_amount)
+
+    @classmethod
+    def compute_from_invoices(cls):
+        """請求書テーブルから集計行を算出する（再構築・検証用）"""
+        rows = (
+            Invoice.objects
+            .values('company_id', 'payment_status',
+                    year=ExtractYear('invoice_date'), month=ExtractMonth('invoice_date'))
+            .annotate(
+                invoice_count=Count('id'),
+                amount_sum=Sum('amount'),
+                total_amount_sum=Sum('total_amount'),
+            )
+            .order_by()
+        )
+        return [cls(**row) for row in rows.iterator()]
+
+    @classmethod
+    def rebuild(cls, batch_size=1000):
+        """集計テーブルを請求書テーブルから作り直し、作成した行数を返す"""
+        rollups = cls.compute_from_invoices()
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rollups, batch_size=batch_size)
+            DataVersion.bump()
+        return len(rollups)
+
+    @classmethod
+    def drifted(cls):
+        """請求書テーブルから算出した値とずれている集計行を調べる
+
+        (更新が必要な既存行, 不足している行, 不要な行) を返す。更新が必要な行には正しい値を設定済み。
+        """
+        expected = {rollup.rollup_key(): rollup for rollup in cls.compute_from_invoices()}
+        changed, stale = [], []
+        for rollup in cls.objects.iterator():
+            correct = expected.pop(rollup.rollup_key(), None)
+            if correct is None:
+                stale.append(rollup)
+            elif rollup.rollup_values() != correct.rollup_values():
+                rollup.invoice_count, rollup.amount_sum, rollup.total_amount_sum = correct.rollup_values()
+                changed.append(rollup)
+        return changed, list(expected.values()), stale
+
+    @classmethod
+    def repair(cls):
+        """ずれている集計行だけを修正し、(更新, 作成, 削除) の行数を返す
+
+        SQLを直接実行するなど、保存・QuerySet を通らずに請求書を変更した後に使う。
+        全件を作り直す rebuild() と違い、正しい行には書き込まない。
+        """
+        changed, missing, stale = cls.drifted()
+        with transaction.atomic():
+            cls.objects.bulk_update(changed, ['invoice_count', 'amount_sum', 'total_amount_sum'])
+            cls.objects.bulk_create(missing)
+            cls.objects.filter(pk__in=[rollup.pk for rollup in stale]).delete()
+            if changed or missing or stale:
+                DataVersion.bump()
+        return len(changed), len(missing), len(stale)
+
+    def rollup_key(self):
+        return (self.company_id, self.year, self.month, self.payment_status)
+
+    def rollup_values(self):
+        return (self.invoice_count, self.amount_sum, self.total_amount_sum)
+
+    def __str__(self):
+        return f"{self.company_id} {self.year}/{self.month:02d} {self.payment_status}"
+
+
+class ReportJob(models.Model):
+    """バックグラウンドで実行するレポート集計ジョブ
+
+    複数年・全社にわたる集計はリクエストの中で実行せず、ジョブとして登録する。
+    run_report_worker コマンドのワーカーが登録順に取り出して実行し、結果をgzip圧縮したJSONで保存する。
+    集計の内容は jobs.py の REPORT_JOBS を参照。
+    """
+    KIND_CHOICES = [
+        ('company_month_matrix', '会社×月の請求金額（複数年）'),
+        ('yearly_summary', '年別の請求件数・金額'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', '待機中'),
+        ('running', '実行中'),
+        ('done', '完了'),
+        ('failed', '失敗'),
+    ]
+    ACTIVE_STATUSES = ('queued', 'running')
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES, verbose_name="種類")
+    params = models.JSONField(default=dict, verbose_name="パラメータ")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="状態")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="進捗（%）")
+    message = models.CharField(max_length=255, blank=True, verbose_name="メッセージ")
+    # 集計を始めた時点の DataVersion.REPORTS（同じデータからの結果は再利用する）
+    data_version = models.PositiveBigIntegerField(null=True, blank=True, verbose_name="データバージョン")
+    result = models.BinaryField(null=True, blank=True, verbose_name="結果（gzip圧縮JSON）")
+    result_size = models.PositiveIntegerField(default=0, verbose_name="結果のサイズ（圧縮前）")
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="依頼者")
+    worker = models.CharField(max_length=100, blank=True, verbose_name="ワーカー")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="登録日時")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="開始日時")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="終了日時")
+    # 実行中のワーカーが進捗を書き込んだ日時（止まったワーカーのジョブを検出する）
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name="最終応答日時")
+
+    class Meta:
+        verbose_name = "レポートジョブ"
+        verbose_name_plural = "レポートジョブ"
+        indexes = [
+            models.Index(fields=['status', 'id'], name='report_job_status'),
+        ]
+
+    @classmethod
+    def submit(cls, kind, params, user):
+        """ジョブを登録して返す
+
+        同じ種類・パラメータのジョブが待機中・実行中か、現在のデータから作った結果があればそれを返す。
+        """
+        candidates = cls.objects.defer('result').filter(kind=kind).filter(
+            Q(status__in=cls.ACTIVE_STATUSES) |
+            Q(status='done', data_version=DataVersion.current())
+        ).order_by('-id')
+        for job in candidates[:50]:
+            if job.params == params:
+                return job
+        return cls.objects.create(kind=kind, params=params, requested_by=user)
+
+    @classmethod
+    def claim_next(cls, worker):
+        """待機中で最も古いジョブを実行中にして返す（なければ None）
+
+        状態を条件にした UPDATE で取り出すため、複数のワーカーが同時に動いても同じジョブは1度しか実行しない。
+        """
+        while True:
+            job = cls.objects.defer('result').filter(status='queued').order_by('id').first()
+            if job is None:
+                return None
+            now = timezone.now()
+            claimed = cls.objects.filter(pk=job.pk, status='queued').update(
+                status='running', worker=worker, progress=0, message='',
+                started_at=now, heartbeat_at=now,
+            )
+            if claimed:
+                job.status, job.worker, job.started_at, job.heartbeat_at = 'running', worker, now, now
+                return job
+
+    @classmethod
+    def requeue_stale(cls, seconds):
+        """最終応答から seconds 秒以上たった実行中のジョブ（止まったワーカーのジョブ）を待機中に戻す"""
+        return cls.objects.filter(
+            status='running', heartbeat_at__lt=timezone.now() - timedelta(seconds=seconds),
+        ).update(status='queued', worker='', progress=0, message='')
+
+    @classmethod
+    def purge(cls, days):
+        """終了から days 日以上たったジョブを削除する"""
+        deleted, _ = cls.objects.filter(
+            status__in=['done', 'failed'], finished_at__lt=timezone.now() - timedelta(days=days),
+        ).delete()
+        return deleted
+
+    def report_progress(self, progress, message=''):
+        self.progress = progress
+        self.message = message[:255]
+        self.heartbeat_at = timezone.now()
+        type(self).objects.filter(pk=self.pk).update(
+            progress=self.progress, message=self.message, heartbeat_at=self.heartbeat_at,
+        )
+
+    def finish(self, data):
+        """結果をgzip圧縮したJSONとして保存し、完了にする"""
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+        self.result = gzip.compress(payload)
+        self.result_size = len(payload)
+        self.status = 'done'
+        self.progress = 100
+        self.finished_at = timezone.now()
+        self.save(update_fields=['result', 'result_size', 'status', 'progress', 'data_version', 'message', 'finished_at'])
+
+    def fail(self, message):
+        self.status = 'failed'
+        self.message = message[:255]
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'message', 'finished_at'])
+
+    def requeue(self):
+        """実行中のジョブを待機中に戻す（ワーカーの停止時）"""
+        type(self).objects.filter(pk=self.pk, status='running').update(
+            status='queued', worker='', progress=0, message='',
+        )
+
+    @property
+    def is_finished(self):
+        return self.status not in self.ACTIVE_STATUSES
+
+    def result_data(self):
+        return json.loads(gzip.decompress(self.result))
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
@@ -0,0 +1,134 @@
+"""キーセット（カーソル）ページネーション
+
+Paginator のように COUNT(*) と LIMIT/OFFSET を使わず、直前のページの
+最後（または最初）の行の並び順キーを条件にして次のページを取得する。
+何ページ目であっても、並び順のインデックスを使った同じコストで表示できる。
+"""
+import base64
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """キーセットページネーションの1ページ分"""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, total_count=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        # 件数は安価に求められる場合のみ（それ以外はNone）
+        self.total_count = total_count
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class KeysetPaginator:
+    """並び順のフィールド（最後は一意なフィールド）をキーにしたページネーション
+
+    ordering は ('-created_at', '-id') のように指定し、すべて同じ向きにする。
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        descending = {field.startswith('-') for field in ordering}
+        if len(descending) != 1:
+            raise ValueError('ordering fields must all share the same direction')
+
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.descending = descending.pop()
+        self.fields = [field.lstrip('-') for field in ordering]
+
+    def get_page(self, after=None, before=None, total_count=None):
+        """after（次へ）または before（前へ）のカーソルからページを取得する
+
+        不正なカーソルは無視して最初のページを返す。
+        total_count には件数を渡せる（安価に求められる場合のみ）。
+        """
+        after_values = self.decode_cursor(after)
+        before_values = self.decode_cursor(before) if after_values is None else None
+
+        queryset = self.queryset
+        if before_values is not None:
+            # 逆順に取得して並べ直す
+            queryset = queryset.filter(self._seek(before_values, forward=False))
+            queryset = queryset.order_by(*self._reversed_ordering())
+        else:
+            if after_values is not None:
+                queryset = queryset.filter(self._seek(after_values, forward=True))
+            queryset = queryset.order_by(*self.ordering)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if before_values is not None:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, after_values is not None
+
+        return KeysetPage(
+            rows,
+            has_next=has_next,
+            has_previous=has_previous,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0]) if has_previous and rows else None,
+            total_count=total_count,
+        )
+
+    def _reversed_ordering(self):
+        return [field.lstrip('-') if self.descending else f'-{field}' for field in self.ordering]
+
+    def _seek(self, values, forward):
+        """カーソル位置より後（forward=False なら前）の行を表す条件
+
+        (a, b) の降順なら a <= x AND (a < x OR (a = x AND b < y)) となる。
+        先頭の a <= x がないとSQLiteはインデックスの範囲を絞れず、
+        先頭から走査するため深いページほど遅くなる。
+        """
+        lookup = 'lt' if self.descending == forward else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            equal = {self.fields[i]: values[i] for i in range(index)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[index]})
+        if len(self.fields) > 1:
+            condition &= Q(**{f'{self.fields[0]}__{lookup}e': values[0]})
+        return condition
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.fields:
+            value = getattr(obj, field)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        data = json.dumps(values, separators=(',', ':'), default=str)
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                return None
+            model = self.queryset.model
+            return [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            return None
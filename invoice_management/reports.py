@@ -0,0 +1,292 @@
+"""レポート集計処理
+
+各レポートビューの集計は請求書テーブルではなく月次集計テーブル
+（InvoiceMonthlyRollup）に対して行う。
+税込（total_amount）・税抜（amount）の両方を同じクエリで取得し、
+ビュー側で tax_mode に応じて使い分ける。
+名前が a で始まる関数は非同期ビュー用で、互いに依存しない集計を同時に実行する。
+"""
+from datetime import date
+from django.db.models import Q, Sum
+from .companies import company_directory
+from .concurrency import gather_queries
+from .models import Invoice, InvoiceMonthlyRollup
+
+
+TAX_MODES = ('including', 'excluding')
+
+# tax_modeごとの集計テーブルの金額フィールド
+ROLLUP_AMOUNT_FIELDS = {
+    'including': 'total_amount_sum',
+    'excluding': 'amount_sum',
+}
+
+
+def normalize_tax_mode(tax_mode):
+    """不正な値は税込として扱う"""
+    return tax_mode if tax_mode in TAX_MODES else 'including'
+
+
+def period_bounds(year, month=None):
+    """期間の開始日と終了日（含まない）を返す"""
+    if month is None:
+        return date(year, 1, 1), date(year + 1, 1, 1)
+    if month == 12:
+        return date(year, 12, 1), date(year + 1, 1, 1)
+    return date(year, month, 1), date(year, month + 1, 1)
+
+
+def period_invoices(year, month=None):
+    """指定期間の請求書クエリセット
+
+    __year / __month の抽出ではなく請求日の範囲条件にして、
+    請求日のインデックスが使えるようにする。
+    """
+    start, end = period_bounds(year, month)
+    return Invoice.objects.filter(invoice_date__gte=start, invoice_date__lt=end)
+
+
+def rollup_sums():
+    """件数と税込・税抜の合計を求める集計式"""
+    return {
+        'count': Sum('invoice_count'),
+        'including': Sum('total_amount_sum'),
+        'excluding': Sum('amount_sum'),
+    }
+
+
+def period_rollups(year, month=None, company=None):
+    """指定期間（年、任意で月・会社）の集計行クエリセット"""
+    rollups = InvoiceMonthlyRollup.objects.filter(year=year)
+    if month is not None:
+        rollups = rollups.filter(month=month)
+    if company is not None:
+        rollups = rollups.filter(company=company)
+    return rollups
+
+
+def invoice_summary(rollups):
+    """件数・合計金額（税込/税抜）・支払状況別件数を1クエリで集計する"""
+    aggregates = rollup_sums()
+    for status, _label in Invoice.PAYMENT_STATUS_CHOICES:
+        aggregates[f'status_{status}'] = Sum('invoice_count', filter=Q(payment_status=status))
+    row = rollups.order_by().aggregate(**aggregates)
+
+    return {
+        'count': row['count'] or 0,
+        'including': int(row['including'] or 0),
+        'excluding': int(row['excluding'] or 0),
+        'status_stats': {
+            status: row[f'status_{status}'] or 0
+            for status, _label in Invoice.PAYMENT_STATUS_CHOICES
+        },
+    }
+
+
+def monthly_series(rollups):
+    """月別の件数・合計（税込/税抜）を12ヶ月分0埋めして返す
+
+    {month: {'count', 'including', 'excluding'}}
+    """
+    series = {
+        month: {'count': 0, 'including': 0, 'excluding': 0}
+        for month in range(1, 13)
+    }
+    rows = rollups.values('month').annotate(**rollup_sums()).order_by()
+    for row in rows:
+        series[row['month']] = {
+            'count': row['count'],
+            'including': int(row['including'] or 0),
+            'excluding': int(row['excluding'] or 0),
+        }
+    return series
+
+
+def company_totals(rollups, tax_mode, limit=None):
+    """会社別の件数・合計を金額順に返す（並べ替えと件数制限もデータベース側で行う）"""
+    rows = (
+        rollups
+        .values('company_id', 'company__name')
+        .annotate(count=Sum('invoice_count'), total=Sum(ROLLUP_AMOUNT_FIELDS[tax_mode]))
+        .order_by('-total', 'company__name')
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return [
+        {'name': row['company__name'], 'total': int(row['total'] or 0), 'count': row['count']}
+        for row in rows
+    ]
+
+
+def yearly_analytics(year, tax_mode, top_n=10):
+    """分析レポート用の集計（SQLは2回で固定、月別推移はグラフ用データ chart_data で返す）"""
+    rollups = period_rollups(year)
+    return analytics_result(invoice_summary(rollups), company_totals(rollups, tax_mode, top_n), tax_mode)
+
+
+async def ayearly_analytics(year, tax_mode, top_n=10):
+    """yearly_analytics の非同期版（2つの集計を同時に実行する）"""
+    rollups = period_rollups(year)
+    summary, top_companies = await gather_queries(
+        lambda: invoice_summary(rollups),
+        lambda: company_totals(rollups, tax_mode, top_n),
+    )
+    return analytics_result(summary, top_companies, tax_mode)
+
+
+def analytics_result(summary, top_companies, tax_mode):
+    total_invoices = summary['count']
+    total_amount = summary[tax_mode]
+    return {
+        'top_companies': [
+            {'name': company['name'], 'total': company['total']}
+            for company in top_companies
+        ],
+        'status_stats': summary['status_stats'],
+        'total_invoices': total_invoices,
+        'total_amount': total_amount,
+        'avg_amount': total_amount / total_invoices if total_invoices > 0 else 0,
+    }
+
+
+def company_breakdown(rollups):
+    """会社別の件数・合計（税込/税抜の両方）を1クエリで集計する（並び順は不定）"""
+    rows = (
+        rollups
+        .values('company_id', 'company__name')
+        .annotate(**rollup_sums())
+        .order_by()
+    )
+    return [
+        {
+            'id': row['company_id'],
+            'name': row['company__name'],
+            'count': row['count'],
+            'including': int(row['including'] or 0),
+            'excluding': int(row['excluding'] or 0),
+        }
+        for row in rows
+    ]
+
+
+def rank_companies(companies, tax_mode):
+    """company_breakdown() の結果を金額順（同額は会社名順）に並べる"""
+    return sorted(companies, key=lambda company: (-company[tax_mode], company['name']))
+
+
+def monthly_detail_stats(year, month):
+    """月別詳細レポート用の集計（全体の統計と会社別集計、税込・税抜の両方）"""
+    rollups = period_rollups(year, month)
+    return {
+        'summary': invoice_summary(rollups),
+        'companies': company_breakdown(rollups),
+    }
+
+
+async def amonthly_detail_stats(year, month):
+    """monthly_detail_stats の非同期版（2つの集計を同時に実行する）"""
+    rollups = period_rollups(year, month)
+    summary, companies = await gather_queries(
+        lambda: invoice_summary(rollups),
+        lambda: company_breakdown(rollups),
+    )
+    return {'summary': summary, 'companies': companies}
+
+
+def company_yearly_stats(year, company_id):
+    """会社別詳細レポート用の集計（月別推移と全体の統計、税込・税抜の両方）"""
+    rollups = period_rollups(year, company=company_id)
+    return {
+        'monthly': monthly_series(rollups),
+        'summary': invoice_summary(rollups),
+    }
+
+
+async def acompany_yearly_stats(year, company_id):
+    """company_yearly_stats の非同期版（2つの集計を同時に実行する）"""
+    rollups = period_rollups(year, company=company_id)
+    monthly, summary = await gather_queries(
+        lambda: monthly_series(rollups),
+        lambda: invoice_summary(rollups),
+    )
+    return {'monthly': monthly, 'summary': summary}
+
+
+def chart_data(year, month=None, company_id=None, top_n=10):
+    """レポートのグラフ用データ（税込・税抜の両方をまとめたJSON用の辞書）
+
+    月を省略すると月別推移（monthly）を、会社を省略すると会社別の上位 top_n 社と
+    それ以外の合計（companies）を含める。金額は配列で持ち、ペイロードを小さくする。
+    """
+    rollups = period_rollups(year, month, company_id)
+    return chart_result(
+        year, month, company_id, top_n,
+        invoice_summary(rollups),
+        monthly_series(rollups) if month is None else None,
+        company_breakdown(rollups) if company_id is None else None,
+    )
+
+
+async def achart_data(year, month=None, company_id=None, top_n=10):
+    """chart_data の非同期版（全体の統計・月別推移・会社別集計を同時に実行する）"""
+    rollups = period_rollups(year, month, company_id)
+    summary, series, companies = await gather_queries(
+        lambda: invoice_summary(rollups),
+        (lambda: monthly_series(rollups)) if month is None else None,
+        (lambda: company_breakdown(rollups)) if company_id is None else None,
+    )
+    return chart_result(year, month, company_id, top_n, summary, series, companies)
+
+
+def chart_result(year, month, company_id, top_n, summary, series, companies):
+    data = {
+        'year': year,
+        'month': month,
+        'company': company_id,
+        'count': summary['count'],
+        'total': {tax_mode: summary[tax_mode] for tax_mode in TAX_MODES},
+        'status': summary['status_stats'],
+    }
+    if series is not None:
+        data['monthly'] = {
+            key: [series[month][key] for month in range(1, 13)]
+            for key in ('count', *TAX_MODES)
+        }
+    if companies is not None:
+        data['companies'] = {}
+        for tax_mode in TAX_MODES:
+            ranked = rank_companies(companies, tax_mode)
+            data['companies'][tax_mode] = {
+                'top': [[company['name'], company[tax_mode]] for company in ranked[:top_n]],
+                'other': sum(company[tax_mode] for company in ranked[top_n:]),
+            }
+    return data
+
+
+def company_month_matrix(year):
+    """会社×月の請求金額を1回のGROUP BYで集計する
+
+    取引のある会社だけを含む疎な辞書を返す。会社名は company_directory から引く（JOINしない）。
+    {company_id: {'company': {'id', 'name'},
+                  'including': {month: 金額}, 'excluding': {month: 金額}}}
+    """
+    rows = (
+        period_rollups(year)
+        .values('company_id', 'month')
+        .annotate(**rollup_sums())
+        .order_by()
+    )
+
+    matrix = {}
+    for row in rows:
+        entry = matrix.get(row['company_id'])
+        if entry is None:
+            company = company_directory.get(row['company_id'])
+            entry = matrix[row['company_id']] = {
+                'company': {'id': row['company_id'], 'name': company.name if company else ''},
+                'including': {},
+                'excluding': {},
+            }
+        for tax_mode in TAX_MODES:
+            entry[tax_mode][row['month']] = int(row[tax_mode] or 0)
+    return matrix
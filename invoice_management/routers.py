@@ -0,0 +1,158 @@
+"""レポート用データベースへの読み込みの振り分け
+
+レポート画面・CSV出力（use_reports_database を付けたビュー）の間だけ、請求書管理アプリの
+読み込みを reports エイリアスのデータベースに送る。書き込みと、それ以外の画面
+（請求書詳細など、登録直後に表示する画面）は常に default を使う。
+
+reports エイリアスは読み取り専用で開く（NAME='file:...?mode=ro'、OPTIONS={'uri': True}）。ファイルは次のどちらか。
+- default と同じファイル。遅延はない
+- snapshot_reports_db コマンドで定期的に作るコピー。ファイルの更新日時から遅延を求め、
+  REPORTS_DATABASE_MAX_LAG 秒より古ければ default から読む
+
+設定（settings.py、いずれも省略可）:
+    REPORTS_DATABASE_MAX_LAG  reports のコピーの許容遅延（秒、既定 300）
+"""
+import contextvars
+import os
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+from urllib.parse import urlsplit
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPORTS_DB_ALIAS = 'reports'
+
+# 現在のリクエストが reports から読み込むか（use_reports_database が設定する）
+reading_reports = contextvars.ContextVar('reading_reports', default=False)
+
+
+def database_path(settings_dict):
+    """SQLiteのデータベースファイルのパス（'file:...?mode=ro' のURI形式も扱う）"""
+    name = str(settings_dict['NAME'])
+    if name.startswith('file:'):
+        return urlsplit(name).path
+    return name
+
+
+def replica_lag(alias=REPORTS_DB_ALIAS):
+    """reports の default からの遅延（秒）。同じファイルなら0、コピーならファイルの経過時間"""
+    path = database_path(connections.settings[alias])
+    if os.path.abspath(path) == os.path.abspath(database_path(connections.settings[DEFAULT_DB_ALIAS])):
+        return 0
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return None
+    # コピーが置き換えられていたら、古いファイルを開いたままの接続を閉じる
+    connection = connections[alias]
+    if getattr(connection, 'snapshot_mtime', modified) != modified:
+        connection.close()
+    connection.snapshot_mtime = modified
+    return time.time() - modified
+
+
+def reports_database_usable():
+    if REPORTS_DB_ALIAS not in settings.DATABASES:
+        return False
+    lag = replica_lag()
+    return lag is not None and lag <= getattr(settings, 'REPORTS_DATABASE_MAX_LAG', 300)
+
+
+def _iterate_reading_reports(content):
+    """ストリーミングの応答（CSV出力）は、返した後に少しずつ読み込むため、その間も reports を使う"""
+    iterator = iter(content)
+    while True:
+        token = reading_reports.set(True)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            reading_reports.reset(token)
+        yield chunk
+
+
+def use_reports_database(view):
+    """ビューの読み込みを reports データベースに振り分けるデコレーター（読み込みだけのビューに付ける）"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not reports_database_usable():
+                return await view(request, *args, **kwargs)
+
+            # sync_to_async で実行するクエリにもコンテキスト変数は引き継がれる
+            token = reading_reports.set(True)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                reading_reports.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or not reports_database_usable():
+            return view(request, *args, **kwargs)
+
+        token = reading_reports.set(True)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            reading_reports.reset(token)
+        if response.streaming:
+            response.streaming_content = _iterate_reading_reports(response.streaming_content)
+        return response
+    return wrapper
+
+
+@contextmanager
+def capture_queries():
+    """すべてのエイリアス（default・reports）で実行したSQLを実行順に記録する（計測・診断用のコマンドで使う）
+
+    {'alias', 'sql', 'params', 'many', 'time'（秒）} の辞書のリストを返す。
+    CaptureQueriesContext は1つの接続しか記録しないため、reports に振り分けたレポートのクエリを取りこぼす。
+    """
+    captured = []
+
+    def recorder(alias):
+        def record(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                captured.append({
+                    'alias': alias, 'sql': sql, 'params': params, 'many': many,
+                    'time': time.perf_counter() - start,
+                })
+        return record
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder(alias)))
+        yield captured
+
+
+class ReportsRouter:
+    """use_reports_database を付けたビューの中では、請求書管理アプリの読み込みを reports に送る"""
+
+    app_label = 'invoice_management'
+
+    def db_for_read(self, model, **hints):
+        if reading_reports.get() and model._meta.app_label == self.app_label:
+            return REPORTS_DB_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        # reports から読み込んだインスタンスでも、保存は default に行う
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # reports は default と同じデータ（またはそのコピー）
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == REPORTS_DB_ALIAS:
+            return False
+        return None
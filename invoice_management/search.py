@@ -0,0 +1,160 @@
+"""請求書の全文検索（SQLite FTS5）
+
+請求書番号・自動連番・会社名・摘要を trigram トークナイザの FTS5 仮想テーブルに
+登録し、部分一致検索をインデックスで行う。日本語のように単語の区切りがない文字列でも
+3文字以上の検索語なら部分一致で検索できる。
+索引はデータベースのトリガーで請求書・会社の更新と同期するため、
+queryset.update() や bulk_create でもずれない。
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+SEARCH_TABLE = 'invoice_search'
+
+# trigram トークナイザは3文字未満の検索語をインデックスで扱えない
+MIN_QUERY_LENGTH = 3
+
+CREATE_TABLE_SQL = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+    invoice_number, auto_number, company_name, description,
+    tokenize = 'trigram'
+)
+"""
+
+_INSERT_ROW_SQL = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, invoice_number, auto_number, company_name, description)
+    SELECT new.id, new.invoice_number, new.auto_number, c.name, new.description
+    FROM invoice_management_company c WHERE c.id = new.company_id;
+"""
+
+TRIGGER_SQL = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_invoice_ai
+    AFTER INSERT ON invoice_management_invoice BEGIN
+        {_INSERT_ROW_SQL}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_invoice_ad
+    AFTER DELETE ON invoice_management_invoice BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_invoice_au
+    AFTER UPDATE OF invoice_number, auto_number, company_id, description
+    ON invoice_management_invoice
+    WHEN old.invoice_number IS NOT new.invoice_number
+      OR old.auto_number IS NOT new.auto_number
+      OR old.company_id IS NOT new.company_id
+      OR old.description IS NOT new.description
+    BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        {_INSERT_ROW_SQL}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_company_au
+    AFTER UPDATE OF name ON invoice_management_company
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE {SEARCH_TABLE} SET company_name = new.name
+        WHERE rowid IN (SELECT id FROM invoice_management_invoice WHERE company_id = new.id);
+    END
+    """,
+]
+
+DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_invoice_ai',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_invoice_ad',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_invoice_au',
+    f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_company_au',
+    f'DROP TABLE IF EXISTS {SEARCH_TABLE}',
+]
+
+REBUILD_SQL = [
+    f'DELETE FROM {SEARCH_TABLE}',
+    f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, invoice_number, auto_number, company_name, description)
+    SELECT i.id, i.invoice_number, i.auto_number, c.name, i.description
+    FROM invoice_management_invoice i
+    JOIN invoice_management_company c ON c.id = i.company_id
+    """,
+]
+
+
+def install(cursor):
+    """検索テーブルとトリガーを作成し、索引を作り直す
+
+    SQLiteのテーブル再作成を伴うマイグレーションでは請求書テーブルのトリガーが
+    消えるため、そうしたマイグレーションの後にも呼び出す。
+    """
+    cursor.execute(CREATE_TABLE_SQL)
+    for sql in TRIGGER_SQL:
+        cursor.execute(sql)
+    for sql in REBUILD_SQL:
+        cursor.execute(sql)
+
+
+def install_if_supported(apps, schema_editor):
+    """マイグレーション用：FTS5が使えるSQLiteの場合のみ検索テーブルを作成"""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+            return
+        install(cursor)
+
+
+def uninstall(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for sql in DROP_SQL:
+            cursor.execute(sql)
+
+
+_available = {}
+
+
+def fts_available(using='default'):
+    """検索テーブルが使えるか（一度確認できたら以後は問い合わせない）"""
+    if _available.get(using):
+        return True
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [SEARCH_TABLE],
+        )
+        available = cursor.fetchone() is not None
+    if available:
+        _available[using] = True
+    return available
+
+
+def search_invoices(invoices, query):
+    """請求書クエリセットを検索語で絞り込む
+
+    FTS5の索引が使えない場合や検索語が短い場合は、従来どおり
+    各フィールドの部分一致（icontains）で検索する。
+    """
+    if len(query) >= MIN_QUERY_LENGTH and fts_available(invoices.db):
+        # 検索語全体を1つのフレーズとして扱う（部分一致）
+        phrase = '"' + query.replace('"', '""') + '"'
+        return invoices.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            [phrase],
+        ))
+
+    return invoices.filter(
+        Q(invoice_number__icontains=query) |
+        Q(auto_number__icontains=query) |
+        Q(company__name__icontains=query) |
+        Q(description__icontains=query)
+    )
@@ -0,0 +1,111 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Company, DataVersion, Invoice, InvoiceMonthlyRollup
+
+
+# 保存時に月次集計が変わりうるフィールド（update_fields の判定用）
+ROLLUP_UPDATE_FIELDS = frozenset({'company', 'company_id', 'invoice_date', 'payment_status', 'amount', 'tax_amount'})
+
+
+@receiver(pre_save, sender=Invoice)
+def read_rollup_state_before_save(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    """保存前の集計キーと金額を、保存と同じトランザクション内でデータベースから読み込む"""
+    if raw:
+        return
+    if update_fields is not None and not ROLLUP_UPDATE_FIELDS & update_fields:
+        instance._stored_rollup_state = None
+    elif instance.pk is None:
+        instance._stored_rollup_state = None
+    else:
+        instance._stored_rollup_state = Invoice.stored_rollup_state(instance.pk, using)
+
+
+@receiver(post_save, sender=Invoice)
+def update_rollup_on_save(sender, instance, created, raw=False, using=None, update_fields=None, **kwargs):
+    """請求書の登録・更新に合わせて月次集計を差分更新"""
+    if raw:
+        return
+
+    old_state = instance.__dict__.pop('_stored_rollup_state', None)
+    if created:
+        old_state = None
+    elif old_state is None:
+        # 集計に関わるフィールドを保存していない
+        return
+    if update_fields is None:
+        new_state = instance.rollup_state()
+    else:
+        # 保存していないフィールドはインスタンスの値がデータベースと違うことがある
+        new_state = Invoice.stored_rollup_state(instance.pk, using)
+    if old_state != new_state:
+        if old_state is not None:
+            old_key, old_amount, old_total = old_state
+            InvoiceMonthlyRollup.apply_delta(old_key, -1, -old_amount, -old_total)
+        new_key, new_amount, new_total = new_state
+        InvoiceMonthlyRollup.apply_delta(new_key, 1, new_amount, new_total)
+
+
+def deleted_by_cascade(origin):
+    """請求書の削除が、取引先会社・ユーザーの削除による連鎖削除か
+
+    連鎖削除では請求書ごとに集計を更新せず、起点の削除（下の受信関数）でまとめて反映する。
+    取引先会社の月次集計は、会社の削除で集計行ごと連鎖削除される。
+    """
+    if origin is None:
+        return False
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is not Invoice
+
+
+@receiver(pre_delete, sender=Invoice)
+def read_rollup_state_before_delete(sender, instance, using=None, origin=None, **kwargs):
+    """削除前の集計キーと金額を、削除と同じトランザクション内でデータベースから読み込む"""
+    if deleted_by_cascade(origin):
+        return
+    instance._stored_rollup_state = Invoice.stored_rollup_state(instance.pk, using)
+
+
+@receiver(post_delete, sender=Invoice)
+def update_rollup_on_delete(sender, instance, **kwargs):
+    """請求書の削除に合わせて月次集計を差分更新"""
+    state = instance.__dict__.pop('_stored_rollup_state', None)
+    if state is not None:
+        key, amount, total = state
+        InvoiceMonthlyRollup.apply_delta(key, -1, -amount, -total)
+
+
+@receiver(pre_delete, sender=User)
+def subtract_rollups_on_user_delete(sender, instance, using=None, **kwargs):
+    """ユーザーの削除で連鎖削除される請求書（登録者）の分を、月次集計から1回でまとめて差し引く"""
+    totals = InvoiceMonthlyRollup.totals_by_key(Invoice.objects.using(using).filter(registered_by=instance))
+    InvoiceMonthlyRollup.apply_deltas({
+        key: (-count, -amount, -total_amount) for key, (count, amount, total_amount) in totals.items()
+    })
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def bump_data_version(sender, raw=False, **kwargs):
+    """請求書・取引先会社の更新でキャッシュのデータバージョン（モデルの DATA_VERSIONS）を進める
+
+    DataVersion.bump はトランザクションのコミット後に名前ごとに1回だけ進めるため、
+    連鎖削除などで行ごとに呼ばれても更新は1回になる。
+    """
+    if not raw:
+        for name in sender.DATA_VERSIONS:
+            DataVersion.bump(name)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, raw=False, update_fields=None, **kwargs):
+    """ユーザーの追加・更新・削除でユーザー一覧の件数のキャッシュを無効にする（ログイン日時の更新は除く）
+
+    User の bulk_create・update() はシグナルを通らないため、呼び出し側で DataVersion.USERS を進める。
+    """
+    if not raw and update_fields != frozenset({'last_login'}):
+        DataVersion.bump(DataVersion.USERS)
@@ -0,0 +1,101 @@
+"""SQLiteの本番向け設定
+
+複数のワーカーから同時に読み書きしても「database is locked」にならないようにする。
+
+- 接続ごとにPRAGMAを設定する（connection_created シグナル）。既定（DEFAULT_PRAGMAS）は
+  接続の間だけ有効な設定で、データベースファイルは変更しない。
+- WALモード（WAL_PRAGMAS）は SQLITE_PRAGMAS で明示したときだけ使う。ファイルに記録される設定で、
+  -wal / -shm ファイルも作られるため、manage.py の実行ごとに勝手に切り替えない。
+  WALでは書き込み中も読み込みがブロックされず、synchronous=NORMAL でもデータベースが
+  壊れることはない（電源断で直前のコミットが失われることはある）。
+- 書き込みのトランザクションは BEGIN IMMEDIATE で始める（settings.DATABASES の OPTIONS）。
+  読み込みから書き込みへの昇格で起きるロックの競合を避け、busy_timeout の待機が効くようにする。
+- それでもロックで失敗した書き込み処理は retry_on_lock で間隔を広げながら数回まで再実行する。
+  再実行するのは1つのトランザクションで完結する処理だけにする（途中までの書き込みがコミット済みだと
+  二重に登録される）。書き込みを行うビューは retry_write_view で処理全体を1つのトランザクションにする。
+
+設定（settings.py、いずれも省略可）:
+    SQLITE_PRAGMAS           接続ごとに設定するPRAGMA（既定 DEFAULT_PRAGMAS、空の辞書で無効）。
+                             本番のWAL: {**DEFAULT_PRAGMAS, **WAL_PRAGMAS}
+    SQLITE_LOCK_RETRIES      ロックで失敗したときの再実行回数（既定 3）
+    SQLITE_LOCK_RETRY_DELAY  最初の再実行までの待ち時間（秒、既定 0.05。再実行ごとに2倍）
+"""
+import time
+from functools import wraps
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+
+DEFAULT_PRAGMAS = {
+    # ロックの解放を待つ時間（ミリ秒）
+    'busy_timeout': 5000,
+    # ページキャッシュ（負の値はKB単位、64MB）
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+# WALモード（データベースファイルの設定が変わるため、SQLITE_PRAGMAS で明示したときだけ使う）
+WAL_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+}
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """connection_created シグナルの受信：SQLiteの新しい接続にPRAGMAを設定する"""
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            # メモリ上のデータベース（テスト）はWALにできず、読み取り専用の接続では変更できない
+            if name == 'journal_mode' and (connection.is_in_memory_db() or 'mode=ro' in str(connection.settings_dict['NAME'])):
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def is_lock_error(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def retry_on_lock(func):
+    """「database is locked」で失敗した処理を間隔を広げながら数回まで再実行するデコレーター
+
+    トランザクションの途中（atomic ブロックの内側）では再実行せず、そのまま例外を送出する。
+    1つのトランザクションで完結する処理（atomic な関数、管理画面の追加・変更・削除のビュー）に付ける。
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'SQLITE_LOCK_RETRIES', 3)
+        delay = getattr(settings, 'SQLITE_LOCK_RETRY_DELAY', 0.05)
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not is_lock_error(e) or attempt >= retries or transaction.get_connection().in_atomic_block:
+                    raise
+            time.sleep(delay * 2 ** attempt)
+            attempt += 1
+    return wrapper
+
+
+def retry_write_view(view):
+    """書き込みを行うビューのデコレーター
+
+    POST などの処理全体を1つのトランザクションで実行し、ロックで失敗したらロールバックしてから
+    retry_on_lock で最初からやり直す。保存後のシグナル（DataVersion.bump など）で失敗しても、
+    先にコミットされた登録が再実行で二重になることはない。
+    GET・HEAD はフォームを表示するだけなので、トランザクションを使わない（書き込みロックを取らない）。
+    入力エラーのフォームは TemplateResponse で返すと、描画がトランザクションの終了後になり、
+    テンプレートの描画中に書き込みロックを持ち続けない。
+    """
+    atomic_view = retry_on_lock(transaction.atomic(view))
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        return atomic_view(request, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,35 @@
+"""描画時間を計測するテンプレートバックエンド
+
+PerformanceMiddleware が有効なリクエストでのみ、テンプレートの描画時間を
+計測値に加算する。描画中に評価された遅延クエリセットのSQL時間は差し引く。
+"""
+import time
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from .middleware import current_stats
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current_stats.get()
+        if stats is None:
+            return super().render(context, request)
+
+        start = time.perf_counter()
+        sql_before = stats.sql_seconds
+        try:
+            return super().render(context, request)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.render_seconds += elapsed - (stats.sql_seconds - sql_before)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
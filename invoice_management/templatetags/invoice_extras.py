@@ -1,4 +1,5 @@
 from django import template
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 from urllib.parse import urlencode
 
 register = template.Library()
@@ -24,6 +25,18 @@ def mul(value, arg):
     except ValueError:
         return 0
 
+@register.filter
+def yen(value):
+    """円表示フィルター（1円未満は四捨五入し、3桁区切りで「¥」を付ける）"""
+    if value is None or value == '':
+        return ''
+    if not isinstance(value, int):
+        try:
+            value = int(Decimal(str(value)).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+        except (InvalidOperation, ValueError):
+            return value
+    return f'¥{value:,}'
+
 @register.filter
 def max_value(dictionary):
     """辞書の最大値を取得"""
@@ -1,3 +1,731 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import F, QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.signals import template_rendered
+from django.urls import reverse
+from . import search
+from .companies import CompanyDirectory, prefix_q
+from .fields import YenFormField, parse_yen
+from .forms import CompanyChoiceField
+from .jobs import REPORT_JOBS, run_job
+from .models import Company, DataVersion, Invoice, InvoiceMonthlyRollup, InvoiceSequence, ReportJob
+from .pagination import KeysetPaginator
+from .routers import capture_queries
 
-# Create your tests here.
+
+class InvoiceSequenceTests(TestCase):
+    """請求書自動連番の採番"""
+
+    def test_format_number(self):
+        self.assertEqual(InvoiceSequence.format_number(2025, 1), 'INV2025-0001')
+        self.assertEqual(InvoiceSequence.format_number(2025, 12345), 'INV2025-12345')
+
+    def test_reserve_blocks(self):
+        self.assertEqual(InvoiceSequence.reserve(2030, 5), range(1, 6))
+        self.assertEqual(InvoiceSequence.reserve(2030), range(6, 7))
+        self.assertEqual(InvoiceSequence.reserve(2031, 2), range(1, 3))
+        with self.assertRaises(ValueError):
+            InvoiceSequence.reserve(2030, 0)
+
+    def test_first_reserve_continues_from_existing_numbers(self):
+        user = User.objects.create_user('staff', password='password')
+        company = Company.objects.create(name='テスト商事')
+        for auto_number in ('INV2030-0042', 'INV2030-10000', 'INV2030-abc', 'INV2029-20000'):
+            Invoice.objects.create(
+                auto_number=auto_number, company=company, amount=1000,
+                invoice_date=date(2030, 1, 1), due_date=date(2030, 1, 31), registered_by=user,
+            )
+        self.assertEqual(InvoiceSequence.reserve(2030, 2), range(10001, 10003))
+        self.assertEqual(InvoiceSequence.format_number(2030, 10001), 'INV2030-10001')
+
+    def test_first_reserve_after_another_worker_created_the_row(self):
+        InvoiceSequence.objects.create(year=2030, last_number=7)
+        update = QuerySet.update
+        calls = []
+
+        def update_before_row_exists(queryset, **kwargs):
+            # 最初の UPDATE の時点では、他のワーカーがまだ行を作成していなかったことにする
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_before_row_exists):
+            self.assertEqual(InvoiceSequence.reserve(2030, 3), range(8, 11))
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(InvoiceSequence.objects.get(year=2030).last_number, 10)
+
+
+class YenTests(SimpleTestCase):
+    """円金額の変換と入力欄"""
+
+    def test_parse_yen(self):
+        for value, expected in [
+            (1000, 1000), ('1,000', 1000), (' 1,234,567 ', 1234567), ('1000.00', 1000),
+            (Decimal('1500.0'), 1500), ('¥1,000', 1000), ('￥１，０００', 1000), ('-1,000', -1000), ('0', 0),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(parse_yen(value), expected)
+        for value in ('1000.5', Decimal('0.01'), 'abc', '', None, 'NaN', 'Infinity'):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_yen(value)
+
+    def test_form_field(self):
+        field = YenFormField()
+        for value, expected in [('1,000', 1000), ('¥12,345', 12345), ('￥１，０００', 1000), ('-500', -500)]:
+            with self.subTest(value=value):
+                self.assertEqual(field.clean(value), expected)
+        for value in ('1000.5', '1,000.01', '千円'):
+            with self.subTest(value=value), self.assertRaises(ValidationError):
+                field.clean(value)
+        self.assertIsInstance(Invoice._meta.get_field('amount').formfield(), YenFormField)
+
+
+class InvoiceRollupTests(TestCase):
+    """請求書の登録・更新・削除と月次集計の整合性"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        cls.company = Company.objects.create(name='テスト商事')
+        cls.other_company = Company.objects.create(name='サンプル工業')
+
+    def create_invoice(self, **kwargs):
+        values = {
+            'company': self.company,
+            'amount': 10000,
+            'tax_amount': 1000,
+            'invoice_date': date(2024, 4, 10),
+            'due_date': date(2024, 5, 31),
+            'registered_by': self.user,
+        }
+        values.update(kwargs)
+        return Invoice.objects.create(**values)
+
+    def rollup(self, company, year, month, payment_status):
+        return InvoiceMonthlyRollup.objects.filter(
+            company=company, year=year, month=month, payment_status=payment_status,
+        ).values_list('invoice_count', 'amount_sum', 'total_amount_sum').first()
+
+    def assertRollupsConsistent(self):
+        changed, missing, stale = InvoiceMonthlyRollup.drifted()
+        self.assertEqual((changed, missing, stale), ([], [], []))
+
+    def test_create(self):
+        self.create_invoice()
+        self.create_invoice(amount=5000, tax_amount=500)
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (2, 15000, 16500))
+        self.assertRollupsConsistent()
+
+    def test_edit_amount_date_and_company(self):
+        invoice = self.create_invoice()
+        invoice.amount = 20000
+        invoice.invoice_date = date(2024, 6, 1)
+        invoice.company = self.other_company
+        invoice.save()
+        self.assertIsNone(self.rollup(self.company, 2024, 4, 'pending'))
+        self.assertEqual(self.rollup(self.other_company, 2024, 6, 'pending'), (1, 20000, 21000))
+        self.assertRollupsConsistent()
+
+    def test_status_change(self):
+        invoice = self.create_invoice()
+        self.create_invoice()
+        invoice.payment_status = 'paid'
+        invoice.save()
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'paid'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_status_change_with_update_fields(self):
+        invoice = self.create_invoice()
+        invoice.payment_status = 'paid'
+        invoice.save(update_fields=['payment_status'])
+        invoice.description = '摘要'
+        invoice.save(update_fields=['description'])
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'paid'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_delete(self):
+        invoice = self.create_invoice()
+        self.create_invoice()
+        invoice.delete()
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_delete_after_refresh_from_db(self):
+        invoice = self.create_invoice()
+        self.create_invoice()
+        Invoice.objects.filter(pk=invoice.pk).update(payment_status='paid')
+        InvoiceMonthlyRollup.repair()
+        invoice.refresh_from_db()
+        invoice.delete()
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertIsNone(self.rollup(self.company, 2024, 4, 'paid'))
+        self.assertRollupsConsistent()
+
+    def test_concurrent_saves_from_two_instances(self):
+        invoice = self.create_invoice()
+        first = Invoice.objects.get(pk=invoice.pk)
+        second = Invoice.objects.get(pk=invoice.pk)
+        first.payment_status = 'paid'
+        first.save()
+        # second は支払済みになる前の状態を読み込んでいる
+        second.payment_status = 'overdue'
+        second.save()
+        self.assertIsNone(self.rollup(self.company, 2024, 4, 'pending'))
+        self.assertIsNone(self.rollup(self.company, 2024, 4, 'paid'))
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'overdue'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_save_existing_row_from_new_instance(self):
+        invoice = self.create_invoice()
+        copy = Invoice(
+            pk=invoice.pk,
+            auto_number=invoice.auto_number,
+            company=self.company,
+            amount=10000,
+            tax_amount=1000,
+            invoice_date=invoice.invoice_date,
+            due_date=invoice.due_date,
+            payment_status='paid',
+            registered_by=self.user,
+            created_at=invoice.created_at,
+        )
+        copy.save()
+        self.assertIsNone(self.rollup(self.company, 2024, 4, 'pending'))
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'paid'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_save_with_deferred_fields(self):
+        invoice = self.create_invoice()
+        deferred = Invoice.objects.only('id', 'description').get(pk=invoice.pk)
+        deferred.description = '摘要'
+        deferred.save()
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_company_delete_cascade(self):
+        self.create_invoice()
+        self.create_invoice(payment_status='paid')
+        self.create_invoice(company=self.other_company)
+        company_id = self.company.pk
+        self.company.delete()
+        self.assertFalse(InvoiceMonthlyRollup.objects.filter(company_id=company_id).exists())
+        self.assertEqual(self.rollup(self.other_company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+
+    def test_user_delete_cascade(self):
+        other_user = User.objects.create_user('other', password='password')
+        self.create_invoice()
+        self.create_invoice(registered_by=other_user)
+        self.create_invoice(registered_by=other_user, company=self.other_company, payment_status='paid')
+        other_user.delete()
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertIsNone(self.rollup(self.other_company, 2024, 4, 'paid'))
+        self.assertRollupsConsistent()
+
+    def test_cascade_delete_bumps_data_version_once(self):
+        other_user = User.objects.create_user('other', password='password')
+        for _ in range(5):
+            self.create_invoice(registered_by=other_user)
+        version = DataVersion.current()
+        with capture_queries() as captured, self.captureOnCommitCallbacks(execute=True):
+            other_user.delete()
+        self.assertEqual(DataVersion.current(), version + 1)
+        bumped = [
+            query['params'][-1] for query in captured
+            if query['sql'].startswith('UPDATE "invoice_management_dataversion"')
+        ]
+        # 請求書5件の削除でも REPORTS（請求書）と USERS（ユーザー）は1回ずつ
+        self.assertEqual(bumped.count(DataVersion.REPORTS), 1)
+        self.assertEqual(bumped.count(DataVersion.USERS), 1)
+        self.assertRollupsConsistent()
+
+    def test_sweep_overdue(self):
+        self.create_invoice(due_date=date(2024, 5, 31))
+        self.create_invoice(due_date=date(2024, 6, 30))
+        self.create_invoice(due_date=date(2024, 5, 1), payment_status='paid')
+        self.assertEqual(Invoice.sweep_overdue(today=date(2024, 6, 1)), 1)
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'pending'), (1, 10000, 11000))
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'overdue'), (1, 10000, 11000))
+        self.assertRollupsConsistent()
+        self.assertEqual(Invoice.sweep_overdue(today=date(2024, 6, 1)), 0)
+
+    def test_sweep_overdue_only_flips_past_due_pending(self):
+        past_due = [
+            self.create_invoice(due_date=date(2024, 5, 31)),
+            self.create_invoice(company=self.other_company, invoice_date=date(2024, 3, 5), due_date=date(2024, 4, 30)),
+        ]
+        untouched = [
+            # 支払期限の当日はまだ延滞にしない
+            self.create_invoice(due_date=date(2024, 6, 1)),
+            self.create_invoice(due_date=date(2024, 5, 1), payment_status='paid'),
+            self.create_invoice(due_date=date(2024, 5, 1), payment_status='overdue'),
+        ]
+        self.assertEqual(Invoice.sweep_overdue(today=date(2024, 6, 1)), 2)
+        for invoice, status in zip(past_due + untouched, ['overdue', 'overdue', 'pending', 'paid', 'overdue']):
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.payment_status, status)
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'overdue'), (2, 20000, 22000))
+        self.assertEqual(self.rollup(self.other_company, 2024, 3, 'overdue'), (1, 10000, 11000))
+        self.assertIsNone(self.rollup(self.other_company, 2024, 3, 'pending'))
+        self.assertRollupsConsistent()
+
+    def test_sweep_overdue_advances_data_version(self):
+        self.create_invoice(due_date=date(2024, 5, 31))
+        version = DataVersion.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            Invoice.sweep_overdue(today=date(2024, 6, 1))
+        self.assertEqual(DataVersion.current(), version + 1)
+        # 延滞にする請求書がなければ進めない
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Invoice.sweep_overdue(today=date(2024, 6, 1)), 0)
+        self.assertEqual(DataVersion.current(), version + 1)
+
+    def test_sweep_overdue_command(self):
+        invoice = self.create_invoice(due_date=date(2024, 5, 31))
+        out = StringIO()
+        call_command('sweep_overdue', date='2024-06-01', stdout=out)
+        self.assertIn('1件の請求書を延滞にしました', out.getvalue())
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.payment_status, 'overdue')
+        self.assertRollupsConsistent()
+        with self.assertRaises(CommandError):
+            call_command('sweep_overdue', date='2024/06/01', stdout=StringIO())
+
+    def test_queryset_update_with_constants(self):
+        self.create_invoice()
+        self.create_invoice(amount=5000, tax_amount=500, payment_status='paid')
+        Invoice.objects.filter(amount__lt=8000).update(company=self.other_company, amount='7,000')
+        Invoice.objects.filter(payment_status='pending').update(invoice_date='2024-05-20', tax_amount=0)
+        self.assertEqual(self.rollup(self.company, 2024, 5, 'pending'), (1, 10000, 10000))
+        self.assertEqual(self.rollup(self.other_company, 2024, 4, 'paid'), (1, 7000, 7500))
+        self.assertIsNone(self.rollup(self.company, 2024, 4, 'pending'))
+        self.assertRollupsConsistent()
+
+    def test_queryset_update_with_expressions(self):
+        self.create_invoice()
+        self.create_invoice(amount=5000, tax_amount=500)
+        # 変更後に絞り込みの条件から外れる行も差分を反映する
+        Invoice.objects.filter(amount__lt=8000).update(amount=F('amount') * 2, payment_status='paid')
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'paid'), (1, 10000, 10500))
+        self.assertRollupsConsistent()
+
+    def test_bulk_update(self):
+        invoices = [self.create_invoice(), self.create_invoice(amount=5000)]
+        invoices[0].payment_status = 'paid'
+        invoices[1].invoice_date = date(2024, 7, 1)
+        Invoice.objects.bulk_update(invoices, ['payment_status', 'invoice_date'])
+        self.assertEqual(self.rollup(self.company, 2024, 4, 'paid'), (1, 10000, 11000))
+        self.assertEqual(self.rollup(self.company, 2024, 7, 'pending'), (1, 5000, 6000))
+        self.assertRollupsConsistent()
+
+
+# テストのトランザクション内のデータは reports の接続から読めないため、レポート画面も default から読む
+@override_settings(REPORTS_DATABASE_MAX_LAG=-1)
+class InvoiceImportTests(TestCase):
+    """CSV出力（invoice_export）と一括登録（import_invoices）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        # 同じ会社名でも会社コードで区別して取り込む
+        cls.companies = [Company.objects.create(name='テスト商事') for _ in range(2)]
+        for index, company in enumerate(cls.companies * 2):
+            Invoice.objects.create(
+                company=company,
+                invoice_number=f'INV-{index}',
+                amount=10000 + index,
+                tax_amount=1000,
+                invoice_date=date(2024, 4, 10),
+                due_date=date(2024, 5, 31),
+                payment_status='paid' if index % 2 else 'pending',
+                registered_by=cls.user,
+            )
+
+    def test_reimport_export(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('invoice_export'))
+        self.assertEqual(response.status_code, 200)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'invoices.csv')
+            with open(path, 'wb') as f:
+                f.write(b''.join(response.streaming_content))
+            call_command('import_invoices', path, user='staff', stdout=StringIO())
+            with open(f'{path}.rejects.csv', encoding='utf-8-sig') as f:
+                self.assertEqual(len(f.readlines()), 1)
+
+        exported = Invoice.objects.values_list(
+            'invoice_number', 'company_id', 'amount', 'tax_amount', 'invoice_date', 'due_date', 'payment_status',
+        ).order_by('id')
+        self.assertEqual(Invoice.objects.count(), 8)
+        self.assertEqual(sorted(exported[:4]), sorted(exported[4:]))
+        self.assertEqual(InvoiceMonthlyRollup.drifted(), ([], [], []))
+
+
+class KeysetPaginatorTests(TestCase):
+    """キーセットページネーション（並び順の先頭のフィールドが重複する場合を含む）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('staff', password='password')
+        company = Company.objects.create(name='テスト商事')
+        for index in range(8):
+            invoice = Invoice.objects.create(
+                company=company, amount=1000, invoice_date=date(2024, 4, 1), due_date=date(2024, 4, 30),
+                registered_by=user,
+            )
+            # 作成日時を2件ずつ同じにする
+            Invoice.objects.filter(pk=invoice.pk).update(created_at=f'2024-04-0{index // 2 + 1} 09:00:00+00:00')
+
+    def test_walk_forward_and_backward(self):
+        paginator = KeysetPaginator(Invoice.objects.all(), ('-created_at', '-id'), per_page=3)
+        expected = list(Invoice.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        pages = [paginator.get_page()]
+        while pages[-1].has_next:
+            pages.append(paginator.get_page(after=pages[-1].next_cursor))
+        self.assertEqual([invoice.id for page in pages for invoice in page], expected)
+
+        page = pages[-1]
+        backward = [[invoice.id for invoice in page]]
+        while page.has_previous:
+            page = paginator.get_page(before=page.previous_cursor)
+            backward.insert(0, [invoice.id for invoice in page])
+        self.assertEqual([invoice_id for ids in backward for invoice_id in ids], expected)
+
+
+class InvoiceListConditionalGetTests(TestCase):
+    """請求書一覧の条件付きGET"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        cls.invoice = Invoice.objects.create(
+            company=Company.objects.create(name='テスト商事'), amount=1000,
+            invoice_date=date(2024, 4, 1), due_date=date(2024, 4, 30), registered_by=cls.user,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, etag=None, **params):
+        headers = {'if-none-match': etag} if etag else {}
+        return self.client.get(reverse('invoice_list'), params, headers=headers)
+
+    def test_not_modified_without_aggregating_invoices(self):
+        etag = self.get(search='テスト')['ETag']
+        with capture_queries() as captured:
+            response = self.get(etag, search='テスト')
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in captured if 'invoice_management_invoice"' in query['sql']])
+        # 検索条件が違えば別の検証子になる
+        self.assertEqual(self.get(etag, search='商事').status_code, 200)
+
+    def test_modified_after_invoice_or_user_change(self):
+        # データバージョンはコミット後に進む
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.invoice.save()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+        etag = self.get()['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.last_name = '山田'
+            self.user.save()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+
+class CompanySearchTests(TestCase):
+    """取引先会社のオートコンプリート・前方一致・選択欄"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        cls.companies = {
+            name: Company.objects.create(name=name, code=code, invoice_number=invoice_number)
+            for name, code, invoice_number in [
+                ('テスト商事', 'C0001', '1234567890123'),
+                ('テスト工業', 'C0002', ''),
+                ('株式会社テストサービス', 'C0003', ''),
+                ('サンプル物産', 'X0001', '9876543210987'),
+            ]
+        }
+
+    def setUp(self):
+        # テストごとにデータバージョンが巻き戻るため、前のテストの検索結果を使わない
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def autocomplete(self, **params):
+        response = self.client.get(reverse('company_autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [row['name'] for row in data['results']], data['more']
+
+    def test_autocomplete(self):
+        # 前方一致の後に会社名の部分一致で補う
+        self.assertEqual(self.autocomplete(q='テスト'), (['テスト工業', 'テスト商事', '株式会社テストサービス'], False))
+        # 会社コードは小文字でも探せる
+        self.assertEqual(self.autocomplete(q='x00'), (['サンプル物産'], False))
+        self.assertEqual(self.autocomplete(q='98765'), (['サンプル物産'], False))
+        self.assertEqual(self.autocomplete(q='存在しない'), ([], False))
+
+    def test_autocomplete_limit(self):
+        # 空の検索語はコードの新しい順
+        self.assertEqual(self.autocomplete(limit=2), (['サンプル物産', '株式会社テストサービス'], True))
+        self.assertEqual(self.autocomplete(limit=0), (['サンプル物産'], True))
+        self.assertEqual(self.autocomplete(limit='abc'), (
+            ['サンプル物産', '株式会社テストサービス', 'テスト工業', 'テスト商事'], False,
+        ))
+
+    def test_prefix_q(self):
+        for name in ('ab', 'abc', 'ab\U0010fffe', 'aa\U0010ffff', 'ac', 'AB'):
+            Company.objects.create(name=name)
+        names = Company.objects.filter(name__in=['ab', 'abc', 'ab\U0010fffe', 'aa\U0010ffff', 'ac', 'AB'])
+        self.assertEqual(
+            set(names.filter(prefix_q('name', 'ab')).values_list('name', flat=True)),
+            {'ab', 'abc', 'ab\U0010fffe'},
+        )
+        # 空の前方一致はすべての行に一致する
+        self.assertEqual(names.filter(prefix_q('name', '')).count(), 6)
+
+    def test_company_choice_field(self):
+        field = CompanyChoiceField(queryset=Company.objects.all())
+        company = self.companies['テスト商事']
+        with mock.patch('invoice_management.forms.company_directory', CompanyDirectory(recheck_seconds=0)):
+            cleaned = field.clean(str(company.pk))
+            self.assertEqual((cleaned.pk, cleaned.name), (company.pk, 'テスト商事'))
+            for value in ('0', '999999', 'abc', '1.5'):
+                with self.subTest(value=value), self.assertRaises(ValidationError):
+                    field.clean(value)
+            self.assertIsNone(CompanyChoiceField(queryset=Company.objects.all(), required=False).clean(''))
+
+
+class InvoiceSearchTests(TestCase):
+    """請求書の全文検索（FTS5）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        cls.company = Company.objects.create(name='テスト商事')
+
+    def setUp(self):
+        if not search.fts_available():
+            self.skipTest('FTS5 が使えないSQLite')
+
+    def create_invoice(self, **kwargs):
+        return Invoice.objects.create(
+            company=self.company, amount=1000, invoice_date=date(2024, 4, 1),
+            due_date=date(2024, 4, 30), registered_by=self.user, **kwargs,
+        )
+
+    def search(self, query):
+        return set(search.search_invoices(Invoice.objects.all(), query))
+
+    def test_triggers_exist_after_migrations(self):
+        # 0010・0011 は請求書テーブルを作り直すため、その後にトリガーを作り直している
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                [search.SEARCH_TABLE + '_%'],
+            )
+            triggers = {row[0] for row in cursor.fetchall()}
+        self.assertEqual(triggers, {
+            'invoice_search_invoice_ai', 'invoice_search_invoice_ad',
+            'invoice_search_invoice_au', 'invoice_search_company_au',
+        })
+
+    def test_index_follows_insert_update_and_delete(self):
+        invoice = self.create_invoice(description='事務用品の購入')
+        other = self.create_invoice(description='交通費の精算')
+        self.assertEqual(self.search('事務用品'), {invoice})
+        self.assertEqual(self.search('テスト商'), {invoice, other})
+
+        Invoice.objects.filter(pk=invoice.pk).update(description='会議室の利用料')
+        self.assertEqual(self.search('事務用品'), set())
+        self.assertEqual(self.search('会議室'), {invoice})
+
+        self.company.name = 'サンプル工業'
+        self.company.save()
+        self.assertEqual(self.search('テスト商'), set())
+        self.assertEqual(self.search('サンプル'), {invoice, other})
+
+        invoice.delete()
+        self.assertEqual(self.search('会議室'), set())
+
+    def test_short_query_falls_back_to_icontains(self):
+        invoice = self.create_invoice(invoice_number='A-1', description='事務用品')
+        with capture_queries() as captured:
+            self.assertEqual(self.search('a-'), {invoice})
+            self.assertEqual(self.search('用品'), {invoice})
+        self.assertFalse([query for query in captured if search.SEARCH_TABLE in query['sql']])
+
+    def test_query_is_a_single_phrase(self):
+        invoice = self.create_invoice(description='見積書 "至急" の件')
+        self.create_invoice(description='至急 見積書')
+        self.assertEqual(self.search('"至急"'), {invoice})
+        self.assertEqual(self.search('見積書 "'), {invoice})
+        self.assertEqual(self.search('OR AND NOT'), set())
+
+
+@override_settings(REPORTS_DATABASE_MAX_LAG=-1)
+class ReportConditionalGetTests(TestCase):
+    """レポートの条件付きGET"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        Invoice.objects.create(
+            company=Company.objects.create(name='テスト商事'), amount=1000,
+            invoice_date=date(2024, 4, 1), due_date=date(2024, 4, 30), registered_by=cls.user,
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get(self, etag=None):
+        headers = {'if-none-match': etag} if etag else {}
+        return self.client.get(reverse('monthly_report'), {'year': 2024}, headers=headers)
+
+    def test_not_modified_without_reading_invoices_or_companies(self):
+        etag = self.get()['ETag']
+        with capture_queries() as captured:
+            response = self.get(etag)
+        self.assertEqual(response.status_code, 304)
+        tables = ('invoice_management_invoice"', 'invoice_management_company"')
+        self.assertFalse([query for query in captured if any(table in query['sql'] for table in tables)])
+
+    def test_modified_after_rollup_repair(self):
+        etag = self.get()['ETag']
+        InvoiceMonthlyRollup.objects.update(amount_sum=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(InvoiceMonthlyRollup.repair(), (1, 0, 0))
+        self.assertEqual(self.get(etag).status_code, 200)
+
+
+class RetryWriteViewTests(TransactionTestCase):
+    """ロックで失敗した書き込みのビューの再実行（TestCase はテスト全体がトランザクション内のため使わない）"""
+
+    def test_company_add_is_not_duplicated(self):
+        user = User.objects.create_user('staff', password='password')
+        self.client.force_login(user)
+        bump = DataVersion.bump
+        calls = []
+
+        def bump_once_locked(name=DataVersion.REPORTS):
+            # 会社の保存後のデータバージョンの更新が1回目だけロックで失敗する
+            calls.append(name)
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            bump(name)
+
+        with mock.patch.object(DataVersion, 'bump', side_effect=bump_once_locked):
+            response = self.client.post(reverse('company_add'), {'name': 'テスト商事'})
+        self.assertRedirects(response, reverse('company_list'), fetch_redirect_response=False)
+        self.assertEqual(Company.objects.filter(name='テスト商事').count(), 1)
+
+    def test_invalid_form_is_rendered_after_transaction(self):
+        user = User.objects.create_user('staff', password='password')
+        self.client.force_login(user)
+        rendered_in_transaction = []
+
+        def record(sender, **kwargs):
+            rendered_in_transaction.append(connection.in_atomic_block)
+
+        template_rendered.connect(record)
+        self.addCleanup(template_rendered.disconnect, record)
+        response = self.client.post(reverse('company_add'), {'name': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(rendered_in_transaction)
+        self.assertFalse(any(rendered_in_transaction))
+
+
+class UserCountCacheTests(TestCase):
+    """ユーザー一覧の件数のキャッシュ"""
+
+    def setUp(self):
+        # テストごとにデータバージョンが巻き戻るため、前のテストのキャッシュを使わない
+        cache.clear()
+
+    def test_count_after_bulk_created_users(self):
+        admin = User.objects.create_user('admin', password='password', is_staff=True)
+        self.client.force_login(admin)
+        self.assertEqual(self.client.get(reverse('user_list')).context['page_obj'].total_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'generate_load_data', companies=1, users=3, invoices_per_year=1, years=1, stdout=StringIO(),
+            )
+        self.assertEqual(self.client.get(reverse('user_list')).context['page_obj'].total_count, 4)
+
+
+@override_settings(REPORTS_DATABASE_MAX_LAG=-1)
+class ReportPeriodParamTests(TestCase):
+    """レポートの年・月のGETパラメータ"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_invalid_year_or_month_is_not_found(self):
+        for name in ('monthly_detail_report', 'monthly_detail_report_async', 'report_chart_data'):
+            for params in ({'month': 13}, {'month': 0}, {'year': 0}, {'year': 9999}, {'year': 'abc'}):
+                with self.subTest(name=name, params=params):
+                    self.assertEqual(self.client.get(reverse(name), params).status_code, 404)
+
+    def test_valid_year_and_month(self):
+        response = self.client.get(reverse('monthly_detail_report'), {'year': 2024, 'month': 12})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.context['selected_year'], response.context['selected_month']), (2024, 12))
+
+
+@override_settings(REPORTS_DATABASE_MAX_LAG=-1)
+class ReportJobTests(TestCase):
+    """集計ジョブの実行・結果のダウンロード"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('staff', password='password')
+        cls.other_user = User.objects.create_user('other', password='password')
+
+    def create_job(self, **kwargs):
+        return ReportJob.objects.create(kind='yearly_summary', params={}, requested_by=self.user, **kwargs)
+
+    def test_failure_while_saving_result_marks_job_failed(self):
+        job = self.create_job(status='running')
+        # JSONにできない結果は finish() で失敗する
+        with mock.patch.dict(REPORT_JOBS, {'yearly_summary': lambda params, progress: {'value': object()}}):
+            with self.assertLogs('invoice_management.jobs', 'ERROR'):
+                self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('TypeError', job.message)
+
+    def test_download(self):
+        job = self.create_job()
+        job.finish({'years': []})
+        url = reverse('report_job_download', args=[job.pk])
+        self.client.force_login(self.user)
+        response = self.client.get(url, headers={'accept-encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        for accept_encoding in ('gzip;q=0', 'deflate', 'br, gzip; q=0.0'):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get(url, headers={'accept-encoding': accept_encoding})
+                self.assertFalse(response.has_header('Content-Encoding'))
+                self.assertEqual(response.content, b'{"years":[]}')
+
+        # 他のユーザーが依頼したジョブの結果はダウンロードできない
+        self.client.force_login(self.other_user)
+        self.assertEqual(self.client.get(url).status_code, 404)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # ダッシュボード
@@ -9,6 +9,7 @@ urlpatterns = [
     path('companies/', views.company_list, name='company_list'),
     path('companies/add/', views.company_add, name='company_add'),
     path('companies/<int:pk>/edit/', views.company_edit, name='company_edit'),
+    path('companies/autocomplete/', views.company_autocomplete, name='company_autocomplete'),
     
     # ユーザー関連（管理者のみ）
     path('users/', views.user_list, name='user_list'),
@@ -20,6 +21,7 @@ urlpatterns = [
     # 請求書関連
     path('invoices/', views.invoice_list, name='invoice_list'),
     path('invoices/add/', views.invoice_add, name='invoice_add'),
+    path('invoices/export/', views.invoice_export, name='invoice_export'),
     path('invoices/<int:pk>/', views.invoice_detail, name='invoice_detail'),
     path('invoices/<int:pk>/edit/', views.invoice_edit, name='invoice_edit'),
     
@@ -28,4 +30,19 @@ urlpatterns = [
     path('reports/analytics/', views.analytics_report, name='analytics_report'),
     path('reports/monthly-detail/', views.monthly_detail_report, name='monthly_detail_report'),
     path('reports/company-detail/', views.company_detail_report, name='company_detail_report'),
+    path('reports/chart-data/', views.report_chart_data, name='report_chart_data'),
+    
+    # 集計ジョブ（複数年の集計をワーカーで実行する）
+    path('reports/jobs/', views.report_job_list, name='report_job_list'),
+    path('reports/jobs/submit/', views.report_job_submit, name='report_job_submit'),
+    path('reports/jobs/<int:pk>/', views.report_job_detail, name='report_job_detail'),
+    path('reports/jobs/<int:pk>/progress/', views.report_job_progress, name='report_job_progress'),
+    path('reports/jobs/<int:pk>/download/', views.report_job_download, name='report_job_download'),
+    
+    # 非同期版（ASGIサーバーで集計を同時に実行する。bench_async で同期版と比較する）
+    path('async/', async_views.dashboard, name='dashboard_async'),
+    path('async/reports/analytics/', async_views.analytics_report, name='analytics_report_async'),
+    path('async/reports/monthly-detail/', async_views.monthly_detail_report, name='monthly_detail_report_async'),
+    path('async/reports/company-detail/', async_views.company_detail_report, name='company_detail_report_async'),
+    path('async/reports/chart-data/', async_views.report_chart_data, name='report_chart_data_async'),
 ]
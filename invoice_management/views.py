@@ -2,50 +2,80 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.models import User
-from django.db.models import Sum, Q
-from django.core.paginator import Paginator
+from django.db.models import Q
 from django.contrib.auth import login
-from datetime import datetime, date
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+from datetime import MAXYEAR, MINYEAR, datetime, date, timedelta
 import calendar
-from .models import Company, UserProfile, Invoice
-from .forms import CompanyForm, UserRegistrationForm, UserEditForm, InvoiceForm
+import csv
+import gzip
+from urllib.parse import urlencode
+from .models import Company, DataVersion, UserProfile, Invoice, InvoiceMonthlyRollup, ReportJob
+from .forms import CompanyForm, UserRegistrationForm, UserEditForm, InvoiceForm, ReportJobForm
+from .pagination import KeysetPaginator
+from .search import search_invoices
+from .reports import (
+    chart_data, company_month_matrix, company_yearly_stats, invoice_summary, monthly_detail_stats,
+    normalize_tax_mode, period_bounds, period_invoices, rank_companies, yearly_analytics,
+)
+from .cache import USER_COUNT_CACHE_TIMEOUT, cached_report
+from .jobs import company_year_table
+from .conditional import conditional_page
+from .routers import use_reports_database
+from .sqlite import retry_write_view
+from .companies import AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT, company_directory, prefix_q, search_companies
 
 
 def dashboard(request):
     """ダッシュボード"""
     if request.user.is_authenticated:
-        # 統計情報を取得
-        total_invoices = Invoice.objects.count()
-        pending_invoices = Invoice.objects.filter(payment_status='pending').count()
-        total_amount = Invoice.objects.aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0
-        pending_amount = Invoice.objects.filter(
-            payment_status='pending'
-        ).aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0
+        # 統計情報を取得（月次集計テーブルから）
+        summary = invoice_summary(InvoiceMonthlyRollup.objects.all())
+        pending_summary = invoice_summary(
+            InvoiceMonthlyRollup.objects.filter(payment_status='pending')
+        )
         
         # 最近の請求書
-        recent_invoices = Invoice.objects.select_related('company').order_by('-created_at')[:5]
+        recent_invoices = recent_invoice_list()
         
-        context = {
-            'total_invoices': total_invoices,
-            'pending_invoices': pending_invoices,
-            'total_amount': total_amount,
-            'pending_amount': pending_amount,
-            'recent_invoices': recent_invoices,
-        }
+        context = dashboard_context(summary, pending_summary, recent_invoices)
     else:
         context = {}
     
     return render(request, 'invoice_management/dashboard.html', context)
 
 
+def recent_invoice_list():
+    """ダッシュボードに表示する最近の請求書"""
+    return Invoice.objects.select_related('company').order_by('-created_at')[:5]
+
+
+def dashboard_context(summary, pending_summary, recent_invoices):
+    return {
+        'total_invoices': summary['count'],
+        'pending_invoices': pending_summary['count'],
+        'total_amount': summary['including'],
+        'pending_amount': pending_summary['including'],
+        'recent_invoices': recent_invoices,
+    }
+
+
+def company_list_slices(request):
+    """取引先会社一覧に表示する範囲（条件付きGET用）
+
+    検索結果は範囲を絞れないため、件数の集計ではなくデータバージョンで判定する。
+    """
+    return [DataVersion.COMPANIES]
+
+
 @login_required
+@conditional_page(company_list_slices)
 def company_list(request):
     """取引先会社一覧"""
-    companies = Company.objects.all().order_by('-code')
+    companies = Company.objects.all()
     
     # 検索機能
     search_query = request.GET.get('search')
@@ -55,9 +85,13 @@ def company_list(request):
             Q(code__icontains=search_query)
         )
     
-    paginator = Paginator(companies, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # キーセットページネーション（会社コードの降順）
+    paginator = KeysetPaginator(companies, ('-code', '-id'), per_page=20)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        total_count=None if search_query else Company.objects.count(),
+    )
     
     return render(request, 'invoice_management/company_list.html', {
         'page_obj': page_obj,
@@ -66,6 +100,7 @@ def company_list(request):
 
 
 @login_required
+@retry_write_view
 def company_add(request):
     """取引先会社追加"""
     if request.method == 'POST':
@@ -77,13 +112,14 @@ def company_add(request):
     else:
         form = CompanyForm()
     
-    return render(request, 'invoice_management/company_form.html', {
+    return TemplateResponse(request, 'invoice_management/company_form.html', {
         'form': form,
         'title': '取引先会社登録'
     })
 
 
 @login_required
+@retry_write_view
 def company_edit(request, pk):
     """取引先会社編集"""
     company = get_object_or_404(Company, pk=pk)
@@ -97,13 +133,48 @@ def company_edit(request, pk):
     else:
         form = CompanyForm(instance=company)
     
-    return render(request, 'invoice_management/company_form.html', {
+    return TemplateResponse(request, 'invoice_management/company_form.html', {
         'form': form,
         'title': '取引先会社編集',
         'company': company
     })
 
 
+@login_required
+@conditional_page(company_list_slices)
+def company_autocomplete(request):
+    """取引先会社のオートコンプリート（JSON）
+
+    会社コード・会社名・インボイス番号で検索し、最大 limit 件を返す。
+    """
+    query = request.GET.get('q', '').strip()
+    try:
+        limit = int(request.GET.get('limit', AUTOCOMPLETE_LIMIT))
+    except ValueError:
+        limit = AUTOCOMPLETE_LIMIT
+    limit = max(1, min(limit, AUTOCOMPLETE_MAX_LIMIT))
+    
+    results, more = cached_report(
+        'company_autocomplete', {'q': query, 'limit': limit},
+        lambda: search_companies(query, limit),
+        data_version=DataVersion.COMPANIES,
+    )
+    return JsonResponse({'results': results, 'more': more})
+
+
+def user_search_q(query):
+    """ユーザー検索の条件（いずれもインデックスを使う前方一致）
+
+    ユーザーコードは UserProfile 側で絞り込んだIDを使い、JOIN をまたぐ OR にしない。
+    """
+    names = Q()
+    codes = Q()
+    for prefix in {query, query.lower(), query.upper()}:
+        names |= prefix_q('username', prefix) | prefix_q('last_name', prefix) | prefix_q('first_name', prefix)
+        codes |= prefix_q('user_code', prefix)
+    return names | Q(id__in=UserProfile.objects.filter(codes).values('user_id'))
+
+
 @login_required
 def user_list(request):
     """ユーザー一覧"""
@@ -113,30 +184,33 @@ def user_list(request):
         return redirect('dashboard')
     
     # スーパーユーザーを除外してユーザーを取得
-    users = User.objects.select_related('userprofile').filter(is_superuser=False).order_by('username')
+    users = User.objects.select_related('userprofile').filter(is_superuser=False)
     
-    # 検索機能
-    search_query = request.GET.get('search')
+    # 検索機能（ユーザーコード・ユーザー名・姓・名の前方一致）
+    search_query = request.GET.get('search', '').strip()
     if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) | 
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(userprofile__user_code__icontains=search_query)
-        )
-    
-    paginator = Paginator(users, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        users = users.filter(user_search_q(search_query))
+    
+    # キーセットページネーション（ユーザー名順）。件数は検索していないときだけキャッシュから表示する
+    # （User の update() ではバージョンが進まないため、キャッシュは USER_COUNT_CACHE_TIMEOUT 秒で読み直す）
+    paginator = KeysetPaginator(users, ('username',), per_page=20)
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        total_count=None if search_query else cached_report(
+            'user_count', {}, lambda: User.objects.filter(is_superuser=False).count(),
+            data_version=DataVersion.USERS, timeout=USER_COUNT_CACHE_TIMEOUT,
+        ),
+    )
     
     return render(request, 'invoice_management/user_list.html', {
         'page_obj': page_obj,
-        'users': users,  # テンプレートで使用するため追加
         'search_query': search_query
     })
 
 
 @login_required
+@retry_write_view
 def user_add(request):
     """ユーザー追加（管理者・スーパーユーザーのみ）"""
     # 管理者またはスーパーユーザーのみアクセス可能
@@ -153,13 +227,14 @@ def user_add(request):
     else:
         form = UserRegistrationForm()
     
-    return render(request, 'invoice_management/user_form.html', {
+    return TemplateResponse(request, 'invoice_management/user_form.html', {
         'form': form,
         'title': 'ユーザー追加'
     })
 
 
 @login_required
+@retry_write_view
 def user_edit(request, pk):
     """ユーザー編集"""
     user = get_object_or_404(User, pk=pk)
@@ -209,13 +284,14 @@ def user_edit(request, pk):
             # 管理者も自分の管理者権限は変更できない
             form.fields.pop('is_staff', None)
     
-    return render(request, 'invoice_management/user_form.html', {
+    return TemplateResponse(request, 'invoice_management/user_form.html', {
         'form': form,
         'title': f'ユーザー編集 - {user.username}'
     })
 
 
 @login_required
+@retry_write_view
 def user_delete(request, pk):
     """ユーザー削除"""
     user = get_object_or_404(User, pk=pk)
@@ -245,6 +321,7 @@ def user_delete(request, pk):
 
 
 @login_required
+@retry_write_view
 def user_password_change(request, pk):
     """ユーザーパスワード変更"""
     user = get_object_or_404(User, pk=pk)
@@ -274,81 +351,158 @@ def user_password_change(request, pk):
     return redirect('user_edit', pk=pk)
 
 
-@login_required
-def invoice_list(request):
-    """請求書一覧"""
-    invoices = Invoice.objects.select_related('company', 'registered_by').order_by('-created_at')
+def selected_company_or_none(company_id):
+    """絞り込みで選択中の取引先会社（不正な値は未選択として扱う）"""
+    if not company_id:
+        return None
+    return company_directory.get(company_id)
+
+
+def filter_invoices(request, invoices):
+    """請求書一覧の検索条件（GETパラメータ）でクエリセットを絞り込む
+
+    一覧画面とCSV出力で同じ条件を使う。絞り込んだクエリセットと検索条件の辞書を返す。
+    """
+    filters = {
+        key: request.GET.get(key)
+        for key in ('status', 'company', 'amount_min', 'amount_max', 'date_from', 'date_to', 'search')
+    }
     
     # フィルタリング
-    status_filter = request.GET.get('status')
-    if status_filter:
-        invoices = invoices.filter(payment_status=status_filter)
+    if filters['status']:
+        invoices = invoices.filter(payment_status=filters['status'])
     
-    company_filter = request.GET.get('company')
-    if company_filter:
-        invoices = invoices.filter(company_id=company_filter)
+    if filters['company']:
+        invoices = invoices.filter(company_id=filters['company'])
     
     # 金額範囲検索
-    amount_min = request.GET.get('amount_min')
-    amount_max = request.GET.get('amount_max')
-    if amount_min:
+    if filters['amount_min']:
         try:
-            invoices = invoices.filter(total_amount__gte=amount_min)
+            invoices = invoices.filter(total_amount__gte=filters['amount_min'])
         except ValueError:
             pass
-    if amount_max:
+    if filters['amount_max']:
         try:
-            invoices = invoices.filter(total_amount__lte=amount_max)
+            invoices = invoices.filter(total_amount__lte=filters['amount_max'])
         except ValueError:
             pass
     
     # 請求日範囲検索
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
-    if date_from:
+    if filters['date_from']:
         try:
-            invoices = invoices.filter(invoice_date__gte=date_from)
+            invoices = invoices.filter(invoice_date__gte=filters['date_from'])
         except ValueError:
             pass
-    if date_to:
+    if filters['date_to']:
         try:
-            invoices = invoices.filter(invoice_date__lte=date_to)
+            invoices = invoices.filter(invoice_date__lte=filters['date_to'])
         except ValueError:
             pass
     
     # 検索機能
-    search_query = request.GET.get('search')
-    if search_query:
-        invoices = invoices.filter(
-            Q(invoice_number__icontains=search_query) |
-            Q(auto_number__icontains=search_query) |
-            Q(company__name__icontains=search_query) |
-            Q(description__icontains=search_query)
-        )
+    if filters['search']:
+        # 全文検索（FTS5）の索引を使う。使えない場合は部分一致検索
+        invoices = search_invoices(invoices, filters['search'])
     
-    paginator = Paginator(invoices, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    return invoices, filters
+
+
+def invoice_list_slices(request):
+    """請求書一覧に表示する範囲（条件付きGET用）
+
+    一覧・検索結果は範囲を絞れないため、件数の集計ではなくデータバージョンで判定する
+    （会社名の変更では REPORTS、登録者名の変更では USERS が進む）。
+    """
+    return [DataVersion.REPORTS, DataVersion.USERS]
+
+
+@login_required
+@conditional_page(invoice_list_slices)
+def invoice_list(request):
+    """請求書一覧"""
+    invoices, filters = filter_invoices(
+        request, Invoice.objects.select_related('company', 'registered_by')
+    )
+    status_filter = filters['status']
+    company_filter = filters['company']
+    
+    # キーセットページネーション（作成日時の新しい順）
+    paginator = KeysetPaginator(invoices, ('-created_at', '-id'), per_page=20)
+    
+    # 件数は月次集計テーブルで求められる条件（支払状況・会社）のときだけ表示する
+    total_count = None
+    if not any(filters[key] for key in ('amount_min', 'amount_max', 'date_from', 'date_to', 'search')):
+        rollups = InvoiceMonthlyRollup.objects.all()
+        if status_filter:
+            rollups = rollups.filter(payment_status=status_filter)
+        if company_filter:
+            rollups = rollups.filter(company_id=company_filter)
+        total_count = invoice_summary(rollups)['count']
+    
+    page_obj = paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        total_count=total_count,
+    )
     
-    # フィルタ用のデータ
-    companies = Company.objects.all().order_by('name')
+    # フィルタ用のデータ（会社はオートコンプリートで選ぶため、選択中の会社だけ取得する）
+    selected_company = selected_company_or_none(company_filter)
     status_choices = Invoice.PAYMENT_STATUS_CHOICES
     
     return render(request, 'invoice_management/invoice_list.html', {
         'page_obj': page_obj,
-        'companies': companies,
+        'selected_company': selected_company,
         'status_choices': status_choices,
         'current_status': status_filter,
         'current_company': company_filter,
-        'search_query': search_query,
-        'amount_min': amount_min,
-        'amount_max': amount_max,
-        'date_from': date_from,
-        'date_to': date_to,
+        'search_query': filters['search'],
+        'amount_min': filters['amount_min'],
+        'amount_max': filters['amount_max'],
+        'date_from': filters['date_from'],
+        'date_to': filters['date_to'],
     })
 
 
+class Echo:
+    """csv.writer の出力をそのまま返す疑似バッファ"""
+    def write(self, value):
+        return value
+
+
+@login_required
+@use_reports_database
+def invoice_export(request):
+    """請求書一覧のCSV出力（一覧と同じ検索条件、ストリーミング）"""
+    invoices, _filters = filter_invoices(request, Invoice.objects.all())
+    rows = invoices.order_by('-created_at', '-id').values_list(
+        'auto_number', 'invoice_number', 'company__code', 'company__name',
+        'amount', 'tax_amount', 'total_amount', 'invoice_date', 'due_date',
+        'payment_status', 'description', 'registered_by__username',
+    )
+    status_labels = dict(Invoice.PAYMENT_STATUS_CHOICES)
+    writer = csv.writer(Echo())
+    
+    def generate():
+        # Excelで文字化けしないようBOM付きUTF-8で出力
+        yield '\ufeff'
+        yield writer.writerow([
+            '連番', '請求書番号', '会社コード', '取引先会社', '請求金額', '消費税額',
+            '合計金額', '請求日', '支払期限', '支払状況', '摘要', '登録者',
+        ])
+        # 一定件数ずつ取得し、件数に関係なくメモリ使用量を一定に保つ
+        for row in rows.iterator(chunk_size=2000):
+            row = list(row)
+            row[9] = status_labels.get(row[9], row[9])
+            yield writer.writerow(row)
+    
+    filename = f'invoices_{date.today():%Y%m%d}.csv'
+    response = StreamingHttpResponse(generate(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @login_required
+@retry_write_view
 def invoice_add(request):
     """請求書追加"""
     if request.method == 'POST':
@@ -362,13 +516,14 @@ def invoice_add(request):
     else:
         form = InvoiceForm()
     
-    return render(request, 'invoice_management/invoice_form.html', {
+    return TemplateResponse(request, 'invoice_management/invoice_form.html', {
         'form': form,
         'title': '請求書登録'
     })
 
 
 @login_required
+@retry_write_view
 def invoice_edit(request, pk):
     """請求書編集"""
     invoice = get_object_or_404(Invoice, pk=pk)
@@ -382,7 +537,7 @@ def invoice_edit(request, pk):
     else:
         form = InvoiceForm(instance=invoice)
     
-    return render(request, 'invoice_management/invoice_form.html', {
+    return TemplateResponse(request, 'invoice_management/invoice_form.html', {
         'form': form,
         'title': '請求書編集',
         'invoice': invoice
@@ -399,58 +554,97 @@ def invoice_detail(request, pk):
     })
 
 
+def report_period_param(request, name, default, minimum, maximum):
+    """レポートの年・月のGETパラメータ（省略時は default）
+
+    数値でない値・範囲外の値は period_bounds で日付にできないため 404 にする。
+    """
+    value = request.GET.get(name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise Http404(f'{name} は数値で指定してください。')
+    if not minimum <= value <= maximum:
+        raise Http404(f'{name} は{minimum}〜{maximum}の範囲で指定してください。')
+    return value
+
+
+def report_year(request):
+    """レポートの年（省略時は今年）"""
+    # 期間の終了日に翌年の1月1日を使うため、最大の年は除く
+    return report_period_param(request, 'year', datetime.now().year, MINYEAR, MAXYEAR - 1)
+
+
+def report_month(request, default=None):
+    """レポートの月（省略時は default）"""
+    return report_period_param(request, 'month', default, 1, 12)
+
+
+def report_slices(request):
+    """レポートの検証子に使うデータバージョン（条件付きGET用）
+
+    レポートは月次集計（InvoiceMonthlyRollup）から作るため、請求書が変わらなくても
+    集計の再構築・修復（rebuild_rollups）で内容が変わる。どちらも DataVersion.REPORTS を進める。
+    取引先会社は表全体を集計しないよう DataVersion.COMPANIES で検証する。
+    """
+    return [DataVersion.REPORTS, DataVersion.COMPANIES]
+
+
+def yearly_report_slices(request):
+    """年単位のレポートに表示する範囲（条件付きGET用）"""
+    # 年・月はここで検証し、範囲外なら集計する前に 404 にする
+    report_year(request)
+    return report_slices(request)
+
+
+# 詳細レポートに表示する請求書の件数（全件は請求書一覧で表示する）
+REPORT_INVOICE_LIMIT = 100
+
+
+def invoice_list_url(year, month=None, company=None):
+    """レポートの期間（と会社）で絞り込んだ請求書一覧のURL"""
+    start, end = period_bounds(year, month)
+    params = {'date_from': start, 'date_to': end - timedelta(days=1)}
+    if company:
+        params['company'] = company
+    return reverse('invoice_list') + '?' + urlencode(params)
+
+
 @login_required
+@use_reports_database
+@conditional_page(yearly_report_slices)
 def monthly_report(request):
     """月別請求金額レポート"""
     # 年の選択（デフォルトは今年）
     current_year = datetime.now().year
-    selected_year = int(request.GET.get('year', current_year))
+    selected_year = report_year(request)
     
     # 税込・税抜の選択（デフォルトは税込）
-    tax_mode = request.GET.get('tax_mode', 'including')  # 'including' or 'excluding'
-    
-    # 取引先会社を取得
-    companies = Company.objects.all().order_by('name')
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))  # 'including' or 'excluding'
     
-    # 選択した年の請求書データを取得
-    invoices = Invoice.objects.filter(
-        invoice_date__year=selected_year
-    ).select_related('company')
+    # 会社×月の集計をデータベース側で行う（取引のある会社のみ）
+    matrix = cached_report(
+        'monthly_report', {'year': selected_year},
+        lambda: company_month_matrix(selected_year),
+    )
     
     # 月別データを整理
     monthly_data = {}
-    monthly_totals = {}
+    monthly_totals = {month: 0 for month in range(1, 13)}
     company_totals = {}
     
-    # 月別合計を初期化
-    for month in range(1, 13):
-        monthly_totals[month] = 0
-    
-    # 各会社の月別データを初期化
-    for company in companies:
-        monthly_data[company.id] = {
-            'company': company,
-            'months': {}
-        }
-        company_totals[company.id] = 0
-        for month in range(1, 13):
-            monthly_data[company.id]['months'][month] = 0
-    
-    # 請求書データを月別に集計
-    for invoice in invoices:
-        company_id = invoice.company.id
-        month = invoice.invoice_date.month
-        
+    for company_id, entry in matrix.items():
         # 税込・税抜の選択に応じて金額を設定
-        if tax_mode == 'excluding':
-            amount = int(invoice.amount)  # 税抜金額
-        else:
-            amount = int(invoice.total_amount)  # 税込金額（デフォルト）
-        
-        if company_id in monthly_data:
-            monthly_data[company_id]['months'][month] += amount
+        months = entry[tax_mode]
+        monthly_data[company_id] = {
+            'company': entry['company'],
+            'months': months,
+        }
+        company_totals[company_id] = sum(months.values())
+        for month, amount in months.items():
             monthly_totals[month] += amount
-            company_totals[company_id] += amount
     
     # 月名リストを作成
     month_names = [calendar.month_name[i] for i in range(1, 13)]
@@ -462,20 +656,16 @@ def monthly_report(request):
     grand_total = sum(company_totals.values())
     
     # 合計金額順にソートしたmonthly_dataを作成
+    # 同額の場合は会社名順
     sorted_monthly_data = dict(sorted(
         monthly_data.items(),
-        key=lambda x: company_totals[x[0]],
-        reverse=True
+        key=lambda x: (-company_totals[x[0]], x[1]['company']['name'])
     ))
     
     # 最高取引先を計算
     top_company = None
-    if company_totals:
-        max_amount = max(company_totals.values())
-        for company_id, total in company_totals.items():
-            if total == max_amount:
-                top_company = monthly_data[company_id]['company']
-                break
+    if sorted_monthly_data:
+        top_company = next(iter(sorted_monthly_data.values()))['company']
     
     context = {
         'selected_year': selected_year,
@@ -495,110 +685,45 @@ def monthly_report(request):
 
 
 @login_required
+@use_reports_database
+@conditional_page(yearly_report_slices)
 def analytics_report(request):
     """分析レポート"""
     # 年の選択（デフォルトは今年）
     current_year = datetime.now().year
-    selected_year = int(request.GET.get('year', current_year))
+    selected_year = report_year(request)
     
     # 税込・税抜の選択（デフォルトは税込）
-    tax_mode = request.GET.get('tax_mode', 'including')  # 'including' or 'excluding'
-    
-    # 年間データを取得
-    invoices = Invoice.objects.filter(
-        invoice_date__year=selected_year
-    ).select_related('company')
-    
-    # 月別合計データ
-    monthly_chart_data = []
-    monthly_totals = {}
-    for month in range(1, 13):
-        monthly_totals[month] = 0
-    
-    for invoice in invoices:
-        month = invoice.invoice_date.month
-        # 税込・税抜の選択に応じて金額を設定
-        if tax_mode == 'excluding':
-            amount = int(invoice.amount)  # 税抜金額
-        else:
-            amount = int(invoice.total_amount)  # 税込金額（デフォルト）
-        monthly_totals[month] += amount
-    
-    # Chart.js用の月別データ
-    for month in range(1, 13):
-        monthly_chart_data.append({
-            'month': f'{month}月',
-            'amount': monthly_totals[month]
-        })
-    
-    # 会社別年間合計（トップ10）
-    company_yearly_totals = {}
-    for invoice in invoices:
-        company_id = invoice.company.id
-        company_name = invoice.company.name
-        # 税込・税抜の選択に応じて金額を設定
-        if tax_mode == 'excluding':
-            amount = int(invoice.amount)  # 税抜金額
-        else:
-            amount = int(invoice.total_amount)  # 税込金額（デフォルト）
-        
-        if company_id not in company_yearly_totals:
-            company_yearly_totals[company_id] = {
-                'name': company_name,
-                'total': 0
-            }
-        company_yearly_totals[company_id]['total'] += amount
-    
-    # トップ10会社を取得
-    top_companies = sorted(
-        company_yearly_totals.values(),
-        key=lambda x: x['total'],
-        reverse=True
-    )[:10]
-    
-    # 支払状況別統計
-    status_stats = {
-        'pending': invoices.filter(payment_status='pending').count(),
-        'paid': invoices.filter(payment_status='paid').count(),
-        'overdue': invoices.filter(payment_status='overdue').count(),
-    }
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))  # 'including' or 'excluding'
     
-    # 会社別円グラフ用データ（トップ10会社）
-    company_chart_data = []
-    other_total = 0
-    for i, company in enumerate(top_companies):
-        if i < 10:  # トップ10まで
-            company_chart_data.append({
-                'name': company['name'],
-                'value': company['total']
-            })
-        else:
-            other_total += company['total']
+    # 年間データをデータベース側で集計
+    analytics = cached_report(
+        'analytics_report', {'year': selected_year, 'tax_mode': tax_mode},
+        lambda: yearly_analytics(selected_year, tax_mode),
+    )
+    context = analytics_context(selected_year, tax_mode, analytics)
     
-    # その他の会社がある場合は追加
-    if other_total > 0:
-        company_chart_data.append({
-            'name': 'その他',
-            'value': other_total
-        })
+    return render(request, 'invoice_management/analytics_report.html', context)
+
+
+def analytics_context(selected_year, tax_mode, analytics):
+    top_companies = analytics['top_companies']
     
     # 統計情報
-    total_invoices = invoices.count()
-    if tax_mode == 'excluding':
-        total_amount = sum(int(invoice.amount) for invoice in invoices)
-    else:
-        total_amount = sum(int(invoice.total_amount) for invoice in invoices)
-    avg_amount = total_amount / total_invoices if total_invoices > 0 else 0
+    status_stats = analytics['status_stats']
+    total_invoices = analytics['total_invoices']
+    total_amount = analytics['total_amount']
+    avg_amount = analytics['avg_amount']
     
     # 年のリストを作成
+    current_year = datetime.now().year
     year_range = range(current_year - 5, current_year + 3)
     
-    context = {
+    return {
         'selected_year': selected_year,
         'year_range': year_range,
-        'monthly_chart_data': monthly_chart_data,
         'top_companies': top_companies,
-        'company_chart_data': company_chart_data,
+        'chart_data_url': chart_data_url(year=selected_year),
         'status_stats': status_stats,
         'total_invoices': total_invoices,
         'total_amount': total_amount,
@@ -606,122 +731,104 @@ def analytics_report(request):
         'tax_mode': tax_mode,
         'tax_mode_display': '税抜' if tax_mode == 'excluding' else '税込',
     }
-    
-    return render(request, 'invoice_management/analytics_report.html', context)
+
+
+def monthly_detail_slices(request):
+    """月別詳細レポートに表示する範囲（条件付きGET用）"""
+    report_year(request)
+    report_month(request)
+    return report_slices(request)
 
 
 @login_required
+@use_reports_database
+@conditional_page(monthly_detail_slices)
 def monthly_detail_report(request):
     """月別詳細レポート"""
     # 年月の選択（デフォルトは今月）
     current_date = datetime.now()
-    selected_year = int(request.GET.get('year', current_date.year))
-    selected_month = int(request.GET.get('month', current_date.month))
+    selected_year = report_year(request)
+    selected_month = report_month(request, current_date.month)
     
     # 税込・税抜の選択（デフォルトは税込）
-    tax_mode = request.GET.get('tax_mode', 'including')  # 'including' or 'excluding'
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))  # 'including' or 'excluding'
     
-    # 選択した年月の請求書データを取得
-    invoices = Invoice.objects.filter(
-        invoice_date__year=selected_year,
-        invoice_date__month=selected_month
-    ).select_related('company', 'registered_by').order_by('-total_amount')
+    # 選択した年月の請求書データを取得（金額の大きい順に上位のみ。全件は請求書一覧で表示）
+    invoices = monthly_detail_invoices(selected_year, selected_month)
     
-    # 統計情報
-    total_invoices = invoices.count()
-    if tax_mode == 'excluding':
-        total_amount = sum(int(invoice.amount) for invoice in invoices)
-    else:
-        total_amount = sum(int(invoice.total_amount) for invoice in invoices)
+    # 統計情報（月次集計テーブルから取得）
+    stats = cached_report(
+        'monthly_detail_report',
+        {'year': selected_year, 'month': selected_month},
+        lambda: monthly_detail_stats(selected_year, selected_month),
+    )
+    context = monthly_detail_context(selected_year, selected_month, tax_mode, invoices, stats)
+    
+    return render(request, 'invoice_management/monthly_detail_report.html', context)
+
+
+def monthly_detail_invoices(year, month):
+    """月別詳細レポートに表示する請求書（金額の大きい順に上位 REPORT_INVOICE_LIMIT 件）"""
+    return period_invoices(
+        year, month
+    ).select_related('company', 'registered_by').order_by('-total_amount')[:REPORT_INVOICE_LIMIT]
+
+
+def monthly_detail_context(selected_year, selected_month, tax_mode, invoices, stats):
+    summary = stats['summary']
+    total_invoices = summary['count']
+    total_amount = summary[tax_mode]
     avg_amount = total_amount / total_invoices if total_invoices > 0 else 0
     
     # 支払状況別統計
-    status_stats = {
-        'pending': invoices.filter(payment_status='pending').count(),
-        'paid': invoices.filter(payment_status='paid').count(),
-        'overdue': invoices.filter(payment_status='overdue').count(),
-    }
-    
-    # 会社別集計
-    company_totals = {}
-    for invoice in invoices:
-        company_id = invoice.company.id
-        company_name = invoice.company.name
-        # 税込・税抜の選択に応じて金額を設定
-        if tax_mode == 'excluding':
-            amount = int(invoice.amount)  # 税抜金額
-        else:
-            amount = int(invoice.total_amount)  # 税込金額（デフォルト）
-        
-        if company_id not in company_totals:
-            company_totals[company_id] = {
-                'name': company_name,
-                'total': 0,
-                'count': 0
-            }
-        company_totals[company_id]['total'] += amount
-        company_totals[company_id]['count'] += 1
-    
-    # 会社別を金額順にソート
-    sorted_companies = sorted(
-        company_totals.values(),
-        key=lambda x: x['total'],
-        reverse=True
-    )
-    
-    # 会社別円グラフ用データ（トップ10会社）
-    company_chart_data = []
-    other_total = 0
-    for i, company in enumerate(sorted_companies):
-        if i < 10:  # トップ10まで
-            company_chart_data.append({
-                'name': company['name'],
-                'value': company['total']
-            })
-        else:
-            other_total += company['total']
+    status_stats = summary['status_stats']
     
-    # その他の会社がある場合は追加
-    if other_total > 0:
-        company_chart_data.append({
-            'name': 'その他',
-            'value': other_total
-        })
+    # 会社別集計（金額順）
+    sorted_companies = [
+        dict(company, total=company[tax_mode])
+        for company in rank_companies(stats['companies'], tax_mode)
+    ]
     
     # 年月のリストを作成
-    year_range = range(current_date.year - 5, current_date.year + 3)
+    current_year = datetime.now().year
+    year_range = range(current_year - 5, current_year + 3)
     month_range = range(1, 13)
     
-    context = {
+    return {
         'selected_year': selected_year,
         'selected_month': selected_month,
         'year_range': year_range,
         'month_range': month_range,
         'invoices': invoices,
+        'invoice_list_url': invoice_list_url(selected_year, selected_month),
         'total_invoices': total_invoices,
         'total_amount': total_amount,
         'avg_amount': avg_amount,
         'status_stats': status_stats,
         'sorted_companies': sorted_companies,
-        'company_chart_data': company_chart_data,
+        'chart_data_url': chart_data_url(year=selected_year, month=selected_month),
         'tax_mode': tax_mode,
         'tax_mode_display': '税抜' if tax_mode == 'excluding' else '税込',
     }
-    
-    return render(request, 'invoice_management/monthly_detail_report.html', context)
+
+
+def company_detail_slices(request):
+    """会社別詳細レポートに表示する範囲（条件付きGET用）"""
+    report_year(request)
+    return report_slices(request)
 
 
 @login_required
+@use_reports_database
+@conditional_page(company_detail_slices)
 def company_detail_report(request):
     """会社別詳細レポート"""
     # 会社の選択
     company_id = request.GET.get('company')
-    selected_year = int(request.GET.get('year', datetime.now().year))
+    selected_year = report_year(request)
     
     # 税込・税抜の選択（デフォルトは税込）
-    tax_mode = request.GET.get('tax_mode', 'including')  # 'including' or 'excluding'
-    
-    companies = Company.objects.all().order_by('-created_at', 'name')
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))  # 'including' or 'excluding'
     
     if company_id:
         company = get_object_or_404(Company, pk=company_id)
@@ -730,93 +837,227 @@ def company_detail_report(request):
     
     if company:
         
-        # 選択した会社の請求書データを取得
-        invoices = Invoice.objects.filter(
-            company=company,
-            invoice_date__year=selected_year
-        ).select_related('registered_by').order_by('-invoice_date')
+        # 選択した会社の請求書データを取得（新しい順に上位のみ。全件は請求書一覧で表示）
+        invoices = company_detail_invoices(selected_year, company)
         
-        # 月別データ
+        # 月別データ・統計情報（月次集計テーブルから取得）
+        stats = cached_report(
+            'company_detail_report', {'year': selected_year, 'company': company.pk},
+            lambda: company_yearly_stats(selected_year, company.pk),
+        )
+    else:
+        invoices = Invoice.objects.none()
+        stats = None
+    context = company_detail_context(selected_year, tax_mode, company, invoices, stats)
+    
+    return render(request, 'invoice_management/company_detail_report.html', context)
+
+
+def company_detail_invoices(year, company):
+    """会社別詳細レポートに表示する請求書（新しい順に上位 REPORT_INVOICE_LIMIT 件）"""
+    return period_invoices(year).filter(
+        company=company
+    ).select_related('registered_by').order_by('-invoice_date')[:REPORT_INVOICE_LIMIT]
+
+
+def company_detail_context(selected_year, tax_mode, company, invoices, stats):
+    if company:
         monthly_data = {}
-        for month in range(1, 13):
+        for month, data in stats['monthly'].items():
+            # 税込・税抜の選択に応じて金額を設定
             monthly_data[month] = {
-                'total': 0,
-                'count': 0,
-                'invoices': []
+                'total': data[tax_mode],
+                'count': data['count'],
             }
         
-        for invoice in invoices:
-            month = invoice.invoice_date.month
-            # 税込・税抜の選択に応じて金額を設定
-            if tax_mode == 'excluding':
-                amount = int(invoice.amount)  # 税抜金額
-            else:
-                amount = int(invoice.total_amount)  # 税込金額（デフォルト）
-            monthly_data[month]['total'] += amount
-            monthly_data[month]['count'] += 1
-            monthly_data[month]['invoices'].append(invoice)
-        
-        # 統計情報
-        total_invoices = invoices.count()
-        if tax_mode == 'excluding':
-            total_amount = sum(int(invoice.amount) for invoice in invoices)
-        else:
-            total_amount = sum(int(invoice.total_amount) for invoice in invoices)
+        summary = stats['summary']
+        total_invoices = summary['count']
+        total_amount = summary[tax_mode]
         avg_amount = total_amount / total_invoices if total_invoices > 0 else 0
         
         # 支払状況別統計
-        status_stats = {
-            'pending': invoices.filter(payment_status='pending').count(),
-            'paid': invoices.filter(payment_status='paid').count(),
-            'overdue': invoices.filter(payment_status='overdue').count(),
-        }
+        status_stats = summary['status_stats']
         
-        # Chart.js用の月別データ
-        monthly_chart_data = []
-        for month in range(1, 13):
-            monthly_chart_data.append({
-                'month': f'{month}月',
-                'amount': monthly_data[month]['total']
-            })
         
-        # 月別支払い円グラフ用データ（金額がある月のみ）
-        monthly_pie_data = []
-        for month in range(1, 13):
-            if monthly_data[month]['total'] > 0:
-                monthly_pie_data.append({
-                    'month': f'{month}月',
-                    'amount': monthly_data[month]['total']
-                })
+        # グラフ用データはJSONで別に取得する
+        chart_url = chart_data_url(year=selected_year, company=company.pk)
     else:
-        company = None
-        invoices = Invoice.objects.none()
         monthly_data = {}
         total_invoices = 0
         total_amount = 0
         avg_amount = 0
         status_stats = {'pending': 0, 'paid': 0, 'overdue': 0}
-        monthly_chart_data = []
-        monthly_pie_data = []
+        chart_url = None
     
     # 年のリストを作成
     year_range = range(datetime.now().year - 5, datetime.now().year + 3)
     
-    context = {
-        'companies': companies,
+    return {
         'selected_company': company,
         'selected_year': selected_year,
         'year_range': year_range,
         'invoices': invoices,
+        'invoice_list_url': invoice_list_url(selected_year, company=company.pk) if company else None,
         'monthly_data': monthly_data,
         'total_invoices': total_invoices,
         'total_amount': total_amount,
         'avg_amount': avg_amount,
         'status_stats': status_stats,
-        'monthly_chart_data': monthly_chart_data,
-        'monthly_pie_data': monthly_pie_data,
+        'chart_data_url': chart_url,
         'months': range(1, 13),
         'tax_mode': tax_mode,
         'tax_mode_display': '税抜' if tax_mode == 'excluding' else '税込',
     }
+
+
+def chart_data_url(**params):
+    """グラフ用データ（report_chart_data）のURL"""
+    return reverse('report_chart_data') + '?' + urlencode(params)
+
+
+def chart_data_params(request):
+    """グラフ用データの (年, 月, 会社ID)。月・会社は省略時 None"""
+    selected_year = report_year(request)
+    selected_month = report_month(request) if request.GET.get('month') else None
+    company = request.GET.get('company')
+    return selected_year, selected_month, int(company) if company else None
+
+
+def chart_data_slices(request):
+    """グラフ用データの範囲（条件付きGET用）"""
+    chart_data_params(request)
+    return report_slices(request)
+
+
+@login_required
+@use_reports_database
+@conditional_page(chart_data_slices)
+def report_chart_data(request):
+    """レポートのグラフ用データ（JSON）
+
+    税込・税抜の両方を返し、画面側で切り替える。
+    year は必須ではなく省略時は今年、month・company は省略可。
+    """
+    selected_year, selected_month, company_id = chart_data_params(request)
+    
+    data = cached_report(
+        'chart_data',
+        {'year': selected_year, 'month': selected_month, 'company': company_id},
+        lambda: chart_data(selected_year, selected_month, company_id),
+    )
+    return JsonResponse(data)
+
+
+# 集計ジョブ一覧に表示する件数
+REPORT_JOB_LIST_LIMIT = 50
+
+
+@login_required
+@retry_write_view
+def report_job_submit(request):
+    """レポートジョブの登録（レポート画面のフォームから送信する）"""
+    if request.method != 'POST':
+        return redirect('report_job_list')
+    
+    form = ReportJobForm(request.POST)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        return redirect('report_job_list')
+    
+    job = ReportJob.submit(form.cleaned_data['kind'], form.job_params(), request.user)
+    if job.requested_by_id != request.user.pk or job.status == 'done':
+        messages.info(request, '同じ内容の集計ジョブがあるため、その結果を表示します。')
+    else:
+        messages.success(request, '集計ジョブを登録しました。完了するとこの画面に結果が表示されます。')
+    return redirect('report_job_detail', pk=job.pk)
+
+
+@login_required
+def report_job_list(request):
+    """集計ジョブ一覧"""
+    jobs = (
+        ReportJob.objects.defer('result').select_related('requested_by')
+        .order_by('-id')[:REPORT_JOB_LIST_LIMIT]
+    )
+    return render(request, 'invoice_management/report_job_list.html', {
+        'jobs': jobs,
+        'current_year': datetime.now().year,
+    })
+
+
+@login_required
+def report_job_detail(request, pk):
+    """集計ジョブの進捗・結果（完了したジョブは保存した結果から表示する）"""
+    job = get_object_or_404(ReportJob.objects.select_related('requested_by'), pk=pk)
     
-    return render(request, 'invoice_management/company_detail_report.html', context)
+    # 税込・税抜の選択（デフォルトは税込）
+    tax_mode = normalize_tax_mode(request.GET.get('tax_mode', 'including'))
+    
+    context = {
+        'job': job,
+        'tax_mode': tax_mode,
+        'tax_mode_display': '税抜' if tax_mode == 'excluding' else '税込',
+    }
+    if job.status == 'done':
+        data = job.result_data()
+        if job.kind == 'company_month_matrix':
+            company_rows, year_totals = company_year_table(data, tax_mode)
+            context.update({
+                'years': data['years'],
+                'company_rows': company_rows,
+                'year_totals': year_totals,
+                'grand_total': sum(year_totals.values()),
+            })
+        else:
+            context['yearly_rows'] = data['years']
+    
+    return render(request, 'invoice_management/report_job_detail.html', context)
+
+
+@login_required
+def report_job_progress(request, pk):
+    """集計ジョブの進捗（JSON、詳細画面が定期的に取得する）"""
+    job = get_object_or_404(ReportJob.objects.only('status', 'progress', 'message'), pk=pk)
+    return JsonResponse({
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'finished': job.is_finished,
+    })
+
+
+@login_required
+def accepts_gzip(request):
+    """Accept-Encoding で gzip を受け付けるか（「gzip;q=0」は受け付けない。「*」は gzip を含む）"""
+    qualities = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, *params = item.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition('=')
+            if name.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+def report_job_download(request, pk):
+    """集計ジョブの結果（JSON）のダウンロード（依頼したユーザーだけ）
+
+    保存しているgzip圧縮のまま返し、gzipを受け付けないクライアントにだけ展開して返す。
+    """
+    job = get_object_or_404(ReportJob, pk=pk, status='done', requested_by=request.user)
+    if accepts_gzip(request):
+        response = HttpResponse(bytes(job.result), content_type='application/json')
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = HttpResponse(gzip.decompress(job.result), content_type='application/json')
+    patch_vary_headers(response, ('Accept-Encoding',))
+    response['Content-Disposition'] = f'attachment; filename="report_job_{job.pk}_{job.kind}.json"'
+    return response
@@ -49,13 +49,16 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # SQL件数・時間と描画時間の計測（Server-Timingヘッダー、遅いリクエストのログ）
+    'invoice_management.middleware.PerformanceMiddleware',
 ]
 
 ROOT_URLCONF = 'myproject.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # 描画時間を計測できるDjangoTemplates（PerformanceMiddleware用）
+        'BACKEND': 'invoice_management.template_backends.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -78,9 +81,63 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # 接続を使い回す（接続ごとのPRAGMA設定を毎回行わない）
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # 書き込みのトランザクションは最初に書き込みロックを取る（invoice_management.sqlite）
+            'transaction_mode': 'IMMEDIATE',
+        },
+    },
+    # レポート画面・CSV出力の読み込み用（invoice_management.routers）。
+    # 同じファイルを読み取り専用で開く。snapshot_reports_db で作るコピーを指定してもよい
+    'reports': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"file:{BASE_DIR / 'db.sqlite3'}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'uri': True,
+        },
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ['invoice_management.routers.ReportsRouter']
+
+# reports がコピーの場合の許容遅延（秒）。これより古いコピーは使わず default から読む
+REPORTS_DATABASE_MAX_LAG = 300
+
+# SQLiteのPRAGMA・ロック競合時の再実行（invoice_management.sqlite、いずれも省略可）
+# 本番ではWALにする（データベースファイルの設定が変わり、-wal / -shm ファイルが作られる）:
+# SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'busy_timeout': 5000, ...}
+SQLITE_LOCK_RETRIES = 3
+
+
+# Cache
+# レポート集計結果のキャッシュ（invoice_management.cache）。
+# キーにデータバージョンを含めるため、プロセスごとのキャッシュでも古い結果は返らない。
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'invoice-management',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
     }
 }
 
+REPORT_CACHE_TIMEOUT = 60 * 60
+# ユーザー一覧の件数のキャッシュ（User の update() ではデータバージョンが進まないため短くする）
+USER_COUNT_CACHE_TIMEOUT = 5 * 60
+
+# 複数年のレポート集計ジョブ（invoice_management.jobs、run_report_worker で実行する）
+REPORT_JOB_MAX_YEARS = 20
+REPORT_JOB_RETENTION_DAYS = 7
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +180,31 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# 性能計測（invoice_management.middleware.PerformanceMiddleware）
+PERFORMANCE_SLOW_REQUEST_MS = 500
+PERFORMANCE_SERVER_TIMING = True
+
+# 取引先会社の一覧キャッシュ（invoice_management.companies.company_directory）が
+# 他のプロセスでの更新を確認する間隔（秒）
+COMPANY_DIRECTORY_RECHECK_SECONDS = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'invoice_management.performance': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 # ログイン・ログアウト設定
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/main/'